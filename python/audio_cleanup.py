@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Audio Cleanup
+Локальное улучшение звука без сетевых вызовов: шумоподавление спектральным гейтом,
+нормализация громкости по EBU R128 и пиковый лимитер.
+
+Аудио обрабатывается блоками, состояние фильтров и STFT переносится между блоками,
+поэтому расход памяти не зависит от длины записи.
+"""
+
+import os
+import wave
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, Iterator, Optional, List
+
+import numpy as np
+from scipy import signal
+from scipy.ndimage import minimum_filter1d, uniform_filter1d
+
+DEFAULT_BLOCK_SECONDS = 1.0
+DEFAULT_TARGET_LUFS = -14.0
+DEFAULT_CEILING_DB = -1.0
+DEFAULT_REDUCTION_DB = 12.0
+
+N_FFT = 2048
+HOP = N_FFT // 4
+# Превышение над профилем шума, при котором полоса считается полезным сигналом
+GATE_THRESHOLD_DB = 6.0
+# Процентиль мощности внутри блока и между блоками для оценки стационарного шума
+NOISE_PERCENTILE = 20
+MASK_FREQ_SMOOTHING = 5
+MASK_TIME_SMOOTHING = 0.6
+
+# EBU R128 / ITU-R BS.1770
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+MAX_GAIN_DB = 20.0
+
+LIMITER_ATTACK_SECONDS = 0.005
+LIMITER_HOLD_SECONDS = 0.010
+
+
+def _read_blocks(path: Path, block_frames: int) -> Iterator[np.ndarray]:
+    """Чтение PCM16 WAV блоками (кадры × каналы, float32 в диапазоне [-1, 1])"""
+    with wave.open(str(path), "rb") as src:
+        channels = src.getnchannels()
+        while True:
+            data = src.readframes(block_frames)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype="<i2").reshape(-1, channels).astype(np.float32) / 32768.0
+
+
+def _read_float_blocks(path: Path, channels: int, block_frames: int) -> Iterator[np.ndarray]:
+    """Чтение промежуточного файла float32 блоками"""
+    with open(path, "rb") as f:
+        while True:
+            block = np.fromfile(f, dtype=np.float32, count=block_frames * channels)
+            if block.size == 0:
+                break
+            yield block.reshape(-1, channels)
+
+
+def _write_pcm16(dst: wave.Wave_write, block: np.ndarray):
+    """Запись блока в PCM16 WAV; пустые блоки пропускаются"""
+    if len(block):
+        dst.writeframes(_to_pcm16(block))
+
+
+def _to_pcm16(block: np.ndarray) -> bytes:
+    return (np.clip(block, -1.0, 32767 / 32768) * 32768.0).astype("<i2").tobytes()
+
+
+def _frames(data: np.ndarray) -> np.ndarray:
+    """Окна STFT с шагом HOP: (окна, каналы, N_FFT)"""
+    return np.lib.stride_tricks.sliding_window_view(data, N_FFT, axis=0)[::HOP]
+
+
+class _SpectralGate:
+    """
+    Потоковое шумоподавление спектральным гейтом
+
+    Полосы STFT, мощность которых не превышает профиль шума на GATE_THRESHOLD_DB,
+    ослабляются на reduction_db; маска сглаживается по частоте и во времени.
+    Синтез — overlap-add с окном Ханна, задержка компенсируется в flush.
+    """
+
+    def __init__(self, noise_power: np.ndarray, reduction_db: float):
+        self.channels = noise_power.shape[0]
+        self.threshold = noise_power * 10 ** (GATE_THRESHOLD_DB / 10)
+        self.floor = 10 ** (-reduction_db / 20)
+        self.window = signal.get_window("hann", N_FFT).astype(np.float32)
+        # Нормировка overlap-add: сумма квадратов окна на один шаг
+        self.norm = float(np.sum(self.window ** 2) / HOP)
+
+        self._input = np.zeros((N_FFT - HOP, self.channels), dtype=np.float32)
+        self._overlap = np.zeros((N_FFT - HOP, self.channels), dtype=np.float32)
+        self._last_mask = np.ones((1,) + self.threshold.shape)
+        self._to_skip = N_FFT - HOP
+        self._received = 0
+        self._emitted = 0
+
+    def stream(self, blocks: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+        """Обработка последовательности блоков с выдачей остатка в конце"""
+        for block in blocks:
+            yield self.process(block)
+        yield self.flush()
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        self._received += len(block)
+        data = np.concatenate([self._input, block])
+        n_frames = (len(data) - N_FFT) // HOP + 1
+        if n_frames <= 0:
+            self._input = data
+            return np.zeros((0, self.channels), dtype=np.float32)
+
+        spectrum = np.fft.rfft(_frames(data)[:n_frames] * self.window, axis=-1)
+        spectrum *= self._mask(np.abs(spectrum) ** 2)
+        frames = np.fft.irfft(spectrum, n=N_FFT, axis=-1).astype(np.float32) * self.window / self.norm
+        self._input = data[n_frames * HOP:]
+
+        # Overlap-add: окно из 4 шагов добавляется к 4 соседним шагам выхода
+        chunks = frames.transpose(0, 2, 1).reshape(n_frames, N_FFT // HOP, HOP, self.channels)
+        output = np.zeros((n_frames + N_FFT // HOP - 1, HOP, self.channels), dtype=np.float32)
+        for j in range(N_FFT // HOP):
+            output[j:j + n_frames] += chunks[:, j]
+        output = output.reshape(-1, self.channels)
+        output[:len(self._overlap)] += self._overlap
+
+        ready, self._overlap = output[:n_frames * HOP], output[n_frames * HOP:]
+        return self._emit(ready)
+
+    def flush(self) -> np.ndarray:
+        """Остаток сигнала: дополняем тишиной, пока не выйдут все входные отсчеты"""
+        tail = self.process(np.zeros((N_FFT, self.channels), dtype=np.float32))
+        self._received -= N_FFT
+        return tail[:max(0, self._received - self._emitted + len(tail))]
+
+    def _emit(self, ready: np.ndarray) -> np.ndarray:
+        """Отбрасывание начальной задержки STFT"""
+        if self._to_skip:
+            skipped = min(self._to_skip, len(ready))
+            ready = ready[skipped:]
+            self._to_skip -= skipped
+        self._emitted += len(ready)
+        return ready
+
+    def _mask(self, power: np.ndarray) -> np.ndarray:
+        """Маска гейта (окна, каналы, полосы) со сглаживанием; состояние сглаживания переносится"""
+        mask = np.where(power > self.threshold, 1.0, self.floor)
+        mask = uniform_filter1d(mask, MASK_FREQ_SMOOTHING, axis=-1)
+        # Однополюсный фильтр по времени: y[n] = (1 - a) x[n] + a y[n - 1]
+        a = MASK_TIME_SMOOTHING
+        mask, _ = signal.lfilter([1 - a], [1, -a], mask, axis=0, zi=self._last_mask * a)
+        self._last_mask = mask[-1:]
+        return mask
+
+
+def _estimate_noise(path: Path, channels: int, block_frames: int) -> np.ndarray:
+    """
+    Профиль стационарного шума (каналы × полосы)
+
+    В каждом блоке усредняется спектр самых тихих окон (нижний процентиль энергии),
+    по блокам берется снова нижний процентиль: паузы речи задают уровень шума.
+    """
+    window = signal.get_window("hann", N_FFT).astype(np.float32)
+    block_profiles: List[np.ndarray] = []
+    for block in _read_blocks(path, block_frames):
+        if len(block) < N_FFT:
+            continue
+        power = np.abs(np.fft.rfft(_frames(block) * window, axis=-1)) ** 2
+        energy = power.sum(axis=-1, keepdims=True)
+        quiet = energy <= np.percentile(energy, NOISE_PERCENTILE, axis=0, keepdims=True)
+        block_profiles.append((power * quiet).sum(axis=0) / quiet.sum(axis=0))
+
+    if not block_profiles:
+        return np.zeros((channels, N_FFT // 2 + 1))
+    return np.percentile(np.stack(block_profiles), NOISE_PERCENTILE, axis=0)
+
+
+def _k_weighting_sos(rate: int) -> np.ndarray:
+    """K-взвешивание BS.1770 для произвольной частоты дискретизации: полка и ФВЧ"""
+    # Высокочастотная полка (+4 дБ)
+    gain_db, q, fc = 3.999843853973347, 0.7071752369554196, 1681.974450955533
+    k = np.tan(np.pi * fc / rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    # ФВЧ ~38 Гц
+    q, fc = 0.5003270373238773, 38.13547087602444
+    k = np.tan(np.pi * fc / rate)
+    a0 = 1 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    return np.array([shelf, highpass])
+
+
+class _LoudnessMeter:
+    """Интегральная громкость EBU R128 (LUFS) с потоковым K-фильтром"""
+
+    def __init__(self, rate: int, channels: int):
+        self.sos = _k_weighting_sos(rate)
+        self.step = rate // 10
+        self._zi = np.zeros((self.sos.shape[0], 2, channels))
+        self._pending = np.zeros((0, channels))
+        # Средний квадрат каждого шага 100 мс, сумма по каналам
+        self._steps: List[float] = []
+
+    def add(self, block: np.ndarray):
+        # Пустой блок (конец записи, хвост гейта) sosfilt с состоянием не принимает
+        if not len(block):
+            return
+        weighted, self._zi = signal.sosfilt(self.sos, block, axis=0, zi=self._zi)
+        data = np.concatenate([self._pending, weighted])
+        n_steps = len(data) // self.step
+        if n_steps:
+            squares = data[:n_steps * self.step].reshape(n_steps, self.step, -1) ** 2
+            self._steps.extend(squares.mean(axis=1).sum(axis=1))
+        self._pending = data[n_steps * self.step:]
+
+    def integrated(self) -> float:
+        """Громкость с абсолютным (-70 LUFS) и относительным (-10 LU) гейтом; -inf для тишины"""
+        if len(self._steps) < 4:
+            return float("-inf")
+        steps = np.array(self._steps)
+        # Блоки 400 мс с перекрытием 75% — четыре соседних шага
+        blocks = np.convolve(steps, np.ones(4) / 4, mode="valid")
+        with np.errstate(divide="ignore"):
+            loudness = -0.691 + 10 * np.log10(blocks)
+
+        gated = blocks[loudness > ABSOLUTE_GATE_LUFS]
+        if not gated.size:
+            return float("-inf")
+        relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+        gated = blocks[loudness > max(ABSOLUTE_GATE_LUFS, relative_gate)]
+        return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+class _PeakLimiter:
+    """
+    Пиковый лимитер с упреждением
+
+    Требуемое усиление min(1, потолок/пик) проходит минимум-фильтр (удержание)
+    и скользящее среднее (атака), поэтому снижение начинается до пика и не
+    допускает превышения потолка. Выход задержан на один блок ради упреждения.
+    """
+
+    def __init__(self, rate: int, channels: int, ceiling_db: float):
+        self.ceiling = 10 ** (ceiling_db / 20)
+        self.attack = max(1, int(rate * LIMITER_ATTACK_SECONDS))
+        self.hold = max(self.attack, int(rate * LIMITER_HOLD_SECONDS))
+        self.context = self.hold + self.attack
+        self._history = np.zeros((0, channels), dtype=np.float32)
+        self._pending: Optional[np.ndarray] = None
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        # Пустой блок не заменяет ожидающий: упреждение берется из следующего непустого
+        if not len(block):
+            return block
+        if self._pending is None:
+            self._pending = block
+            return block[:0]
+        output = self._limit(self._pending, block[:self.context])
+        self._history = np.concatenate([self._history, self._pending])[-self.context:]
+        self._pending = block
+        return output
+
+    def flush(self) -> np.ndarray:
+        if self._pending is None:
+            return np.zeros((0, self._history.shape[1]), dtype=np.float32)
+        output = self._limit(self._pending, self._pending[:0])
+        self._pending = None
+        return output
+
+    def _limit(self, block: np.ndarray, lookahead: np.ndarray) -> np.ndarray:
+        data = np.concatenate([self._history, block, lookahead])
+        peak = np.max(np.abs(data), axis=1)
+        with np.errstate(divide="ignore"):
+            gain = np.minimum(1.0, self.ceiling / peak)
+        gain = minimum_filter1d(gain, 2 * self.hold + 1, mode="nearest")
+        gain = uniform_filter1d(gain, self.attack, mode="nearest")
+        start = len(self._history)
+        limited = block * gain[start:start + len(block), None]
+        return np.clip(limited, -self.ceiling, self.ceiling).astype(np.float32)
+
+
+def enhance_wav(input_path: str, output_path: str, target_lufs: Optional[float] = None,
+                ceiling_db: Optional[float] = None, reduction_db: Optional[float] = None,
+                block_seconds: float = DEFAULT_BLOCK_SECONDS, work_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Улучшение PCM16 WAV: шумоподавление, нормализация громкости и лимитер
+
+    Три потоковых прохода: оценка профиля шума, шумоподавление с измерением громкости
+    (промежуточный float32 файл), усиление до целевой громкости с лимитером.
+
+    Args:
+        target_lufs: Целевая интегральная громкость (AUDIO_TARGET_LUFS, по умолчанию -14)
+        ceiling_db: Потолок пиков в dBFS (AUDIO_CEILING_DB, по умолчанию -1)
+        reduction_db: Ослабление шумовых полос в дБ (AUDIO_NOISE_REDUCTION_DB, по умолчанию 12)
+        work_dir: Каталог промежуточного файла — рабочий каталог задачи (scratch_space);
+            по умолчанию каталог output_path
+
+    Returns:
+        Измерения: громкость до нормализации и примененное усиление
+    """
+    if target_lufs is None:
+        target_lufs = float(os.getenv('AUDIO_TARGET_LUFS', DEFAULT_TARGET_LUFS))
+    if ceiling_db is None:
+        ceiling_db = float(os.getenv('AUDIO_CEILING_DB', DEFAULT_CEILING_DB))
+    if reduction_db is None:
+        reduction_db = float(os.getenv('AUDIO_NOISE_REDUCTION_DB', DEFAULT_REDUCTION_DB))
+
+    input_path, output_path = Path(input_path), Path(output_path)
+    with wave.open(str(input_path), "rb") as src:
+        rate, channels, sample_width = src.getframerate(), src.getnchannels(), src.getsampwidth()
+    if sample_width != 2:
+        raise Exception(f"Поддерживается только 16-битный PCM WAV, получено {sample_width * 8} бит")
+    block_frames = max(N_FFT, int(rate * block_seconds))
+
+    gate = _SpectralGate(_estimate_noise(input_path, channels, block_frames), reduction_db)
+    meter = _LoudnessMeter(rate, channels)
+
+    fd, denoised_name = tempfile.mkstemp(prefix=f".{output_path.stem}_", suffix=".f32",
+                                         dir=work_dir or output_path.parent)
+    os.close(fd)
+    denoised_path = Path(denoised_name)
+    try:
+        with open(denoised_path, "wb") as denoised:
+            for output in gate.stream(_read_blocks(input_path, block_frames)):
+                meter.add(output)
+                denoised.write(output.tobytes())
+
+        loudness = meter.integrated()
+        gain_db = min(MAX_GAIN_DB, target_lufs - loudness) if np.isfinite(loudness) else 0.0
+        gain = np.float32(10 ** (gain_db / 20))
+        limiter = _PeakLimiter(rate, channels, ceiling_db)
+
+        with wave.open(str(output_path), "wb") as dst:
+            dst.setnchannels(channels)
+            dst.setsampwidth(2)
+            dst.setframerate(rate)
+            for block in _read_float_blocks(denoised_path, channels, block_frames):
+                _write_pcm16(dst, limiter.process(block * gain))
+            _write_pcm16(dst, limiter.flush())
+    finally:
+        denoised_path.unlink(missing_ok=True)
+
+    return {
+        "input_loudness_lufs": round(loudness, 1) if np.isfinite(loudness) else None,
+        "gain_db": round(gain_db, 1),
+        "target_lufs": target_lufs
+    }
@@ -1,127 +1,71 @@
 #!/usr/bin/env python3
 """
-Audio Enhancement using Resemble.ai
+Audio Enhancement
+Локальная очистка звука (шумоподавление, нормализация громкости, лимитер) или Resemble.ai
 Основано на коде из sound_cleaner.ipynb
 """
 
 import os
 import sys
 import json
-import time
-import requests
-import tempfile
 from pathlib import Path
-from moviepy.editor import VideoFileClip, AudioFileClip
+from typing import Optional
 
-def enhance_audio(video_path: str, generation_id: str):
+# Движки улучшения: local — без сети и оплаты, resemble — облачный, включается явно
+BACKENDS = ("local", "resemble")
+DEFAULT_BACKEND = "local"
+
+
+def select_backend(backend: Optional[str] = None) -> str:
+    """Движок улучшения: аргумент, AUDIO_ENHANCER_BACKEND или local; без ключа Resemble — local"""
+    backend = (backend or os.getenv('AUDIO_ENHANCER_BACKEND') or DEFAULT_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise Exception(f"Неизвестный движок улучшения звука: {backend}, доступны: {', '.join(BACKENDS)}")
+    if backend == "resemble" and not os.getenv('RESEMBLE_AI_KEY'):
+        print("Resemble.ai ключ не найден, используем локальную очистку звука")
+        return "local"
+    return backend
+
+def enhance_audio(video_path: str, generation_id: str, backend: Optional[str] = None):
     """
-    Улучшение звука видео через Resemble.ai
+    Улучшение звука видео: аудио извлекается, очищается выбранным движком
+    и возвращается в контейнер без перекодирования видео
     """
     print(f"Начинаем улучшение звука для: {video_path}")
     
-    # Проверяем наличие API ключа
-    resemble_key = os.getenv('RESEMBLE_AI_KEY')
-    if not resemble_key:
-        print("Resemble.ai ключ не найден, пропускаем улучшение звука")
-        return video_path
+    # Зависимости загружаются только при вызове, чтобы не замедлять запуск CLI
+    from media_tools import probe_media, replace_audio
+    from scratch_space import scratch_space
+    from encode_scheduler import encode_scheduler
     
     try:
-        # Создаем временную директорию
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            audio_path = temp_path / "original.wav"
+        backend = select_backend(backend)
+        
+        # Рабочий каталог задачи (tmpfs, если хватает места): WAV занимают в разы больше видео
+        expected_bytes = Path(video_path).stat().st_size * 4
+        with scratch_space.job(f"audio_{generation_id}", expected_bytes) as temp_path:
             enhanced_path = temp_path / "enhanced.wav"
             
-            print("Извлекаем аудио из видео...")
-            
-            # Извлекаем аудио
-            with VideoFileClip(video_path) as video_clip:
-                if video_clip.audio is None:
-                    print("Видео не содержит аудио дорожки")
-                    return video_path
-                    
-                video_clip.audio.write_audiofile(
-                    str(audio_path), 
-                    logger=None,
-                    verbose=False
-                )
-            
-            print("Отправляем аудио в Resemble.ai...")
-            
-            # Отправляем в Resemble.ai
-            headers = {"Authorization": f"Bearer {resemble_key}"}
-            
-            with open(audio_path, 'rb') as audio_file:
-                files = {
-                    "audio_file": ("audio.wav", audio_file, "audio/wav"),
-                }
-                
-                response = requests.post(
-                    "https://app.resemble.ai/api/v2/audio_enhancements",
-                    headers=headers,
-                    files=files,
-                    timeout=120
-                )
-                response.raise_for_status()
-                
-                job_id = response.json()["uuid"]
-                print(f"Задача создана: {job_id}")
-            
-            # Ожидаем завершения
-            print("Ожидаем завершения обработки...")
-            
-            while True:
-                status_response = requests.get(
-                    f"https://app.resemble.ai/api/v2/audio_enhancements/{job_id}",
-                    headers=headers,
-                    timeout=60
-                )
-                status_response.raise_for_status()
-                
-                status_data = status_response.json()
-                status = status_data.get("status")
-                
-                if status == "completed":
-                    enhanced_url = status_data["enhanced_audio_url"]
-                    print(f"Обработка завершена: {enhanced_url}")
-                    break
-                elif status == "failed":
-                    raise Exception(f"Resemble.ai обработка провалилась: {status_data.get('error_message')}")
-                
-                time.sleep(5)
-            
-            # Скачиваем улучшенное аудио
-            print("Скачиваем улучшенное аудио...")
+            if probe_media(video_path)["audio"] is None:
+                print("Видео не содержит аудио дорожки")
+                return video_path
             
-            enhanced_response = requests.get(enhanced_url, stream=True, timeout=120)
-            enhanced_response.raise_for_status()
-            
-            with open(enhanced_path, 'wb') as f:
-                for chunk in enhanced_response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            if backend == "resemble":
+                _enhance_with_resemble(video_path, temp_path, enhanced_path)
+            else:
+                # Локальная очистка нагружает процессор наравне с кодированием — занимает слот
+                with encode_scheduler.slot(f"audio_{generation_id}"):
+                    _enhance_locally(video_path, temp_path, enhanced_path)
             
             print("Создаем видео с улучшенным звуком...")
             
-            # Создаем новое видео с улучшенным звуком
+            # Видео поток копируется без перекодирования, кодируется только звук
             video_file = Path(video_path)
             enhanced_video_path = video_file.parent / f"{video_file.stem}_enhanced{video_file.suffix}"
-            
-            with VideoFileClip(video_path) as video:
-                enhanced_audio = AudioFileClip(str(enhanced_path))
-                final_video = video.set_audio(enhanced_audio)
-                
-                final_video.write_videofile(
-                    str(enhanced_video_path),
-                    codec="libx264",
-                    audio_codec="aac",
-                    temp_audiofile=str(temp_path / "temp-audio.m4a"),
-                    remove_temp=True,
-                    logger=None,
-                    verbose=False
-                )
-                
-                enhanced_audio.close()
-                final_video.close()
+            work_video_path = temp_path / enhanced_video_path.name
+            with encode_scheduler.slot(f"audio_{generation_id}"):
+                replace_audio(video_path, str(enhanced_path), str(work_video_path))
+            scratch_space.publish(work_video_path, enhanced_video_path)
             
             print(f"Улучшенное видео сохранено: {enhanced_video_path}")
             
@@ -131,22 +75,76 @@ def enhance_audio(video_path: str, generation_id: str):
         print(f"Ошибка улучшения звука: {e}")
         return video_path
 
+def _enhance_locally(video_path: str, temp_path: Path, enhanced_path: Path):
+    """Очистка звука на месте: спектральный гейт, EBU R128, лимитер"""
+    from media_tools import extract_audio
+    from audio_cleanup import enhance_wav
+    
+    print("Извлекаем аудио из видео...")
+    audio_path = temp_path / "original.wav"
+    extract_audio(video_path, str(audio_path))
+    
+    print("Очищаем звук локально...")
+    stats = enhance_wav(str(audio_path), str(enhanced_path), work_dir=str(temp_path))
+    print(f"Громкость {stats['input_loudness_lufs']} LUFS, усиление {stats['gain_db']} дБ "
+          f"до {stats['target_lufs']} LUFS")
+
+def _enhance_with_resemble(video_path: str, temp_path: Path, enhanced_path: Path):
+    """Улучшение через Resemble.ai с опросом задачи и скачиванием результата"""
+    from media_tools import extract_audio
+    from media_downloader import media_downloader
+    from resemble_client import ResembleClient, UnsupportedUploadFormat, UPLOAD_FORMATS, resemble_poller
+    
+    # Отправляем в Resemble.ai аудио без потерь: FLAC, если API его принимает, иначе WAV
+    client = ResembleClient(os.getenv('RESEMBLE_AI_KEY'))
+    job_id = None
+    for audio_format in client.upload_formats():
+        print(f"Извлекаем аудио из видео ({audio_format})...")
+        audio_path = temp_path / f"original.{audio_format}"
+        extract_audio(video_path, str(audio_path), codec=UPLOAD_FORMATS[audio_format][0])
+        
+        print(f"Отправляем аудио в Resemble.ai: {audio_path.stat().st_size} байт...")
+        try:
+            job_id = client.create_job(audio_path, audio_format)
+            break
+        except UnsupportedUploadFormat as e:
+            print(f"{e}; повторяем загрузку в WAV")
+    print(f"Задача создана: {job_id}")
+    
+    # Статус опрашивает общий опросчик процесса с растущей паузой и предельным временем
+    print("Ожидаем завершения обработки...")
+    enhanced_url = resemble_poller.track(client, job_id).result()["enhanced_audio_url"]
+    print(f"Обработка завершена: {enhanced_url}")
+    
+    # Скачиваем улучшенное аудио
+    print("Скачиваем улучшенное аудио...")
+    media_downloader.download(enhanced_url, enhanced_path)
+
 def main():
     """Точка входа для CLI"""
-    if len(sys.argv) < 3:
-        print("Usage: python audio_enhancer.py <video_path> <generation_id>")
+    args = sys.argv[1:]
+    backend = None
+    if "--backend" in args:
+        index = args.index("--backend")
+        backend = args[index + 1] if index + 1 < len(args) else None
+        args = args[:index] + args[index + 2:]
+    
+    if len(args) < 2:
+        print("Usage: python audio_enhancer.py <video_path> <generation_id> [--backend local|resemble]")
         sys.exit(1)
     
-    video_path = sys.argv[1]
-    generation_id = sys.argv[2]
+    video_path = args[0]
+    generation_id = args[1]
     
     try:
-        enhanced_video = enhance_audio(video_path, generation_id)
+        backend = select_backend(backend)
+        enhanced_video = enhance_audio(video_path, generation_id, backend)
         
         result = {
             "status": "completed",
             "original_video": video_path,
-            "enhanced_video": enhanced_video
+            "enhanced_video": enhanced_video,
+            "backend": backend
         }
         
         print("ENHANCED_RESULT:", json.dumps(result, ensure_ascii=False))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Batch Runner
+Пакетная генерация видео по манифесту JSONL/CSV с отдельными лимитами
+одновременности для Claude, задач VEO3 и локальных кодирований
+
+Usage:
+    python batch_runner.py <manifest.jsonl|manifest.csv> [--output-dir DIR] [--jobs N]
+                           [--claude-limit N] [--veo3-limit N] [--encode-limit N]
+
+Строка манифеста — те же данные, что и у CLI video_generator_v2.py:
+generationId, domainData, productData, clientProfile, userInput, language.
+В CSV поля domainData, productData и clientProfile содержат JSON; generationId
+можно не указывать — он будет сформирован из имени манифеста и номера строки.
+
+Результаты:
+    results.jsonl — по строке на генерацию (статус, итоговое видео, ошибка, время)
+    summary.json  — итоги и пропускная способность пакета
+    logs/         — полный вывод каждой генерации
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from provider_limits import provider_limits
+from encode_scheduler import encode_scheduler
+from generation_worker import _JobOutputRouter
+from video_generator_v2 import VideoGenerationPipelineV2, load_api_keys, run_generation
+
+DEFAULT_BATCH_JOBS = 4
+MANIFEST_JSON_FIELDS = ("domainData", "productData", "clientProfile")
+REQUIRED_FIELDS = ("domainData", "productData", "clientProfile", "language")
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """Чтение манифеста JSONL или CSV в список данных генераций"""
+    manifest_path = Path(path)
+    rows: List[Dict[str, Any]] = []
+
+    with open(manifest_path, "r", encoding="utf-8", newline="") as f:
+        if manifest_path.suffix.lower() == ".csv":
+            for row in csv.DictReader(f):
+                generation_data: Dict[str, Any] = {k: v for k, v in row.items() if k and v not in (None, "")}
+                for field in MANIFEST_JSON_FIELDS:
+                    if field in generation_data:
+                        generation_data[field] = json.loads(generation_data[field])
+                rows.append(generation_data)
+        else:
+            for line in f:
+                if line.strip():
+                    rows.append(json.loads(line))
+
+    for number, generation_data in enumerate(rows, start=1):
+        missing = [field for field in REQUIRED_FIELDS if field not in generation_data]
+        if missing:
+            raise Exception(f"Строка {number} манифеста: нет полей {', '.join(missing)}")
+        generation_data.setdefault("userInput", "")
+        generation_data.setdefault("generationId", f"batch_{manifest_path.stem}_{number}")
+
+    return rows
+
+
+class BatchRunner:
+    def __init__(self, output_dir: Path, max_jobs: Optional[int] = None,
+                 pipeline: Optional[VideoGenerationPipelineV2] = None):
+        """
+        Пакетный запуск генераций
+
+        Args:
+            output_dir: Директория результатов пакета
+            max_jobs: Максимум одновременно выполняемых генераций (по умолчанию BATCH_MAX_JOBS)
+            pipeline: Общий пайплайн (по умолчанию создается с ключами из окружения)
+        """
+        if max_jobs is None:
+            max_jobs = int(os.getenv('BATCH_MAX_JOBS', DEFAULT_BATCH_JOBS))
+        self.max_jobs = max(1, max_jobs)
+        self.output_dir = Path(output_dir)
+        self.logs_dir = self.output_dir / "logs"
+        self.logs_dir.mkdir(parents=True, exist_ok=True)
+        self.results_path = self.output_dir / "results.jsonl"
+        self.summary_path = self.output_dir / "summary.json"
+
+        # Один пайплайн на пакет: клиенты и кэш ответов общие для всех строк
+        self.pipeline = pipeline or VideoGenerationPipelineV2(load_api_keys())
+        self._results_lock = threading.Lock()
+        self._console = sys.stdout
+        self._output_router = _JobOutputRouter(sys.stderr)
+
+    def run(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Выполнение всех строк манифеста, возвращает сводку пакета"""
+        started = time.time()
+        results: List[Dict[str, Any]] = []
+        self.results_path.write_text("", encoding="utf-8")
+
+        self._log(f"Пакет: {len(rows)} генераций, одновременно до {self.max_jobs} "
+                  f"(claude: {provider_limits.limit('claude') or '∞'}, "
+                  f"veo3: {provider_limits.limit('veo3') or '∞'}, "
+                  f"encode: {provider_limits.limit('encode') or '∞'}, "
+                  f"слотов кодирования на машину: {encode_scheduler.slots()} × {encode_scheduler.threads()} потоков)")
+
+        sys.stdout = self._output_router
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix="batch") as executor:
+                futures = [executor.submit(self._run_row, number, generation_data)
+                           for number, generation_data in enumerate(rows, start=1)]
+                for future in futures:
+                    results.append(future.result())
+        finally:
+            sys.stdout = self._console
+
+        summary = self._summarize(results, time.time() - started)
+        self.summary_path.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+        return summary
+
+    def _run_row(self, number: int, generation_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Одна генерация с выводом в собственный лог и записью результата"""
+        generation_id = generation_data["generationId"]
+        log_path = self.logs_dir / f"{number:04d}_{generation_id}.log"
+        generation_result: Dict[str, Any] = {}
+        started = time.time()
+
+        with open(log_path, "w", encoding="utf-8") as log_file:
+            def sink(line: str):
+                log_file.write(line + "\n")
+                if line.startswith("GENERATION_RESULT:"):
+                    generation_result.update(json.loads(line[len("GENERATION_RESULT:"):]))
+
+            self._output_router.bind(sink)
+            try:
+                code = run_generation(self.pipeline, generation_data)
+            except Exception as e:
+                log_file.write(f"Ошибка генерации: {e}\n")
+                generation_result.update({"status": "failed", "error": str(e)})
+                code = 1
+            finally:
+                self._output_router.flush()
+                self._output_router.bind(None)
+
+        result = {
+            "row": number,
+            "generationId": generation_id,
+            "language": generation_data.get("language"),
+            "status": generation_result.get("status", "failed" if code else "completed"),
+            "final_video": generation_result.get("final_video"),
+            "timing": generation_result.get("timing"),
+            "segments": len(generation_result.get("video_segments") or []),
+            "error": generation_result.get("error"),
+            "elapsed_seconds": round(time.time() - started, 1),
+            "log": str(log_path)
+        }
+
+        with self._results_lock:
+            with open(self.results_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self._log(f"[{number}] {generation_id}: {result['status']} за {result['elapsed_seconds']}s"
+                  + (f" — {result['error']}" if result["error"] else ""))
+        return result
+
+    def _summarize(self, results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+        """Итоги пакета и пропускная способность"""
+        completed = [r for r in results if r["status"] == "completed"]
+        video_seconds = sum(r["timing"] or 0 for r in completed)
+        hours = elapsed / 3600 if elapsed > 0 else 0
+
+        return {
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "total": len(results),
+            "completed": len(completed),
+            "failed": len(results) - len(completed),
+            "elapsed_seconds": round(elapsed, 1),
+            "videos_per_hour": round(len(completed) / hours, 2) if hours else 0,
+            "video_seconds_per_hour": round(video_seconds / hours, 1) if hours else 0,
+            "avg_generation_seconds": round(sum(r["elapsed_seconds"] for r in results) / len(results), 1) if results else 0,
+            "max_jobs": self.max_jobs,
+            "providers": provider_limits.stats(),
+            "encode": encode_scheduler.stats(),
+            "results": str(self.results_path)
+        }
+
+    def _log(self, message: str):
+        """Прогресс пакета в консоль (stdout занят выводом генераций)"""
+        self._console.write(message + "\n")
+        self._console.flush()
+
+
+def main():
+    """Точка входа для CLI использования"""
+    parser = argparse.ArgumentParser(description="Пакетная генерация видео по манифесту JSONL/CSV")
+    parser.add_argument("manifest", help="Файл манифеста (.jsonl или .csv)")
+    parser.add_argument("--output-dir", help="Директория результатов (по умолчанию batch_results/<манифест>_<время>)")
+    parser.add_argument("--jobs", type=int, default=None, help="Максимум одновременных генераций")
+    parser.add_argument("--claude-limit", type=int, default=None, help="Максимум одновременных запросов Claude")
+    parser.add_argument("--veo3-limit", type=int, default=None, help="Максимум одновременных задач VEO3")
+    parser.add_argument("--encode-limit", type=int, default=None, help="Максимум одновременных склеек/кодирований")
+    args = parser.parse_args()
+
+    for provider, limit in (("claude", args.claude_limit), ("veo3", args.veo3_limit), ("encode", args.encode_limit)):
+        if limit is not None:
+            provider_limits.configure(provider, limit)
+
+    rows = load_manifest(args.manifest)
+    output_dir = args.output_dir
+    if not output_dir:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_dir = Path(__file__).parent.parent / "batch_results" / f"{Path(args.manifest).stem}_{timestamp}"
+
+    runner = BatchRunner(Path(output_dir), args.jobs)
+    summary = runner.run(rows)
+
+    print(f"Готово: {summary['completed']}/{summary['total']} за {summary['elapsed_seconds']}s, "
+          f"{summary['videos_per_hour']} видео/час")
+    print(f"Результаты: {runner.results_path}")
+    print(f"Сводка: {runner.summary_path}")
+    sys.exit(0 if summary["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,893 @@
+#!/usr/bin/env python3
+"""
+Claude Client
+Общий слой вызовов Claude API: повторные попытки, дублирующие запросы при долгом ответе,
+бюджет времени этапа, кэш ответов и потоковые ответы
+"""
+
+import os
+import time
+import random
+import threading
+import contextvars
+from collections import deque
+from typing import Dict, Any, Optional, Union, Iterator, AsyncIterator, List, Tuple, Callable
+
+from response_cache import ResponseCache
+from latency_store import LatencyStore
+from provider_limits import provider_limits
+from rate_limiter import rate_limiter, estimate_tokens
+
+DEFAULT_MODEL = "claude-3-5-sonnet-20241022"
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+
+# Промпт — строка или структура PromptBuilder: {"system": [блоки], "content": [блоки]}
+Prompt = Union[str, Dict[str, Any]]
+
+# Бюджет времени этапов пайплайна (секунды), переопределяется CLAUDE_STAGE_DEADLINES="scenario=180,timing=120"
+DEFAULT_STAGE_DEADLINES = {
+    "scenario": 180,
+    "timing": 150,
+    "veo3_prompts": 300,
+}
+
+# Коды ответов, после которых имеет смысл повторить запрос
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+TRANSIENT_ERROR_NAMES = {
+    "APITimeoutError", "APIConnectionError", "ConnectTimeout", "ReadTimeout",
+    "WriteTimeout", "PoolTimeout", "ConnectError", "ReadError", "RemoteProtocolError",
+}
+
+# Порог дублирующего запроса, пока не накоплено HEDGE_MIN_SAMPLES замеров: полный ответ / первый фрагмент потока
+HEDGE_FALLBACK_DELAY = {"complete": 90.0, "first_token": 20.0}
+HEDGE_MIN_SAMPLES = 20
+
+# Минимальное время, ради которого имеет смысл начинать новую попытку до дедлайна
+MIN_ATTEMPT_SECONDS = 5.0
+
+
+def stage_deadline(stage: Optional[str]) -> Optional[float]:
+    """Бюджет времени этапа в секундах (None — без ограничения)"""
+    if stage is None:
+        return None
+
+    deadlines = dict(DEFAULT_STAGE_DEADLINES)
+    for item in os.getenv('CLAUDE_STAGE_DEADLINES', '').split(','):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            deadlines[name.strip()] = float(value)
+
+    deadline = deadlines.get(stage)
+    return deadline if deadline and deadline > 0 else None
+
+
+class _Attempt:
+    """
+    Попытка запроса с дублированием и занятые ею ресурсы: резерв токенов, слот Claude, поток ответа
+
+    Проигравшая попытка (abandon) сразу освобождает ресурсы и больше их не занимает.
+    Поток ответа закрывается из вызывающего потока; синхронный messages.create прервать
+    нельзя — если его ответ еще придет, он просто отбрасывается.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._releases: List[Callable[[Any], None]] = []
+        self.abandoned = False
+        self.sent = False
+
+    def check(self, deadline_at: Optional[float]):
+        """Исключение, если попытка уже проиграла или бюджет времени исчерпан"""
+        if self.abandoned:
+            raise Exception("Claude: ответ уже получен другим запросом")
+        if deadline_at is not None and time.monotonic() >= deadline_at:
+            raise Exception("Claude deadline exceeded")
+
+    def hold(self, release: Callable[[Any], None]):
+        """Занятый ресурс и его освобождение; у проигравшей попытки ресурс освобождается сразу"""
+        with self._lock:
+            if not self.abandoned:
+                self._releases.append(release)
+                return
+        release(None)
+        self.check(None)
+
+    def release(self, response: Any = None):
+        """Освобождение ресурсов (один раз); response — ответ для расчета резерва токенов"""
+        with self._lock:
+            releases, self._releases = self._releases, []
+        for release in reversed(releases):
+            release(response)
+
+    def abandon(self):
+        """Попытка проиграла или вышел дедлайн: ресурсы освобождаются, не дожидаясь ответа"""
+        with self._lock:
+            self.abandoned = True
+            releases, self._releases = self._releases, []
+        # Ошибка освобождения проигравшей попытки не должна сорвать ответ победителя
+        for release in reversed(releases):
+            try:
+                release(None)
+            except Exception as e:
+                print(f"Claude: не удалось освободить проигравший запрос: {e}")
+
+
+class ClaudeClient:
+    MAX_RETRIES = 4
+    BASE_DELAY = 2
+
+    def __init__(self, api_key: str, cache: Optional[ResponseCache] = None, model: str = DEFAULT_MODEL,
+                 latency_store: Optional[LatencyStore] = None):
+        """
+        Клиент Claude
+
+        Args:
+            api_key: Ключ Anthropic API
+            cache: Кэш ответов (по умолчанию ResponseCache с настройками из окружения)
+            model: Модель по умолчанию
+            latency_store: Замеры задержки для порога дублирования (по умолчанию LatencyStore из окружения)
+        """
+        self.api_key = api_key
+        self.model = model
+        self.cache = cache if cache is not None else ResponseCache()
+        self.latency_store = latency_store if latency_store is not None else LatencyStore()
+        self._client = None
+        self._async_client = None
+        self._hedge_executor = None
+        self._lock = threading.Lock()
+
+        # Таймаут одного запроса; для потока — максимальная пауза между фрагментами
+        self.request_timeout = float(os.getenv('CLAUDE_REQUEST_TIMEOUT', 120))
+        # Дублирующий запрос отправляется, когда ответ дольше этого перцентиля прошлых ответов
+        self.hedge_percentile = float(os.getenv('CLAUDE_HEDGE_PERCENTILE', 95))
+        self.hedge_enabled = os.getenv('CLAUDE_HEDGE_DISABLED', 'false').lower() not in ('1', 'true', 'yes')
+        self._latencies: Dict[Tuple[str, str], deque] = {}
+
+        # Статистика серверного кэша промптов Anthropic и дублирующих запросов
+        self.prompt_cache_read_tokens = 0
+        self.prompt_cache_write_tokens = 0
+        self.hedged_requests = 0
+
+    @property
+    def client(self):
+        """Клиент Anthropic, создается при первом запросе (повторы выполняет ClaudeClient)"""
+        with self._lock:
+            if self._client is None:
+                from anthropic import Anthropic
+                self._client = Anthropic(api_key=self.api_key, max_retries=0)
+            return self._client
+
+    @property
+    def async_client(self):
+        """Асинхронный клиент Anthropic, создается при первом асинхронном запросе"""
+        with self._lock:
+            if self._async_client is None:
+                from anthropic import AsyncAnthropic
+                self._async_client = AsyncAnthropic(api_key=self.api_key, max_retries=0)
+            return self._async_client
+
+    @property
+    def hedge_executor(self):
+        """Пул потоков для параллельных (основного и дублирующего) запросов"""
+        with self._lock:
+            if self._hedge_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="claude")
+            return self._hedge_executor
+
+    def _submit_hedge(self, fn, *args):
+        """Запуск в пуле хеджирования в копии контекста вызывающего (канал вывода задачи воркера)"""
+        return self.hedge_executor.submit(contextvars.copy_context().run, fn, *args)
+
+    def complete(self, prompt: Prompt, max_tokens: int = 3000, temperature: float = 0.7,
+                 use_cache: bool = True, model: Optional[str] = None, deadline: Optional[float] = None) -> str:
+        """
+        Текстовый ответ Claude на промпт
+
+        Args:
+            use_cache: False — всегда обращаться к API и не сохранять ответ
+            deadline: Бюджет времени на вызов со всеми повторами, в секундах
+        """
+        model = model or self.model
+        cache_key = ResponseCache.make_key(model, temperature, max_tokens, prompt)
+
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        text = self._create_with_retries(prompt, max_tokens, temperature, model, self._deadline_at(deadline))
+
+        if use_cache:
+            self.cache.set(cache_key, model, text)
+        return text
+
+    def stream(self, prompt: Prompt, max_tokens: int = 3000, temperature: float = 0.7,
+               use_cache: bool = True, model: Optional[str] = None, deadline: Optional[float] = None) -> Iterator[str]:
+        """
+        Потоковый ответ Claude: фрагменты текста по мере генерации
+
+        Ответ из кэша отдается одним фрагментом. Повтор возможен, только пока
+        не получено ни одного фрагмента; дублирующий запрос отправляется,
+        если первый фрагмент задерживается.
+        """
+        model = model or self.model
+        cache_key = ResponseCache.make_key(model, temperature, max_tokens, prompt)
+        deadline_at = self._deadline_at(deadline)
+
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        chunks = []
+        last_error: Optional[Exception] = None
+        for attempt in range(self.MAX_RETRIES):
+            if attempt:
+                self._wait_before_retry(attempt, last_error, deadline_at)
+            try:
+                for text in self._hedged_stream(prompt, max_tokens, temperature, model, deadline_at):
+                    chunks.append(text)
+                    yield text
+                break
+
+            except Exception as e:
+                if chunks or not self._is_transient(e):
+                    raise Exception(f"Claude API error: {str(e)}")
+                last_error = e
+        else:
+            raise self._retries_exhausted(last_error)
+
+        if use_cache:
+            self.cache.set(cache_key, model, "".join(chunks))
+
+    async def acomplete(self, prompt: Prompt, max_tokens: int = 3000, temperature: float = 0.7,
+                        use_cache: bool = True, model: Optional[str] = None, deadline: Optional[float] = None) -> str:
+        """Асинхронный вариант complete: ожидание API и повторов не блокирует event loop"""
+        import asyncio
+
+        model = model or self.model
+        cache_key = ResponseCache.make_key(model, temperature, max_tokens, prompt)
+
+        if use_cache:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return cached
+
+        text = await self._acreate_with_retries(prompt, max_tokens, temperature, model, self._deadline_at(deadline))
+
+        if use_cache:
+            await asyncio.to_thread(self.cache.set, cache_key, model, text)
+        return text
+
+    async def astream(self, prompt: Prompt, max_tokens: int = 3000, temperature: float = 0.7,
+                      use_cache: bool = True, model: Optional[str] = None,
+                      deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """Асинхронный вариант stream с теми же правилами кэша, повторов и дублирования"""
+        import asyncio
+
+        model = model or self.model
+        cache_key = ResponseCache.make_key(model, temperature, max_tokens, prompt)
+        deadline_at = self._deadline_at(deadline)
+
+        if use_cache:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        chunks = []
+        last_error: Optional[Exception] = None
+        for attempt in range(self.MAX_RETRIES):
+            if attempt:
+                await self._await_before_retry(attempt, last_error, deadline_at)
+            try:
+                async for text in self._ahedged_stream(prompt, max_tokens, temperature, model, deadline_at):
+                    chunks.append(text)
+                    yield text
+                break
+
+            except Exception as e:
+                if chunks or not self._is_transient(e):
+                    raise Exception(f"Claude API error: {str(e)}")
+                last_error = e
+        else:
+            raise self._retries_exhausted(last_error)
+
+        if use_cache:
+            await asyncio.to_thread(self.cache.set, cache_key, model, "".join(chunks))
+
+    # --- Повторы ---
+
+    def _create_with_retries(self, prompt: Prompt, max_tokens: int, temperature: float, model: str,
+                             deadline_at: Optional[float]) -> str:
+        """Вызов Claude API с повтором временных ошибок в пределах дедлайна"""
+        last_error: Optional[Exception] = None
+        for attempt in range(self.MAX_RETRIES):
+            if attempt:
+                self._wait_before_retry(attempt, last_error, deadline_at)
+            try:
+                return self._hedged_create(prompt, max_tokens, temperature, model, deadline_at)
+            except Exception as e:
+                if not self._is_transient(e):
+                    raise Exception(f"Claude API error: {str(e)}")
+                last_error = e
+
+        raise self._retries_exhausted(last_error)
+
+    async def _acreate_with_retries(self, prompt: Prompt, max_tokens: int, temperature: float, model: str,
+                                    deadline_at: Optional[float]) -> str:
+        """Асинхронный вызов Claude API с повтором временных ошибок в пределах дедлайна"""
+        last_error: Optional[Exception] = None
+        for attempt in range(self.MAX_RETRIES):
+            if attempt:
+                await self._await_before_retry(attempt, last_error, deadline_at)
+            try:
+                return await self._ahedged_create(prompt, max_tokens, temperature, model, deadline_at)
+            except Exception as e:
+                if not self._is_transient(e):
+                    raise Exception(f"Claude API error: {str(e)}")
+                last_error = e
+
+        raise self._retries_exhausted(last_error)
+
+    def _retry_delay(self, attempt: int, error: Optional[Exception], deadline_at: Optional[float]) -> float:
+        """
+        Пауза перед повторной попыткой: Retry-After сервера или экспоненциальная задержка с jitter
+
+        Бросает исключение, если после паузы до дедлайна не останется времени на попытку.
+        """
+        delay = self._retry_after(error) if error is not None else None
+        if delay is None:
+            delay = random.uniform(0, self.BASE_DELAY * (2 ** attempt))
+
+        if deadline_at is not None and time.monotonic() + delay + MIN_ATTEMPT_SECONDS > deadline_at:
+            raise Exception(f"Claude deadline exceeded, last error: {error}")
+        return delay
+
+    def _wait_before_retry(self, attempt: int, error: Optional[Exception], deadline_at: Optional[float]):
+        """Ожидание перед повторной попыткой"""
+        delay = self._retry_delay(attempt, error, deadline_at)
+        print(f"Claude: повтор {attempt + 1}/{self.MAX_RETRIES} через {delay:.1f}s ({error})")
+        time.sleep(delay)
+
+    async def _await_before_retry(self, attempt: int, error: Optional[Exception], deadline_at: Optional[float]):
+        """Ожидание перед повторной попыткой без блокировки event loop"""
+        import asyncio
+
+        delay = self._retry_delay(attempt, error, deadline_at)
+        print(f"Claude: повтор {attempt + 1}/{self.MAX_RETRIES} через {delay:.1f}s ({error})")
+        await asyncio.sleep(delay)
+
+    def _retries_exhausted(self, error: Optional[Exception]) -> Exception:
+        """Итоговая ошибка после исчерпания попыток"""
+        if error is not None and self._is_overloaded(error):
+            return Exception(f"API overloaded after {self.MAX_RETRIES} attempts")
+        return Exception(f"Claude API error after {self.MAX_RETRIES} attempts: {error}")
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        """Пауза из заголовков retry-after-ms / retry-after ответа с ошибкой"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+
+        try:
+            if headers.get("retry-after-ms"):
+                return max(0.0, float(headers["retry-after-ms"]) / 1000)
+            value = headers.get("retry-after")
+            if not value:
+                return None
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                from email.utils import parsedate_to_datetime
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _is_overloaded(error: Exception) -> bool:
+        """Ошибка перегрузки API"""
+        return "529" in str(error) or "overloaded" in str(error).lower()
+
+    @classmethod
+    def _is_transient(cls, error: Exception) -> bool:
+        """Временная ошибка: перегрузка, лимит, 5xx, таймаут или разрыв соединения"""
+        status = getattr(error, "status_code", None)
+        if isinstance(status, int) and (status in TRANSIENT_STATUS_CODES or status >= 500):
+            return True
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        if type(error).__name__ in TRANSIENT_ERROR_NAMES:
+            return True
+        return cls._is_overloaded(error)
+
+    # --- Дедлайн и дублирующие запросы ---
+
+    @staticmethod
+    def _deadline_at(deadline: Optional[float]) -> Optional[float]:
+        """Абсолютный момент дедлайна по бюджету в секундах"""
+        return time.monotonic() + deadline if deadline else None
+
+    @staticmethod
+    def _remaining(deadline_at: Optional[float]) -> Optional[float]:
+        """Остаток бюджета в секундах (None — без дедлайна)"""
+        return None if deadline_at is None else max(0.0, deadline_at - time.monotonic())
+
+    def _attempt_timeout(self, deadline_at: Optional[float]) -> float:
+        """Таймаут запроса с учетом оставшегося бюджета"""
+        remaining = self._remaining(deadline_at)
+        if remaining is None:
+            return self.request_timeout
+        if remaining <= 0:
+            raise Exception("Claude deadline exceeded")
+        return min(self.request_timeout, remaining)
+
+    def _hedge_delay(self, kind: str, model: str) -> Optional[float]:
+        """Через сколько секунд отправлять дублирующий запрос (None — не дублировать)"""
+        if not self.hedge_enabled:
+            return None
+
+        if self.latency_store.enabled:
+            samples = self.latency_store.samples(kind, model)
+        else:
+            samples = list(self._latencies.get((kind, model), []))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_FALLBACK_DELAY[kind]
+
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+        return ordered[index]
+
+    def _record_latency(self, kind: str, model: str, seconds: float):
+        """Замер длительности успешного запроса для порога дублирования"""
+        with self._lock:
+            self._latencies.setdefault((kind, model), deque(maxlen=500)).append(seconds)
+        try:
+            self.latency_store.record(kind, model, seconds)
+        except Exception as e:
+            print(f"Не удалось сохранить замер задержки Claude: {e}")
+
+    def _should_hedge(self, deadline_at: Optional[float]) -> bool:
+        """Хватает ли бюджета на дублирующий запрос"""
+        remaining = self._remaining(deadline_at)
+        return remaining is None or remaining > MIN_ATTEMPT_SECONDS
+
+    def _hedge_wait(self, hedge_delay: float, deadline_at: Optional[float]) -> float:
+        """Ожидание основного запроса до отправки дубля (не дольше дедлайна)"""
+        remaining = self._remaining(deadline_at)
+        return hedge_delay if remaining is None else min(hedge_delay, remaining)
+
+    def _hedged_create(self, prompt: Prompt, max_tokens: int, temperature: float, model: str,
+                       deadline_at: Optional[float]) -> str:
+        """
+        Запрос с дублированием: если ответ дольше перцентиля прошлых ответов,
+        параллельно отправляется такой же запрос и берется первый успешный
+        """
+        from concurrent.futures import wait, FIRST_COMPLETED
+
+        hedge_delay = self._hedge_delay("complete", model)
+        if hedge_delay is None:
+            return self._timed_create(prompt, max_tokens, temperature, model, deadline_at)
+
+        attempt = _Attempt()
+        attempts = {self._submit_hedge(self._timed_create, prompt, max_tokens, temperature, model, deadline_at,
+                                       attempt): attempt}
+        done, _ = wait(attempts, timeout=self._hedge_wait(hedge_delay, deadline_at))
+        if not done and self._should_hedge(deadline_at):
+            print(f"Claude: нет ответа за {hedge_delay:.1f}s, отправляем дублирующий запрос")
+            self._count_hedge()
+            attempt = _Attempt()
+            attempts[self._submit_hedge(self._timed_create, prompt, max_tokens, temperature, model, deadline_at,
+                                        attempt)] = attempt
+
+        errors: List[BaseException] = []
+        pending = set(attempts)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=self._remaining(deadline_at), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise Exception("Claude deadline exceeded")
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    errors.append(future.exception())
+            raise errors[0]
+        finally:
+            # Проигравший запрос (и все — по дедлайну) сразу отдает слот и резерв токенов;
+            # еще не начатый не выполняется, начатый отбрасывает свой ответ
+            for future, other in attempts.items():
+                future.cancel()
+                other.abandon()
+
+    def _timed_create(self, prompt: Prompt, max_tokens: int, temperature: float, model: str,
+                      deadline_at: Optional[float], attempt: Optional[_Attempt] = None) -> str:
+        """
+        Один запрос messages.create с лимитами и замером длительности
+
+        attempt — попытка запроса с дублированием: перед резервом токенов и слотом
+        проверяются дедлайн и то, не получен ли уже ответ другой попыткой.
+        """
+        attempt = attempt or _Attempt()
+        attempt.check(deadline_at)
+        prompt_tokens = self._estimate_prompt_tokens(prompt)
+        reserved = self._reserve_tokens(prompt, max_tokens)
+        attempt.hold(lambda response: self._settle_tokens(response, reserved, prompt_tokens if attempt.sent else 0))
+        try:
+            attempt.check(deadline_at)
+            slot = provider_limits.slot("claude")
+            slot.__enter__()
+            attempt.hold(lambda _: slot.__exit__(None, None, None))
+            timeout = self._attempt_timeout(deadline_at)
+            attempt.sent = True
+            started = time.monotonic()
+            response = self.client.messages.create(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout,
+                **self._request_params(prompt)
+            )
+        except BaseException:
+            attempt.release()
+            raise
+        attempt.release(response)
+        self._record_latency("complete", model, time.monotonic() - started)
+        self._track_prompt_cache(response)
+        return response.content[0].text
+
+    async def _ahedged_create(self, prompt: Prompt, max_tokens: int, temperature: float, model: str,
+                              deadline_at: Optional[float]) -> str:
+        """Асинхронный запрос с дублированием, проигравший запрос отменяется"""
+        import asyncio
+
+        hedge_delay = await asyncio.to_thread(self._hedge_delay, "complete", model)
+        if hedge_delay is None:
+            return await self._atimed_create(prompt, max_tokens, temperature, model, deadline_at)
+
+        tasks = [asyncio.ensure_future(self._atimed_create(prompt, max_tokens, temperature, model, deadline_at))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self._hedge_wait(hedge_delay, deadline_at))
+            if not done and self._should_hedge(deadline_at):
+                print(f"Claude: нет ответа за {hedge_delay:.1f}s, отправляем дублирующий запрос")
+                self._count_hedge()
+                tasks.append(asyncio.ensure_future(self._atimed_create(prompt, max_tokens, temperature, model, deadline_at)))
+
+            errors: List[BaseException] = []
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=self._remaining(deadline_at),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise Exception("Claude deadline exceeded")
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+            raise errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _atimed_create(self, prompt: Prompt, max_tokens: int, temperature: float, model: str,
+                             deadline_at: Optional[float]) -> str:
+        """Один асинхронный запрос messages.create с лимитами и замером длительности"""
+        import asyncio
+
+        # Дедлайн проверяется до ожидания лимитера, таймаут считается после него
+        self._attempt_timeout(deadline_at)
+        reserved = await self._areserve_tokens(prompt, max_tokens)
+        timeout = await self._atimeout_after_reserve(deadline_at, reserved)
+        started = time.monotonic()
+        try:
+            response = await self.async_client.messages.create(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout,
+                **self._request_params(prompt)
+            )
+        except BaseException:
+            # Ошибка или отмена проигравшего запроса: резерв ответа возвращается
+            await asyncio.to_thread(self._settle_tokens, None, reserved, self._estimate_prompt_tokens(prompt))
+            raise
+        latency = time.monotonic() - started
+        self._track_prompt_cache(response)
+        await asyncio.to_thread(self._record_latency, "complete", model, latency)
+        await asyncio.to_thread(self._settle_tokens, response, reserved)
+        return response.content[0].text
+
+    def _hedged_stream(self, prompt: Prompt, max_tokens: int, temperature: float, model: str,
+                       deadline_at: Optional[float]) -> Iterator[str]:
+        """
+        Поток с дублированием по задержке первого фрагмента
+
+        Первые фрагменты ожидаются в пуле потоков; поток, приславший фрагмент первым,
+        дочитывается в вызывающем потоке. Остальные закрываются сразу, не дожидаясь
+        их первого фрагмента: соединение, поток пула и резерв токенов освобождаются.
+        """
+        from concurrent.futures import wait, FIRST_COMPLETED
+
+        def first_chunk(response_stream: Iterator[str]) -> Optional[str]:
+            return next(response_stream, None)
+
+        hedge_delay = self._hedge_delay("first_token", model)
+        streams = {}
+        attempts: Dict[Any, _Attempt] = {}
+
+        def start():
+            attempt = _Attempt()
+            response_stream = self._open_stream(prompt, max_tokens, temperature, model, deadline_at, attempt)
+            future = self._submit_hedge(first_chunk, response_stream)
+            streams[future], attempts[future] = response_stream, attempt
+
+        start()
+        if hedge_delay is not None:
+            done, _ = wait(streams, timeout=self._hedge_wait(hedge_delay, deadline_at))
+            if not done and self._should_hedge(deadline_at):
+                print(f"Claude: нет первого фрагмента за {hedge_delay:.1f}s, отправляем дублирующий запрос")
+                self._count_hedge()
+                start()
+
+        winner = None
+        text = None
+        errors: List[BaseException] = []
+        pending = set(streams)
+        try:
+            while pending and winner is None:
+                done, pending = wait(pending, timeout=self._remaining(deadline_at), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise Exception("Claude deadline exceeded")
+                for future in done:
+                    if future.exception() is not None:
+                        errors.append(future.exception())
+                    elif winner is None:
+                        winner, text = streams[future], future.result()
+        finally:
+            # Остальные запросы прерываются сразу (закрытие ответа будит поток пула),
+            # генератор закрывается, когда поток пула из него выйдет
+            for future, other_stream in streams.items():
+                if other_stream is not winner:
+                    future.cancel()
+                    attempts[future].abandon()
+                    future.add_done_callback(lambda _, s=other_stream: s.close())
+
+        if winner is None:
+            raise errors[0]
+        if text is None:
+            return
+
+        try:
+            yield text
+            for text in winner:
+                if deadline_at is not None and time.monotonic() > deadline_at:
+                    raise Exception("Claude deadline exceeded")
+                yield text
+        finally:
+            winner.close()
+
+    def _open_stream(self, prompt: Prompt, max_tokens: int, temperature: float, model: str,
+                     deadline_at: Optional[float], attempt: Optional[_Attempt] = None) -> Iterator[str]:
+        """
+        Один потоковый запрос с лимитами и замером задержки первого фрагмента
+
+        attempt — попытка запроса с дублированием: проигравшая не занимает слот, а открытый
+        поток ответа закрывается ее abandon() из другого потока. Резерв токенов рассчитывается
+        и при досрочном закрытии: по usage прочитанной части ответа, без нее — по оценке промпта.
+        """
+        attempt = attempt or _Attempt()
+        attempt.check(deadline_at)
+        timeout = self._attempt_timeout(deadline_at)
+        prompt_tokens = self._estimate_prompt_tokens(prompt)
+        reserved = self._reserve_tokens(prompt, max_tokens)
+        message = None
+        sent = False
+        try:
+            attempt.check(deadline_at)
+            with provider_limits.slot("claude"):
+                attempt.check(deadline_at)
+                timeout = min(timeout, self._attempt_timeout(deadline_at))
+                started = time.monotonic()
+                sent = True
+                with self.client.messages.stream(
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    timeout=timeout,
+                    **self._request_params(prompt)
+                ) as response_stream:
+                    try:
+                        attempt.hold(lambda _: response_stream.close())
+                        first = True
+                        for text in response_stream.text_stream:
+                            if first:
+                                self._record_latency("first_token", model, time.monotonic() - started)
+                                first = False
+                            yield text
+                        message = response_stream.get_final_message()
+                    finally:
+                        message = message or self._stream_snapshot(response_stream)
+        finally:
+            self._settle_tokens(message, reserved, prompt_tokens if sent else 0)
+        self._track_prompt_cache(message)
+
+    async def _ahedged_stream(self, prompt: Prompt, max_tokens: int, temperature: float, model: str,
+                              deadline_at: Optional[float]) -> AsyncIterator[str]:
+        """Асинхронный поток с дублированием по задержке первого фрагмента"""
+        import asyncio
+
+        async def first_chunk(response_stream: AsyncIterator[str]) -> Optional[str]:
+            async for text in response_stream:
+                return text
+            return None
+
+        hedge_delay = await asyncio.to_thread(self._hedge_delay, "first_token", model)
+        streams = {}
+
+        response_stream = self._aopen_stream(prompt, max_tokens, temperature, model, deadline_at)
+        streams[asyncio.ensure_future(first_chunk(response_stream))] = response_stream
+
+        if hedge_delay is not None:
+            done, _ = await asyncio.wait(streams, timeout=self._hedge_wait(hedge_delay, deadline_at))
+            if not done and self._should_hedge(deadline_at):
+                print(f"Claude: нет первого фрагмента за {hedge_delay:.1f}s, отправляем дублирующий запрос")
+                self._count_hedge()
+                response_stream = self._aopen_stream(prompt, max_tokens, temperature, model, deadline_at)
+                streams[asyncio.ensure_future(first_chunk(response_stream))] = response_stream
+
+        winner = None
+        text = None
+        errors: List[BaseException] = []
+        pending = set(streams)
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, timeout=self._remaining(deadline_at),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise Exception("Claude deadline exceeded")
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif winner is None:
+                        winner, text = streams[task], task.result()
+        finally:
+            # Проигравшие запросы отменяются сразу
+            for task, other_stream in streams.items():
+                if other_stream is not winner:
+                    task.cancel()
+                    try:
+                        await task
+                    except BaseException:
+                        pass
+                    await other_stream.aclose()
+
+        if winner is None:
+            raise errors[0]
+        if text is None:
+            return
+
+        try:
+            yield text
+            async for text in winner:
+                if deadline_at is not None and time.monotonic() > deadline_at:
+                    raise Exception("Claude deadline exceeded")
+                yield text
+        finally:
+            await winner.aclose()
+
+    async def _aopen_stream(self, prompt: Prompt, max_tokens: int, temperature: float, model: str,
+                            deadline_at: Optional[float]) -> AsyncIterator[str]:
+        """Один асинхронный потоковый запрос с лимитами и замером задержки первого фрагмента"""
+        import asyncio
+
+        self._attempt_timeout(deadline_at)
+        reserved = await self._areserve_tokens(prompt, max_tokens)
+        timeout = await self._atimeout_after_reserve(deadline_at, reserved)
+        message = None
+        started = time.monotonic()
+        try:
+            async with self.async_client.messages.stream(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout,
+                **self._request_params(prompt)
+            ) as response_stream:
+                try:
+                    first = True
+                    async for text in response_stream.text_stream:
+                        if first:
+                            await asyncio.to_thread(self._record_latency, "first_token", model,
+                                                    time.monotonic() - started)
+                            first = False
+                        yield text
+                    message = await response_stream.get_final_message()
+                finally:
+                    message = message or self._stream_snapshot(response_stream)
+        finally:
+            # Как в _open_stream: закрытый досрочно поток рассчитывается по прочитанной части
+            await asyncio.to_thread(self._settle_tokens, message, reserved, self._estimate_prompt_tokens(prompt))
+        self._track_prompt_cache(message)
+
+    # --- Параметры запроса и учет токенов ---
+
+    def _request_params(self, prompt: Prompt) -> Dict[str, Any]:
+        """Параметры messages.create для строкового или структурированного промпта"""
+        if isinstance(prompt, str):
+            return {"messages": [{"role": "user", "content": prompt}]}
+
+        return {
+            "system": prompt["system"],
+            "messages": [{"role": "user", "content": prompt["content"]}],
+            "extra_headers": {"anthropic-beta": PROMPT_CACHING_BETA}
+        }
+
+    @staticmethod
+    def _estimate_prompt_tokens(prompt: Prompt) -> int:
+        """Оценка входных токенов промпта для лимитера"""
+        if isinstance(prompt, str):
+            return estimate_tokens(prompt)
+        blocks = list(prompt.get("system", [])) + list(prompt.get("content", []))
+        return estimate_tokens("".join(block.get("text", "") for block in blocks))
+
+    def _reserve_tokens(self, prompt: Prompt, max_tokens: int) -> int:
+        """Ожидание лимита запросов/токенов Anthropic, возвращает зарезервированное число токенов"""
+        reserved = self._estimate_prompt_tokens(prompt) + max_tokens
+        rate_limiter.acquire("anthropic", self.api_key, tokens=reserved)
+        return reserved
+
+    async def _areserve_tokens(self, prompt: Prompt, max_tokens: int) -> int:
+        """Асинхронный вариант _reserve_tokens"""
+        reserved = self._estimate_prompt_tokens(prompt) + max_tokens
+        await rate_limiter.aacquire("anthropic", self.api_key, tokens=reserved)
+        return reserved
+
+    async def _atimeout_after_reserve(self, deadline_at: Optional[float], reserved: int) -> float:
+        """Таймаут запроса после ожидания лимитера; если бюджет уже исчерпан — резерв возвращается целиком"""
+        import asyncio
+
+        try:
+            return self._attempt_timeout(deadline_at)
+        except Exception:
+            await asyncio.to_thread(self._settle_tokens, None, reserved, 0)
+            raise
+
+    def _settle_tokens(self, response: Any, reserved: int, estimated: Optional[int] = None):
+        """
+        Возврат неиспользованного резерва токенов по фактическому usage ответа
+
+        Args:
+            estimated: Расход, если usage нет (запрос прерван или проиграл); None — резерв не меняется
+        """
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            used = ((getattr(usage, "input_tokens", 0) or 0) + (getattr(usage, "output_tokens", 0) or 0)
+                    + (getattr(usage, "cache_creation_input_tokens", 0) or 0))
+        elif estimated is not None:
+            used = estimated
+        else:
+            return
+        rate_limiter.adjust("anthropic", self.api_key, used - reserved)
+
+    @staticmethod
+    def _stream_snapshot(response_stream: Any) -> Any:
+        """Сообщение, накопленное потоком к моменту закрытия (None — сервер еще ничего не прислал)"""
+        try:
+            return response_stream.current_message_snapshot
+        except Exception:
+            return None
+
+    def _track_prompt_cache(self, response: Any):
+        """Учет токенов, прочитанных и записанных в кэш промптов"""
+        usage = getattr(response, "usage", None)
+        with self._lock:
+            self.prompt_cache_read_tokens += getattr(usage, "cache_read_input_tokens", 0) or 0
+            self.prompt_cache_write_tokens += getattr(usage, "cache_creation_input_tokens", 0) or 0
+
+    def _count_hedge(self):
+        """Учет отправленного дублирующего запроса (запросы идут из разных потоков)"""
+        with self._lock:
+            self.hedged_requests += 1
@@ -7,13 +7,13 @@ Client Profile Generator
 import os
 import sys
 import json
-from anthropic import Anthropic
+from claude_client import ClaudeClient
 
 class ClientProfileGenerator:
     def __init__(self, api_key: str):
-        self.client = Anthropic(api_key=api_key)
+        self.client = ClaudeClient(api_key)
 
-    def generate_profile(self, user_input: str) -> dict:
+    def generate_profile(self, user_input: str, use_cache: bool = True) -> dict:
         """Генерирует профиль клиента по описанию"""
         
         prompt = f"""You are a brand strategist creating comprehensive client profiles for video advertising platforms.
@@ -95,14 +95,9 @@ TONE OF VOICE GUIDELINES:
 
 Create the comprehensive client profile now:"""
 
-        response = self.client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=2500,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
-        )
+        response_text = self.client.complete(prompt, max_tokens=2500, temperature=0.7, use_cache=use_cache)
         
-        return self._parse_json_response(response.content[0].text)
+        return self._parse_json_response(response_text)
 
     def _parse_json_response(self, response: str) -> dict:
         """Парсит JSON ответ от Claude"""
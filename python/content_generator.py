@@ -7,14 +7,14 @@ AI Content Generator for Products and Domains
 import os
 import sys
 import json
-from anthropic import Anthropic
+from claude_client import ClaudeClient
 from typing import Dict, Any
 
 class ContentGenerator:
     def __init__(self, api_key: str):
-        self.client = Anthropic(api_key=api_key)
+        self.client = ClaudeClient(api_key)
 
-    def generate_product(self, user_input: str) -> Dict[str, Any]:
+    def generate_product(self, user_input: str, use_cache: bool = True) -> Dict[str, Any]:
         """Генерирует описание продукта по пользовательскому вводу"""
         
         prompt = f"""You are a product manager for CrossFi ecosystem, creating detailed product descriptions for video advertising.
@@ -62,16 +62,11 @@ REQUIREMENTS:
 
 Create the product description now:"""
 
-        response = self.client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=2000,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
-        )
+        response_text = self.client.complete(prompt, max_tokens=2000, temperature=0.7, use_cache=use_cache)
         
-        return self._parse_json_response(response.content[0].text)
+        return self._parse_json_response(response_text)
 
-    def generate_domain(self, user_input: str) -> Dict[str, Any]:
+    def generate_domain(self, user_input: str, use_cache: bool = True) -> Dict[str, Any]:
         """Генерирует описание домена по пользовательскому вводу"""
         
         prompt = f"""You are a creative director for CrossFi video advertising, creating domain styles for video generation.
@@ -108,14 +103,9 @@ REQUIREMENTS:
 
 Create the domain description now:"""
 
-        response = self.client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=2000,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.8
-        )
+        response_text = self.client.complete(prompt, max_tokens=2000, temperature=0.8, use_cache=use_cache)
         
-        return self._parse_json_response(response.content[0].text)
+        return self._parse_json_response(response_text)
 
     def _parse_json_response(self, response: str) -> Dict[str, Any]:
         """Парсит JSON ответ от Claude с обработкой ошибок"""
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Encode Scheduler
+Общий для всех процессов машины планировщик локальных кодирований (ffmpeg/moviepy):
+ограниченное число слотов, потоков на кодирование, пониженный приоритет CPU и диска
+и пресет x264 по уровню качества. Слоты — файловые блокировки, поэтому одновременные
+склейки воркера, пакетного запуска и улучшения звука не делят ядра сверх лимита
+и оставляют процессор веб-серверу.
+"""
+
+import os
+import time
+import shutil
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows: слоты действуют только внутри процесса
+    fcntl = None
+
+from provider_limits import provider_limits
+
+DEFAULT_SLOTS_DIR = Path(__file__).parent.parent / "cache" / "encode_slots"
+# Пресеты x264 по уровням качества; переопределяются ENCODE_PRESET_<УРОВЕНЬ>
+QUALITY_PRESETS = {
+    "preview": "veryfast",
+    "standard": "veryfast",
+    "high": "medium",
+}
+DEFAULT_QUALITY = "standard"
+DEFAULT_NICE = 10
+# ionice: класс best-effort (2) с низшим приоритетом внутри класса
+IONICE_ARGS = ["-c", "2", "-n", "7"]
+POLL_SECONDS = 0.2
+# Ожидание дольше этого выводится в лог
+WAIT_LOG_SECONDS = 1.0
+
+
+class EncodeScheduler:
+    def __init__(self):
+        """Статистика ожидания слотов процесса и занятые слоты потоков"""
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._semaphore: Optional[threading.BoundedSemaphore] = None
+        self._stats: Dict[str, float] = {"encodes": 0, "active": 0, "peak": 0,
+                                         "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    def slots(self) -> int:
+        """Одновременных кодирований на машину: ENCODE_SLOTS, по умолчанию одно на 4 ядра"""
+        value = os.getenv('ENCODE_SLOTS', '')
+        if value.strip():
+            return max(1, int(value))
+        return max(1, (os.cpu_count() or 1) // 4)
+
+    def threads(self) -> int:
+        """Потоков на кодирование: ENCODE_THREADS, по умолчанию ядра без одного, деленные на слоты"""
+        value = os.getenv('ENCODE_THREADS', '')
+        if value.strip():
+            return max(1, int(value))
+        return max(1, ((os.cpu_count() or 1) - 1) // self.slots())
+
+    def preset(self, quality: Optional[str] = None) -> str:
+        """Пресет x264 уровня качества (preview, standard, high); по умолчанию — ENCODE_QUALITY"""
+        quality = (quality or os.getenv('ENCODE_QUALITY', DEFAULT_QUALITY)).lower()
+        if quality not in QUALITY_PRESETS:
+            quality = DEFAULT_QUALITY
+        return os.getenv(f'ENCODE_PRESET_{quality.upper()}') or QUALITY_PRESETS[quality]
+
+    def x264_args(self, quality: Optional[str] = None) -> List[Any]:
+        """Аргументы выхода ffmpeg: пресет уровня качества и лимит потоков кодировщика"""
+        return ["-preset", self.preset(quality), "-threads", self.threads()]
+
+    def priority_prefix(self) -> List[str]:
+        """nice/ionice перед командой кодирования (ENCODE_NICE, 0 — без понижения приоритета)"""
+        niceness = int(os.getenv('ENCODE_NICE', DEFAULT_NICE))
+        prefix: List[str] = []
+        if niceness > 0 and shutil.which("nice"):
+            prefix += ["nice", "-n", str(niceness)]
+            if shutil.which("ionice"):
+                prefix += ["ionice"] + IONICE_ARGS
+        return prefix
+
+    def active(self) -> bool:
+        """Выполняется ли текущий поток внутри слота кодирования"""
+        return getattr(self._local, "depth", 0) > 0
+
+    def _acquire_file_slot(self) -> Any:
+        """Свободный слот-файл с эксклюзивной блокировкой; ждет, пока слот не освободится"""
+        slots_dir = Path(os.getenv('ENCODE_SLOTS_DIR') or DEFAULT_SLOTS_DIR)
+        slots_dir.mkdir(parents=True, exist_ok=True)
+        while True:
+            for index in range(self.slots()):
+                handle = open(slots_dir / f"slot_{index}.lock", "a")
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return handle
+                except BlockingIOError:
+                    handle.close()
+            time.sleep(POLL_SECONDS)
+
+    def _acquire(self) -> Any:
+        if fcntl is not None:
+            return self._acquire_file_slot()
+        with self._lock:
+            if self._semaphore is None:
+                self._semaphore = threading.BoundedSemaphore(self.slots())
+        self._semaphore.acquire()
+        return None
+
+    def _release(self, handle: Any):
+        if handle is not None:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+        elif self._semaphore is not None:
+            self._semaphore.release()
+
+    @contextmanager
+    def slot(self, name: str) -> Iterator[None]:
+        """
+        Слот кодирования на время работы (вложенные вызовы в том же потоке используют его же)
+
+        Сначала занимается лимит процесса (ENCODE_MAX_CONCURRENT), затем слот машины;
+        ожидание обоих учитывается в статистике.
+        """
+        if self.active():
+            self._local.depth += 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+
+        started = time.monotonic()
+        with provider_limits.slot("encode"):
+            handle = self._acquire()
+            waited = time.monotonic() - started
+            if waited >= WAIT_LOG_SECONDS:
+                print(f"Кодирование {name} ждало слот {waited:.1f} с")
+
+            with self._lock:
+                self._stats["encodes"] += 1
+                self._stats["active"] += 1
+                self._stats["peak"] = max(self._stats["peak"], self._stats["active"])
+                self._stats["wait_seconds"] += waited
+                self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+            self._local.depth = 1
+            try:
+                yield
+            finally:
+                self._local.depth = 0
+                with self._lock:
+                    self._stats["active"] -= 1
+                self._release(handle)
+
+    def stats(self) -> Dict[str, Any]:
+        """Слоты, потоки, число кодирований, пик одновременности и ожидание слотов в процессе"""
+        with self._lock:
+            encodes = int(self._stats["encodes"])
+            return {
+                "slots": self.slots(),
+                "threads": self.threads(),
+                "encodes": encodes,
+                "peak": int(self._stats["peak"]),
+                "wait_seconds": round(self._stats["wait_seconds"], 3),
+                "avg_wait_seconds": round(self._stats["wait_seconds"] / encodes, 3) if encodes else 0.0,
+                "max_wait_seconds": round(self._stats["max_wait_seconds"], 3)
+            }
+
+
+# Глобальный экземпляр: все локальные кодирования процесса проходят через него
+encode_scheduler = EncodeScheduler()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Generation State
+Checkpoint генерации в JSON файле: результаты завершенных этапов, задачи fal.ai
+и скачанные сегменты, чтобы упавшую генерацию можно было продолжить с --resume
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+DEFAULT_STATE_DIR = Path(__file__).parent.parent / "state"
+
+
+class GenerationState:
+    def __init__(self, generation_id: str, state_dir: Optional[str] = None):
+        """
+        Состояние генерации
+
+        Args:
+            generation_id: ID генерации, задает имя файла состояния
+            state_dir: Директория файлов состояния (по умолчанию GENERATION_STATE_DIR или state/)
+        """
+        self.generation_id = generation_id
+        self.state_dir = Path(state_dir or os.getenv('GENERATION_STATE_DIR') or DEFAULT_STATE_DIR)
+        self.path = self.state_dir / f"generation_{generation_id}.json"
+        self._lock = threading.Lock()
+        self._data: Dict[str, Any] = {}
+
+        if self.path.exists():
+            try:
+                self._data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Файл состояния {self.path} поврежден, начинаем заново: {e}")
+
+    @property
+    def exists(self) -> bool:
+        """Есть ли сохраненное состояние"""
+        return bool(self._data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.get(key, default)
+
+    def update(self, **fields):
+        """Запись результатов этапа"""
+        with self._lock:
+            self._data.update(fields)
+            self._save()
+
+    def reset(self, **fields):
+        """Новое состояние вместо сохраненного"""
+        with self._lock:
+            self._data = dict(fields)
+            self._save()
+
+    def segment(self, index: int) -> Dict[str, Any]:
+        """Сохраненные данные сегмента: request_id задачи fal.ai, url и path скачанного файла"""
+        with self._lock:
+            return dict(self._data.get("segments", {}).get(str(index), {}))
+
+    def set_segment(self, index: int, **fields):
+        """Обновление данных сегмента (вызывается из потоков очереди VEO3)"""
+        with self._lock:
+            segments = self._data.setdefault("segments", {})
+            segments.setdefault(str(index), {}).update(fields)
+            self._save()
+
+    def downloaded_segments(self) -> Dict[int, str]:
+        """Скачанные сегменты, файлы которых на месте: номер → путь"""
+        with self._lock:
+            segments = self._data.get("segments", {})
+            return {
+                int(index): segment["path"]
+                for index, segment in segments.items()
+                if segment.get("path") and Path(segment["path"]).exists()
+            }
+
+    def _save(self):
+        """Атомарная запись: временный файл и замена, чтобы падение не оставило половину JSON"""
+        self._data["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps(self._data, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Generation Worker
+Долгоживущий процесс генерации: принимает задачи в формате NDJSON через stdin
+или Unix socket и выполняет их на общем пайплайне с прогретыми клиентами
+
+Протокол:
+    Вход — по одной JSON строке на генерацию (те же данные, что и в CLI video_generator_v2.py);
+        строка с "mode": "edit" — редактирование готовой генерации (данные как у --edit).
+    Выход — JSON строки с полем generationId:
+        {"generationId": "...", "type": "output", "data": "<строка вывода генерации>"}
+        {"generationId": "...", "type": "exit", "code": 0}
+    Строки "output" совпадают с stdout отдельного процесса (INTERMEDIATE_RESULT, GENERATION_RESULT, логи).
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+import contextvars
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+from video_generator_v2 import VideoGenerationPipelineV2, load_api_keys, run_generation, run_edit
+
+DEFAULT_MAX_JOBS = 4
+
+
+class _JobChannel:
+    """Канал вывода одной задачи: отправка целыми строками (пишут несколько потоков задачи)"""
+
+    def __init__(self, sink: Callable[[str], None]):
+        self.sink = sink
+        self.buffer = ""
+        self.lock = threading.Lock()
+
+
+class _JobOutputRouter:
+    """
+    Подмена sys.stdout: вывод задачи уходит в ее канал, остальное — в stderr
+
+    Канал хранится в contextvars: asyncio задачи наследуют его автоматически, а потоки
+    пулов — только при запуске через contextvars.copy_context().run (так делают
+    Veo3JobQueue и пул хеджирования ClaudeClient). Вывод остальных потоков уходит в stderr.
+    """
+
+    def __init__(self, fallback):
+        self._fallback = fallback
+        self._channel: contextvars.ContextVar[Optional[_JobChannel]] = contextvars.ContextVar("job_channel", default=None)
+
+    def bind(self, sink: Optional[Callable[[str], None]]):
+        """Привязка текущего потока или asyncio задачи к каналу вывода задачи"""
+        self._channel.set(_JobChannel(sink) if sink is not None else None)
+
+    def write(self, text: str) -> int:
+        channel = self._channel.get()
+        if channel is None:
+            return self._fallback.write(text)
+
+        # Отправляем вывод задачи целыми строками
+        with channel.lock:
+            channel.buffer += text
+            *lines, channel.buffer = channel.buffer.split("\n")
+            for line in lines:
+                channel.sink(line)
+        return len(text)
+
+    def flush(self):
+        channel = self._channel.get()
+        if channel is not None:
+            with channel.lock:
+                if channel.buffer:
+                    channel.sink(channel.buffer)
+                    channel.buffer = ""
+        self._fallback.flush()
+
+    def isatty(self) -> bool:
+        return False
+
+
+class GenerationWorker:
+    def __init__(self, max_jobs: Optional[int] = None):
+        """
+        Воркер генераций
+
+        Args:
+            max_jobs: Максимум одновременно выполняемых генераций (по умолчанию WORKER_MAX_JOBS)
+        """
+        if max_jobs is None:
+            max_jobs = int(os.getenv('WORKER_MAX_JOBS', DEFAULT_MAX_JOBS))
+        self.max_jobs = max(1, max_jobs)
+
+        # Один пайплайн на процесс: клиенты Anthropic/fal и HTTP пулы переиспользуются между задачами
+        self.pipeline = VideoGenerationPipelineV2(load_api_keys())
+        self.executor = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix="generation")
+
+        self.output_router = _JobOutputRouter(sys.stderr)
+        sys.stdout = self.output_router
+
+    def submit(self, line: str, send: Callable[[Dict[str, Any]], None]):
+        """Разбор строки задачи и постановка генерации в пул"""
+        try:
+            generation_data = json.loads(line)
+            generation_id = generation_data['generationId']
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            send({"type": "error", "error": f"Invalid job: {e}"})
+            return
+
+        self.executor.submit(self._run_job, generation_id, generation_data, send)
+
+    def _run_job(self, generation_id: str, generation_data: Dict[str, Any], send: Callable[[Dict[str, Any]], None]):
+        """Выполнение одной генерации с перенаправлением ее вывода"""
+        self.output_router.bind(lambda data: send({"generationId": generation_id, "type": "output", "data": data}))
+        try:
+            if generation_data.get('mode') == 'edit':
+                code = run_edit(self.pipeline, generation_data)
+            else:
+                code = run_generation(self.pipeline, generation_data)
+        except Exception as e:
+            print("GENERATION_RESULT:", json.dumps({"status": "failed", "error": str(e)}, ensure_ascii=False))
+            code = 1
+        finally:
+            self.output_router.flush()
+            self.output_router.bind(None)
+
+        send({"generationId": generation_id, "type": "exit", "code": code})
+
+    def serve_stdio(self):
+        """Чтение задач из stdin, события пишутся в stdout"""
+        real_stdout = sys.__stdout__
+        lock = threading.Lock()
+
+        def send(event: Dict[str, Any]):
+            with lock:
+                real_stdout.write(json.dumps(event, ensure_ascii=False) + "\n")
+                real_stdout.flush()
+
+        for line in sys.stdin:
+            if line.strip():
+                self.submit(line, send)
+
+        # stdin закрыт — дожидаемся текущих генераций
+        self.executor.shutdown(wait=True)
+
+    def serve_socket(self, socket_path: str):
+        """Прием задач через Unix socket, события возвращаются в то же соединение"""
+        worker = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                lock = threading.Lock()
+
+                def send(event: Dict[str, Any]):
+                    with lock:
+                        try:
+                            self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+                            self.wfile.flush()
+                        except OSError:
+                            pass  # Клиент отключился, генерация продолжается
+
+                for raw_line in self.rfile:
+                    line = raw_line.decode("utf-8")
+                    if line.strip():
+                        worker.submit(line, send)
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as server:
+            server.daemon_threads = True
+            print(f"Generation worker слушает {socket_path} (до {self.max_jobs} генераций одновременно)", file=sys.stderr)
+            try:
+                server.serve_forever()
+            finally:
+                os.unlink(socket_path)
+                self.executor.shutdown(wait=True)
+
+
+def run_worker(argv):
+    """Точка входа режима воркера"""
+    parser = argparse.ArgumentParser(prog="video_generator_v2.py --worker")
+    parser.add_argument("--socket", help="Путь Unix socket (по умолчанию задачи читаются из stdin)")
+    parser.add_argument("--max-jobs", type=int, default=None, help="Максимум одновременных генераций")
+    args = parser.parse_args(argv)
+
+    worker = GenerationWorker(args.max_jobs)
+    if args.socket:
+        worker.serve_socket(args.socket)
+    else:
+        worker.serve_stdio()
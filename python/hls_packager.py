@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+HLS Packager
+Упаковка готовых MP4 в HLS с фрагментами fMP4 без перекодирования: init-файл
+с moov идет первым, дальше фрагменты по несколько секунд. Плеер начинает
+воспроизведение с первого фрагмента и перематывает без загрузки всего файла.
+
+Каталог HLS лежит рядом с исходным файлом (segment_0.mp4 → segment_0_hls/index.m3u8),
+поэтому веб-интерфейс находит его по тому же пути, что хранится в базе.
+"""
+
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from media_tools import run_ffmpeg
+
+PLAYLIST_NAME = "index.m3u8"
+INIT_NAME = "init.mp4"
+FRAGMENT_PATTERN = "part_%03d.m4s"
+FRAGMENT_SECONDS = 2
+
+
+def hls_enabled() -> bool:
+    """Упаковка в HLS включена (HLS_PACKAGING, по умолчанию true)"""
+    return os.getenv('HLS_PACKAGING', 'true').lower() == 'true'
+
+
+def hls_dir(video_path: str) -> Path:
+    """Каталог HLS для видео: рядом с файлом, <имя>_hls"""
+    path = Path(video_path)
+    return path.with_name(f"{path.stem}_hls")
+
+
+def hls_playlist(video_path: str) -> Optional[str]:
+    """Плейлист HLS видео, если он уже создан"""
+    playlist = hls_dir(video_path) / PLAYLIST_NAME
+    return str(playlist) if playlist.exists() else None
+
+
+def package_video(video_path: str) -> str:
+    """
+    VOD плейлист с фрагментами fMP4 для видео (потоки копируются без перекодирования)
+
+    Повторный вызов для неизменившегося файла ничего не делает. Каталог собирается
+    во временном и подменяется целиком, чтобы плеер не увидел плейлист без фрагментов.
+
+    Returns:
+        Путь к index.m3u8
+    """
+    source = Path(video_path)
+    target = hls_dir(video_path)
+    playlist = target / PLAYLIST_NAME
+    if playlist.exists() and playlist.stat().st_mtime >= source.stat().st_mtime:
+        return str(playlist)
+
+    temp_dir = target.with_name(f"{target.name}.tmp")
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    temp_dir.mkdir(parents=True)
+    try:
+        run_ffmpeg([
+            "-i", source, "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy",
+            "-f", "hls", "-hls_time", FRAGMENT_SECONDS, "-hls_playlist_type", "vod",
+            "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", INIT_NAME,
+            "-hls_segment_filename", temp_dir / FRAGMENT_PATTERN,
+            "-hls_flags", "independent_segments",
+            temp_dir / PLAYLIST_NAME
+        ])
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(temp_dir, target)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return str(playlist)
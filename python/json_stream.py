@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+JSON Stream Parser
+Инкрементальный разбор JSON массива объектов из потокового ответа Claude
+"""
+
+import json
+from typing import List, Dict, Any
+
+
+class JSONArrayStreamParser:
+    """
+    Выдает объекты верхнего уровня JSON массива по мере их закрытия
+
+    Текст до массива (пояснения, ```json) пропускается: массивом считается
+    первая '[' за которой следует '{'. Если объект не разбирается, выставляется
+    failed: следующие объекты сдвинуты на номер, и вызывающий разбирает полный ответ.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._array_candidate = False
+        self._depth = 0
+        self._object_start = None
+        self._in_string = False
+        self._escape = False
+        self._closed = False
+        self.failed = False
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Добавление фрагмента текста, возвращает закрывшиеся объекты"""
+        self.buffer += text
+        objects = []
+
+        while self._pos < len(self.buffer) and not self._closed:
+            char = self.buffer[self._pos]
+
+            if not self._in_array:
+                if self._array_candidate and not char.isspace():
+                    self._array_candidate = False
+                    if char == "{":
+                        self._in_array = True
+                        continue
+                if char == "[":
+                    self._array_candidate = True
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # Лишняя '}' между объектами пропускается, ']' закрывает массив
+                    if char == "]":
+                        self._closed = True
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._object_start is not None:
+                        raw = self.buffer[self._object_start:self._pos + 1]
+                        self._object_start = None
+                        try:
+                            objects.append(json.loads(raw))
+                        except json.JSONDecodeError:
+                            self.failed = True
+
+            self._pos += 1
+
+        return objects
+
+    @property
+    def closed(self) -> bool:
+        """Массив полностью получен"""
+        return self._closed
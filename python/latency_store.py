@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Latency Store
+Замеры длительности запросов Claude для порога дублирующих запросов: отдельный
+небольшой файл SQLite, общий для всех процессов генерации (кэш ответов его не касается)
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+DEFAULT_LATENCY_PATH = Path(__file__).parent.parent / "cache" / "claude_latency.sqlite"
+MAX_LATENCY_SAMPLES = 500
+
+
+class LatencyStore:
+    def __init__(self, path: Optional[str] = None, enabled: Optional[bool] = None):
+        """
+        Хранилище замеров задержки
+
+        Args:
+            path: Файл SQLite (по умолчанию CLAUDE_LATENCY_PATH или cache/claude_latency.sqlite)
+            enabled: Сохранять ли замеры в файл (CLAUDE_LATENCY_PERSIST=false — только в памяти процесса)
+        """
+        if enabled is None:
+            enabled = os.getenv('CLAUDE_LATENCY_PERSIST', 'true').lower() in ('1', 'true', 'yes')
+        self.enabled = enabled
+        self.path = Path(path or os.getenv('CLAUDE_LATENCY_PATH') or DEFAULT_LATENCY_PATH)
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение с базой замеров (создает схему при первом обращении)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS latency_samples (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            kind TEXT NOT NULL,
+                            model TEXT NOT NULL,
+                            seconds REAL NOT NULL,
+                            created_at REAL NOT NULL
+                        )
+                    """)
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_latency_kind_model ON latency_samples(kind, model, id)")
+                    conn.commit()
+                    self._initialized = True
+        return conn
+
+    def record(self, kind: str, model: str, seconds: float):
+        """Сохранение длительности успешного запроса; хранятся последние MAX_LATENCY_SAMPLES"""
+        if not self.enabled:
+            return
+
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO latency_samples (kind, model, seconds, created_at) VALUES (?, ?, ?, ?)",
+                (kind, model, seconds, time.time())
+            )
+            conn.execute(
+                "DELETE FROM latency_samples WHERE kind = ? AND model = ? AND id NOT IN "
+                "(SELECT id FROM latency_samples WHERE kind = ? AND model = ? ORDER BY id DESC LIMIT ?)",
+                (kind, model, kind, model, MAX_LATENCY_SAMPLES)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def samples(self, kind: str, model: str) -> List[float]:
+        """Последние длительности запросов данного вида, общие для всех процессов"""
+        if not self.enabled or not self.path.exists():
+            return []
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT seconds FROM latency_samples WHERE kind = ? AND model = ? ORDER BY id DESC LIMIT ?",
+                (kind, model, MAX_LATENCY_SAMPLES)
+            ).fetchall()
+            return [row[0] for row in rows]
+        finally:
+            conn.close()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Media Downloader
+Скачивание сгенерированных файлов (сегменты VEO3, аудио Resemble.ai): общий пул
+keep-alive соединений, докачка через HTTP Range после обрыва, проверка размера
+и контрольной суммы, атомарная публикация файла через временный .part
+"""
+
+import os
+import time
+import random
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_RETRIES = 4
+DEFAULT_CHUNK_KB = 64
+WRITE_BUFFER_BYTES = 1024 * 1024
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+MAX_RETRY_DELAY = 30
+
+# Коды ответа, после которых имеет смысл повторить запрос
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class _IncompleteDownload(Exception):
+    """Соединение закрылось раньше, чем пришел весь файл"""
+
+
+class MediaDownloader:
+    def __init__(self, pool_size: Optional[int] = None, retries: Optional[int] = None,
+                 chunk_kb: Optional[int] = None):
+        """
+        Загрузчик медиафайлов
+
+        Args:
+            pool_size: Размер пула соединений на хост (DOWNLOAD_POOL_SIZE)
+            retries: Повторов после обрыва или ошибки сервера (DOWNLOAD_RETRIES)
+            chunk_kb: Размер блока чтения из сети в КБ (DOWNLOAD_CHUNK_KB); при обрыве
+                теряется не больше одного блока, запись на диск буферизуется крупнее
+        """
+        self.pool_size = pool_size or int(os.getenv('DOWNLOAD_POOL_SIZE', DEFAULT_POOL_SIZE))
+        self.retries = retries if retries is not None else int(os.getenv('DOWNLOAD_RETRIES', DEFAULT_RETRIES))
+        self.chunk_bytes = (chunk_kb or int(os.getenv('DOWNLOAD_CHUNK_KB', DEFAULT_CHUNK_KB))) * 1024
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """Общая HTTP сессия с пулом соединений, создается при первом запросе"""
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def download(self, url: str, path: Path, expected_size: Optional[int] = None,
+                 sha256: Optional[str] = None) -> Path:
+        """
+        Скачивание файла с докачкой и атомарной заменой
+
+        Файл пишется в <path>.part и переименовывается только после проверки,
+        поэтому по пути path никогда не лежит недокачанный файл.
+
+        Args:
+            expected_size: Ожидаемый размер в байтах (например, file_size из ответа fal.ai)
+            sha256: Ожидаемая контрольная сумма
+
+        Returns:
+            Путь скачанного файла
+        """
+        import requests
+
+        path = Path(path)
+        part_path = path.with_name(path.name + ".part")
+        part_path.unlink(missing_ok=True)
+        total = expected_size
+        attempt = 0
+
+        while True:
+            try:
+                total = self._fetch(url, part_path, total)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                    requests.HTTPError, _IncompleteDownload) as e:
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                attempt += 1
+                if attempt > self.retries or (status is not None and status not in RETRYABLE_STATUS_CODES):
+                    part_path.unlink(missing_ok=True)
+                    raise Exception(f"Не удалось скачать {url}: {e}")
+
+                delay = random.uniform(0, min(MAX_RETRY_DELAY, 2 ** attempt))
+                received = part_path.stat().st_size if part_path.exists() else 0
+                print(f"Скачивание {path.name} прервано ({e}), продолжим с {received} байт через {delay:.1f}s")
+                time.sleep(delay)
+
+        try:
+            self._verify(part_path, total, sha256)
+        except Exception:
+            part_path.unlink(missing_ok=True)
+            raise
+
+        os.replace(part_path, path)
+        return path
+
+    def _fetch(self, url: str, part_path: Path, total: Optional[int]) -> Optional[int]:
+        """Один запрос: продолжение с конца .part файла, если сервер поддерживает Range"""
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        if offset and total is not None and offset >= total:
+            return total
+
+        # Без сжатия: смещения Range относятся к байтам файла
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+
+        with self.session.get(url, headers=headers, stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)) as response:
+            if offset and response.status_code == 416:
+                # Диапазон не принят — качаем файл заново
+                part_path.unlink(missing_ok=True)
+                raise _IncompleteDownload("сервер отклонил Range запрос")
+            response.raise_for_status()
+
+            if offset and response.status_code == 206:
+                mode = "ab"
+                content_range = response.headers.get("Content-Range", "")
+                size = content_range.rsplit("/", 1)[-1] if "/" in content_range else ""
+            else:
+                # Сервер отдал файл целиком — начинаем запись с начала
+                mode = "wb"
+                size = response.headers.get("Content-Length", "")
+            if total is None and size.isdigit():
+                total = int(size)
+
+            with open(part_path, mode, buffering=WRITE_BUFFER_BYTES) as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_bytes):
+                    f.write(chunk)
+
+        received = part_path.stat().st_size
+        if total is not None and received < total:
+            raise _IncompleteDownload(f"получено {received} из {total} байт")
+        return total
+
+    def _verify(self, part_path: Path, total: Optional[int], sha256: Optional[str]):
+        """Проверка размера и контрольной суммы скачанного файла"""
+        size = part_path.stat().st_size
+        if total is not None and size != total:
+            raise Exception(f"Размер файла {size} байт, ожидалось {total}")
+
+        if sha256:
+            digest = hashlib.sha256()
+            with open(part_path, "rb") as f:
+                for block in iter(lambda: f.read(WRITE_BUFFER_BYTES), b""):
+                    digest.update(block)
+            if digest.hexdigest() != sha256.lower():
+                raise Exception(f"Контрольная сумма файла не совпадает: {digest.hexdigest()}")
+
+
+# Общий загрузчик процесса: пул соединений переиспользуется всеми генерациями
+media_downloader = MediaDownloader()
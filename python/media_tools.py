@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Media Tools
+Утилиты ffmpeg/ffprobe: анализ параметров сегментов, склейка без перекодирования
+и замена аудио дорожки без перекодирования видео
+"""
+
+import os
+import re
+import json
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from encode_scheduler import encode_scheduler
+
+
+def get_ffmpeg_binary() -> str:
+    """Путь к ffmpeg: FFMPEG_BINARY, системный ffmpeg или бинарник imageio-ffmpeg (ставится с moviepy)"""
+    binary = os.getenv('FFMPEG_BINARY') or shutil.which('ffmpeg')
+    if binary:
+        return binary
+
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def get_ffprobe_binary() -> Optional[str]:
+    """Путь к ffprobe, если он доступен"""
+    return os.getenv('FFPROBE_BINARY') or shutil.which('ffprobe')
+
+
+def run_ffmpeg(args: List[str]) -> subprocess.CompletedProcess:
+    """
+    Запуск ffmpeg с перезаписью выходных файлов, ошибка при ненулевом коде
+
+    Внутри слота кодирования (encode_scheduler) команда запускается с пониженным
+    приоритетом, а потоки фильтров ограничены лимитом потоков на кодирование.
+    """
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error", "-y"]
+    if encode_scheduler.active():
+        threads = str(encode_scheduler.threads())
+        cmd = encode_scheduler.priority_prefix() + cmd + ["-filter_threads", threads, "-filter_complex_threads", threads]
+    cmd += [str(arg) for arg in args]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg error: {result.stderr.strip()[-2000:]}")
+    return result
+
+
+_encoders: Optional[set] = None
+
+
+def has_encoder(name: str) -> bool:
+    """Есть ли кодировщик в сборке ffmpeg (список читается один раз за процесс)"""
+    global _encoders
+    if _encoders is None:
+        result = subprocess.run([get_ffmpeg_binary(), "-hide_banner", "-encoders"], capture_output=True, text=True)
+        # Список кодировщиков идет после строки " ------" с легендой флагов
+        listing = result.stdout.split(" ------", 1)[-1]
+        _encoders = {line.split()[1] for line in listing.splitlines() if len(line.split()) > 1}
+    return name in _encoders
+
+
+def probe_media(path: str) -> Dict[str, Any]:
+    """
+    Параметры потоков медиафайла
+
+    Returns:
+        Словарь с duration, video (codec, profile, width, height, pix_fmt, fps, time_base)
+        и audio (codec, sample_rate, channels); отсутствующий поток — None
+    """
+    ffprobe = get_ffprobe_binary()
+    if ffprobe:
+        return _probe_with_ffprobe(ffprobe, path)
+    return _probe_with_ffmpeg(path)
+
+
+def _probe_with_ffprobe(ffprobe: str, path: str) -> Dict[str, Any]:
+    """Анализ файла через ffprobe (JSON вывод)"""
+    result = subprocess.run(
+        [ffprobe, "-v", "error", "-show_streams", "-show_format", "-of", "json", str(path)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise Exception(f"ffprobe error: {result.stderr.strip()}")
+
+    data = json.loads(result.stdout)
+    info = {
+        "duration": float(data.get("format", {}).get("duration", 0) or 0),
+        "video": None,
+        "audio": None
+    }
+
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and info["video"] is None:
+            info["video"] = {
+                "codec": stream.get("codec_name"),
+                "profile": stream.get("profile"),
+                "width": stream.get("width"),
+                "height": stream.get("height"),
+                "pix_fmt": stream.get("pix_fmt"),
+                "fps": stream.get("r_frame_rate"),
+                "time_base": stream.get("time_base")
+            }
+        elif stream.get("codec_type") == "audio" and info["audio"] is None:
+            info["audio"] = {
+                "codec": stream.get("codec_name"),
+                "sample_rate": int(stream.get("sample_rate", 0) or 0),
+                "channels": stream.get("channels")
+            }
+
+    return info
+
+
+def _probe_with_ffmpeg(path: str) -> Dict[str, Any]:
+    """Анализ файла по выводу `ffmpeg -i`, когда ffprobe недоступен"""
+    result = subprocess.run([get_ffmpeg_binary(), "-hide_banner", "-i", str(path)], capture_output=True, text=True)
+    output = result.stderr
+    info = {"duration": 0.0, "video": None, "audio": None}
+
+    duration_match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', output)
+    if duration_match:
+        hours, minutes, seconds = duration_match.groups()
+        info["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    video_match = re.search(r'Stream #\S+.*?: Video: (\w+)(?: \(([^)]*)\))?.*?, (\w+)(?:\([^)]*\))?, (\d+)x(\d+)', output)
+    if video_match:
+        fps_match = re.search(r'Video:.*?, ([\d.]+) fps', output)
+        tbn_match = re.search(r'Video:.*?, ([\d.]+k?) tbn', output)
+        info["video"] = {
+            "codec": video_match.group(1),
+            "profile": video_match.group(2),
+            "width": int(video_match.group(4)),
+            "height": int(video_match.group(5)),
+            "pix_fmt": video_match.group(3),
+            "fps": fps_match.group(1) if fps_match else None,
+            "time_base": tbn_match.group(1) if tbn_match else None
+        }
+
+    audio_match = re.search(r'Stream #\S+.*?: Audio: (\w+).*?, (\d+) Hz, ([^,]+)', output)
+    if audio_match:
+        info["audio"] = {
+            "codec": audio_match.group(1),
+            "sample_rate": int(audio_match.group(2)),
+            "channels": audio_match.group(3).strip()
+        }
+
+    if info["video"] is None and info["audio"] is None:
+        raise Exception(f"Не удалось определить параметры файла: {path}")
+
+    return info
+
+
+def probe_video_frames(path: str) -> Dict[str, Any]:
+    """
+    Ключевые кадры и точная длительность видео потока (без декодирования всего файла)
+
+    Returns:
+        keyframes — время ключевых кадров в секундах от начала потока, duration — длительность видео
+    """
+    ffprobe = get_ffprobe_binary()
+    if ffprobe:
+        result = subprocess.run(
+            [ffprobe, "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "packet=pts_time,duration_time,flags", "-of", "json", str(path)],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise Exception(f"ffprobe error: {result.stderr.strip()}")
+        packets = [p for p in json.loads(result.stdout).get("packets", []) if p.get("pts_time") not in (None, "N/A")]
+        if not packets:
+            raise Exception(f"Видео поток не найден: {path}")
+        start = min(float(p["pts_time"]) for p in packets)
+        keyframes = sorted(float(p["pts_time"]) - start for p in packets if "K" in p.get("flags", ""))
+        end = max(float(p["pts_time"]) + float(p.get("duration_time") or 0) for p in packets)
+        return {"keyframes": keyframes, "duration": end - start}
+
+    return _probe_video_frames_with_ffmpeg(path)
+
+
+def _probe_video_frames_with_ffmpeg(path: str) -> Dict[str, Any]:
+    """Ключевые кадры через декодирование только их (showinfo), длительность — по пакетам framemd5"""
+    binary = get_ffmpeg_binary()
+    result = subprocess.run(
+        [binary, "-hide_banner", "-nostdin", "-skip_frame", "nokey", "-i", str(path),
+         "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg error: {result.stderr.strip()[-2000:]}")
+    keyframes = [float(value) for value in re.findall(r'pts_time:\s*(-?[\d.]+)', result.stderr)]
+
+    result = subprocess.run(
+        [binary, "-hide_banner", "-nostdin", "-loglevel", "error", "-i", str(path),
+         "-map", "0:v:0", "-c", "copy", "-f", "framemd5", "-"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg error: {result.stderr.strip()[-2000:]}")
+    time_base_match = re.search(r'^#tb 0: (\d+)/(\d+)', result.stdout, re.MULTILINE)
+    packets = [line.split(",") for line in result.stdout.splitlines() if line and not line.startswith("#")]
+    if not time_base_match or not packets or not keyframes:
+        raise Exception(f"Видео поток не найден: {path}")
+
+    time_base = int(time_base_match.group(1)) / int(time_base_match.group(2))
+    pts = [int(packet[2]) for packet in packets]
+    start = min(pts)
+    end = max(int(packet[2]) + int(packet[3]) for packet in packets)
+    first_key = keyframes[0]
+    return {
+        "keyframes": sorted(key - first_key for key in keyframes),
+        "duration": (end - start) * time_base
+    }
+
+
+def _stream_signature(info: Dict[str, Any]) -> tuple:
+    """Параметры, которые должны совпадать у сегментов для склейки без перекодирования"""
+    video = info.get("video") or {}
+    audio = info.get("audio") or {}
+    return (
+        video.get("codec"), video.get("profile"), video.get("width"), video.get("height"),
+        video.get("pix_fmt"), video.get("fps"), video.get("time_base"),
+        bool(info.get("audio")), audio.get("codec"), audio.get("sample_rate"), audio.get("channels")
+    )
+
+
+def segments_compatible(video_paths: List[str]) -> bool:
+    """Проверка, что все сегменты имеют одинаковые кодеки, разрешение и частоту кадров"""
+    if not video_paths:
+        return False
+
+    try:
+        signatures = {_stream_signature(probe_media(path)) for path in video_paths}
+    except Exception as e:
+        print(f"Не удалось проанализировать сегменты: {e}")
+        return False
+
+    if len(signatures) != 1:
+        return False
+
+    signature = signatures.pop()
+    return signature[0] is not None
+
+
+def _escape_concat_path(path: str) -> str:
+    """Экранирование пути для списка concat demuxer"""
+    return str(Path(path).resolve()).replace("'", "'\\''")
+
+
+def concat_stream_copy(video_paths: List[str], output_path: str):
+    """Склейка совместимых сегментов через concat demuxer без перекодирования"""
+    with tempfile.TemporaryDirectory(dir=Path(output_path).parent) as temp_dir:
+        list_path = Path(temp_dir) / "segments.txt"
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in video_paths:
+                f.write(f"file '{_escape_concat_path(path)}'\n")
+
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-map", "0", "-c", "copy",
+            "-movflags", "+faststart",
+            output_path
+        ])
+
+
+def extract_audio(video_path: str, audio_path: str, codec: str = "pcm_s16le"):
+    """Извлечение первой аудио дорожки без декодирования видео кадров (по умолчанию в WAV)"""
+    run_ffmpeg([
+        "-i", video_path,
+        "-map", "0:a:0", "-vn",
+        "-c:a", codec,
+        audio_path
+    ])
+
+
+def replace_audio(video_path: str, audio_path: str, output_path: str, audio_bitrate: str = "192k"):
+    """Замена аудио дорожки: видео поток копируется как есть, кодируется только звук в AAC"""
+    run_ffmpeg([
+        "-i", video_path, "-i", audio_path,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c:v", "copy",
+        "-c:a", "aac", "-b:a", audio_bitrate,
+        "-movflags", "+faststart",
+        output_path
+    ])
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Post Production
+Постобработка финального видео одним проходом ffmpeg: склейка сегментов, нормализация
+громкости, вшитые субтитры из диалогов промптов VEO3 и логотип клиента описываются
+одним графом фильтров и кодируются один раз
+"""
+
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from media_tools import probe_media, run_ffmpeg
+from encode_scheduler import encode_scheduler
+from renditions import plan_renditions, rendition_graph
+
+RENDER_CRF = 20
+AUDIO_SAMPLE_RATE = 48000
+AUDIO_BITRATE = "192k"
+
+DEFAULT_TARGET_LUFS = -14.0
+DEFAULT_CEILING_DB = -1.0
+LOUDNESS_RANGE = 11
+
+# Высота логотипа относительно кадра и отступ от края в пикселях
+LOGO_HEIGHT_RATIO = 0.08
+LOGO_MARGIN = 24
+LOGO_OPACITY = 0.85
+LOGO_POSITIONS = {
+    "top-left": (f"{LOGO_MARGIN}", f"{LOGO_MARGIN}"),
+    "top-right": (f"W-w-{LOGO_MARGIN}", f"{LOGO_MARGIN}"),
+    "bottom-left": (f"{LOGO_MARGIN}", f"H-h-{LOGO_MARGIN}"),
+    "bottom-right": (f"W-w-{LOGO_MARGIN}", f"H-h-{LOGO_MARGIN}"),
+}
+
+SUBTITLE_STYLE = "FontName=Arial,FontSize=14,Outline=2,Shadow=0,MarginV=40"
+
+DIALOGUE_PATTERN = re.compile(r'^\s*Dialogue\s*:\s*(.+)$', re.IGNORECASE | re.MULTILINE)
+
+
+def post_production_mode() -> str:
+    """
+    Режим постобработки (POST_PRODUCTION):
+    auto — только если запрошены субтитры или логотип, always — всегда (нормализация громкости), off
+    """
+    return os.getenv('POST_PRODUCTION', 'auto').lower()
+
+
+def subtitles_enabled() -> bool:
+    return os.getenv('BURN_SUBTITLES', 'false').lower() == 'true'
+
+
+def extract_dialogue(prompt_text: str) -> str:
+    """Реплика из строки "Dialogue:" промпта VEO3 без кавычек"""
+    match = DIALOGUE_PATTERN.search(prompt_text or "")
+    if not match:
+        return ""
+    dialogue = match.group(1).strip().strip('"“”«»\'').strip()
+    # Шаблон без заполнения ("[Natural ... speech]") не является репликой
+    return "" if dialogue.startswith("[") and dialogue.endswith("]") else dialogue
+
+
+def find_logo(client_profile: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Логотип клиента: logoUrl профиля или stylePreferences.logo (путь или URL)"""
+    if not client_profile:
+        return None
+    style_preferences = client_profile.get('stylePreferences') or {}
+    if not isinstance(style_preferences, dict):
+        style_preferences = {}
+    return client_profile.get('logoUrl') or style_preferences.get('logo') or None
+
+
+def logo_position(client_profile: Optional[Dict[str, Any]]) -> str:
+    style_preferences = (client_profile or {}).get('stylePreferences') or {}
+    if not isinstance(style_preferences, dict):
+        style_preferences = {}
+    position = style_preferences.get('logoPosition') or os.getenv('LOGO_POSITION', 'top-right')
+    return position if position in LOGO_POSITIONS else 'top-right'
+
+
+def needs_post_production(prompts: Optional[List[Dict[str, Any]]], client_profile: Optional[Dict[str, Any]]) -> bool:
+    """Нужен ли проход постобработки вместо склейки без перекодирования"""
+    mode = post_production_mode()
+    if mode == "off":
+        return False
+    if mode == "always":
+        return True
+    has_dialogue = subtitles_enabled() and any(extract_dialogue(p.get("prompt", "")) for p in prompts or [])
+    return has_dialogue or find_logo(client_profile) is not None
+
+
+def _format_srt_time(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def write_subtitles(prompts: List[Dict[str, Any]], durations: List[float], srt_path: Path,
+                    transition: float = 0.0) -> bool:
+    """
+    SRT из диалогов промптов: реплика сегмента показывается на всем его отрезке
+    (с crossfade следующий сегмент начинается раньше на transition секунд)
+
+    Returns:
+        True, если записана хотя бы одна реплика
+    """
+    entries = []
+    start = 0.0
+    count = min(len(prompts), len(durations))
+    for i, (prompt, duration) in enumerate(zip(prompts, durations)):
+        length = duration - transition if i < count - 1 else duration
+        dialogue = extract_dialogue(prompt.get("prompt", ""))
+        if dialogue:
+            entries.append((start, start + length, dialogue))
+        start += length
+
+    if not entries:
+        return False
+
+    with open(srt_path, "w", encoding="utf-8") as f:
+        for number, (begin, end, text) in enumerate(entries, start=1):
+            f.write(f"{number}\n{_format_srt_time(begin)} --> {_format_srt_time(end)}\n{text}\n\n")
+    return True
+
+
+def _escape_filter_path(path: Path) -> str:
+    """Экранирование пути дважды: для значения опции фильтра и для строки графа"""
+    value = str(Path(path).resolve()).replace("\\", "/")
+    for char in ("'", ":"):
+        value = value.replace(char, "\\" + char)
+    value = value.replace("\\", "\\\\")
+    for char in ("'", "[", "]", ",", ";"):
+        value = value.replace(char, "\\" + char)
+    return value
+
+
+def audio_chain(index: int, info: Dict[str, Any]) -> str:
+    """Звук сегмента в общем формате; для сегмента без звука — тишина той же длительности"""
+    if info.get("audio"):
+        return f"[{index}:a]aresample={AUDIO_SAMPLE_RATE},aformat=sample_fmts=fltp:channel_layouts=stereo[a{index}]"
+    return (f"aevalsrc=0:channel_layout=stereo:sample_rate={AUDIO_SAMPLE_RATE}:d={info['duration']:.3f},"
+            f"aformat=sample_fmts=fltp[a{index}]")
+
+
+def crossfade_chains(durations: List[float], transition: float, video: bool = True) -> List[str]:
+    """
+    Цепочка xfade/acrossfade по входам [v0].. и [a0].., выходы [vcat] и [acat]
+
+    Каждый стык перекрывает конец сегмента и начало следующего на transition секунд.
+    """
+    chains = []
+    count = len(durations)
+    if count == 1:
+        return (["[v0]null[vcat]"] if video else []) + ["[a0]anull[acat]"]
+
+    length = durations[0]
+    for k in range(1, count):
+        target = "cat" if k == count - 1 else f"x{k}"
+        previous = "0" if k == 1 else f"x{k - 1}"
+        if video:
+            chains.append(f"[v{previous}][v{k}]xfade=transition=fade:duration={transition:.3f}"
+                          f":offset={length - transition:.3f}[v{target}]")
+        chains.append(f"[a{previous}][a{k}]acrossfade=d={transition:.3f}:c1=tri:c2=tri[a{target}]")
+        length += durations[k] - transition
+    return chains
+
+
+def build_filter_graph(segments: List[Dict[str, Any]], width: int, height: int, fps: str,
+                       subtitles_path: Optional[Path] = None, logo_input: Optional[int] = None,
+                       position: str = "top-right", loudness: Optional[Dict[str, float]] = None,
+                       transition: float = 0.0) -> str:
+    """
+    Граф фильтров постобработки
+
+    Каждый сегмент приводится к общему кадру и формату звука, затем concat (или
+    crossfade на стыках), субтитры и логотип над видео, loudnorm над звуком.
+    Выходы графа — [vout] и [aout].
+
+    Args:
+        segments: Параметры сегментов из probe_media (нужны duration и audio)
+        logo_input: Номер входа ffmpeg с логотипом
+        loudness: Целевые I (LUFS) и TP (dBTP); None — без нормализации
+        transition: Длительность crossfade на стыках в секундах; 0 — склейка встык
+    """
+    chains = []
+    concat_inputs = ""
+    for i, info in enumerate(segments):
+        # При crossfade сегменты перед стыком дополняются копиями последнего кадра:
+        # xfade не оборвется, если видео короче длительности контейнера
+        pad = ""
+        if transition and i < len(segments) - 1:
+            pad = f",tpad=stop_mode=clone:stop_duration={transition:.3f}"
+        chains.append(
+            f"[{i}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format=yuv420p{pad}[v{i}]"
+        )
+        chains.append(audio_chain(i, info))
+        concat_inputs += f"[v{i}][a{i}]"
+
+    if transition:
+        chains += crossfade_chains([info["duration"] for info in segments], transition)
+    else:
+        chains.append(f"{concat_inputs}concat=n={len(segments)}:v=1:a=1[vcat][acat]")
+
+    video = "vcat"
+    if subtitles_path is not None:
+        chains.append(f"[{video}]subtitles=filename={_escape_filter_path(subtitles_path)}"
+                      f":force_style='{SUBTITLE_STYLE}'[vsub]")
+        video = "vsub"
+    if logo_input is not None:
+        x, y = LOGO_POSITIONS[position]
+        logo_height = max(2, int(height * LOGO_HEIGHT_RATIO) // 2 * 2)
+        chains.append(f"[{logo_input}:v]scale=-2:{logo_height},format=rgba,"
+                      f"colorchannelmixer=aa={LOGO_OPACITY}[logo]")
+        chains.append(f"[{video}][logo]overlay={x}:{y}:format=auto[vlogo]")
+        video = "vlogo"
+    chains.append(f"[{video}]null[vout]")
+
+    if loudness is not None:
+        # loudnorm работает на 192 кГц — возвращаем частоту дискретизации после нормализации
+        chains.append(f"[acat]loudnorm=I={loudness['target_lufs']}:TP={loudness['ceiling_db']}:LRA={LOUDNESS_RANGE},"
+                      f"aresample={AUDIO_SAMPLE_RATE}[aout]")
+    else:
+        chains.append("[acat]anull[aout]")
+
+    return ";\n".join(chains)
+
+
+def _parse_dimension(info: Dict[str, Any]) -> tuple:
+    """Размер кадра и частота кадров первого сегмента — формат выходного видео"""
+    video = info.get("video") or {}
+    width, height = video.get("width"), video.get("height")
+    if not width or not height:
+        raise Exception("Не удалось определить размер кадра сегмента")
+    fps = video.get("fps") or "24"
+    return int(width) // 2 * 2, int(height) // 2 * 2, str(fps)
+
+
+def _prepare_logo(logo: str, work_dir: Path) -> Path:
+    """Локальный путь логотипа: URL скачивается во временную директорию"""
+    if logo.startswith(("http://", "https://")):
+        from media_downloader import media_downloader
+        suffix = Path(logo.split("?", 1)[0]).suffix or ".png"
+        return media_downloader.download(logo, work_dir / f"logo{suffix}")
+
+    logo_path = Path(logo)
+    if not logo_path.exists():
+        raise Exception(f"Логотип не найден: {logo}")
+    return logo_path
+
+
+def render(video_paths: List[str], output_path: str, prompts: Optional[List[Dict[str, Any]]] = None,
+           client_profile: Optional[Dict[str, Any]] = None, transition: float = 0.0,
+           renditions: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+    """
+    Склейка с постобработкой за одно кодирование
+
+    Субтитры (BURN_SUBTITLES) берутся из диалогов prompts, логотип — из профиля клиента,
+    громкость нормализуется к AUDIO_TARGET_LUFS / AUDIO_CEILING_DB, стыки сегментов —
+    crossfade длительностью transition. Рядом с видео сохраняется SRT, если в промптах есть реплики.
+    Версии renditions (rendition_specs) кодируются тем же проходом из тех же кадров.
+
+    Returns:
+        Примененные шаги: subtitles (путь SRT или None), logo, loudnorm, transition, renditions (планы версий)
+    """
+    segments = [probe_media(path) for path in video_paths]
+    width, height, fps = _parse_dimension(segments[0])
+    output = Path(output_path)
+
+    steps = {"subtitles": None, "burned_subtitles": False, "logo": None, "loudnorm": None,
+             "transition": transition, "renditions": plan_renditions(renditions or [], width, height)}
+    srt_path = output.with_suffix(".srt")
+    if prompts and write_subtitles(prompts, [info["duration"] for info in segments], srt_path, transition):
+        steps["subtitles"] = str(srt_path)
+
+    with tempfile.TemporaryDirectory(dir=output.parent) as temp_dir:
+        inputs: List[str] = []
+        for path in video_paths:
+            inputs += ["-i", path]
+
+        logo_input = None
+        logo = find_logo(client_profile)
+        if logo:
+            try:
+                inputs += ["-i", str(_prepare_logo(logo, Path(temp_dir)))]
+                logo_input = len(video_paths)
+                steps["logo"] = logo
+            except Exception as e:
+                print(f"Логотип пропущен: {e}")
+
+        steps["loudnorm"] = {
+            "target_lufs": float(os.getenv('AUDIO_TARGET_LUFS', DEFAULT_TARGET_LUFS)),
+            "ceiling_db": float(os.getenv('AUDIO_CEILING_DB', DEFAULT_CEILING_DB)),
+        }
+        steps["burned_subtitles"] = bool(steps["subtitles"]) and subtitles_enabled()
+
+        graph = build_filter_graph(
+            segments, width, height, fps,
+            subtitles_path=srt_path if steps["burned_subtitles"] else None,
+            logo_input=logo_input, position=logo_position(client_profile),
+            loudness=steps["loudnorm"], transition=transition
+        )
+        master_video, master_audio, outputs = "vout", "aout", []
+        if steps["renditions"]:
+            master_video, master_audio = "vmain", "amain"
+            chains, outputs = rendition_graph("vout", "aout", steps["renditions"], output,
+                                              master_labels=(master_video, master_audio))
+            graph += ";\n" + ";\n".join(chains)
+
+        # Длинный граф передается файлом, а не аргументом командной строки
+        graph_path = Path(temp_dir) / "graph.txt"
+        graph_path.write_text(graph, encoding="utf-8")
+
+        run_ffmpeg(inputs + [
+            "-filter_complex_script", graph_path,
+            "-map", f"[{master_video}]", "-map", f"[{master_audio}]",
+            "-c:v", "libx264", *encode_scheduler.x264_args(), "-crf", RENDER_CRF, "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-b:a", AUDIO_BITRATE,
+            "-movflags", "+faststart",
+            output
+        ] + outputs)
+
+    return steps
@@ -155,7 +155,7 @@ Create the timing breakdown now:"""
         return prompt
 
     def build_scenario_prompt_with_client(self, domain_description: str, product_data: Dict[str, Any], 
-                                         client_profile: Dict[str, Any], user_input: str = "") -> str:
+                                         client_profile: Dict[str, Any], user_input: str = "") -> Dict[str, Any]:
         """Создает промпт для генерации сценария с учетом профиля клиента"""
         
         lang_config = self.language_configs.get(self.language, self.language_configs["Portuguese"])
@@ -166,7 +166,7 @@ Create the timing breakdown now:"""
         # Форматируем профиль клиента
         client_description = self._format_client_profile(client_profile)
         
-        prompt = f"""You are an expert content strategist creating compelling video scenarios for {client_profile['companyName']}.
+        system = f"""You are an expert content strategist creating compelling video scenarios for {client_profile['companyName']}.
 
 VIDEO LANGUAGE REQUIREMENTS:
 - All dialogue, speech, and spoken content in the video MUST be in {self.language}
@@ -180,20 +180,14 @@ IMPORTANT: Write the scenario description in English, but all dialogue examples
 CLIENT PROFILE:
 {client_description}
 
-PRODUCT CONTEXT:
-{product_description}
-
 DOMAIN STYLE AND CONTEXT:
 {domain_description}
 
-USER REQUIREMENTS:
-{user_input if user_input else "No specific requirements provided"}
-
 CONTENT STRATEGY: {client_profile['contentStrategy']}
 TONE OF VOICE: {client_profile['toneOfVoice']}
 
 YOUR TASK:
-Create a detailed video scenario that aligns with {client_profile['companyName']}'s brand values and content strategy.
+Create a detailed video scenario for the product and user requirements given in the request that aligns with {client_profile['companyName']}'s brand values and content strategy.
 
 The scenario should:
 1. Reflect the {client_profile['contentStrategy']} content strategy
@@ -201,19 +195,27 @@ The scenario should:
 3. Appeal to the target audience: {', '.join(client_profile['targetAudience'])}
 4. Showcase the brand values: {', '.join(client_profile['brandValues'])}
 5. Integrate the product naturally in the context
-6. Match the domain style and mood
+6. Match the domain style and mood"""
+
+        content = f"""PRODUCT CONTEXT:
+{product_description}
+
+USER REQUIREMENTS:
+{user_input if user_input else "No specific requirements provided"}
 
 Create the scenario now:"""
 
-        return prompt
+        return self._structured_prompt(system, content)
 
     def build_timing_prompt_with_client(self, scenario: str, domain_data: Dict[str, Any], 
-                                       client_profile: Dict[str, Any], selected_duration: int, language: str) -> str:
+                                       client_profile: Dict[str, Any], selected_duration: int, language: str,
+                                       domain_description: str = "") -> Dict[str, Any]:
         """Создает промпт для определения тайминга с учетом профиля клиента"""
         
         lang_config = self.language_configs.get(self.language, self.language_configs["Portuguese"])
+        client_description = self._format_client_profile(client_profile)
         
-        prompt = f"""You are a video timing specialist optimizing scenarios for {client_profile['companyName']}'s content strategy.
+        system = f"""You are a video timing specialist optimizing scenarios for {client_profile['companyName']}'s content strategy.
 
 VIDEO LANGUAGE: {self.language}
 - All spoken content in the video will be in {self.language}
@@ -227,14 +229,14 @@ CLIENT CONTEXT:
 - Tone: {client_profile['toneOfVoice']}
 - Target Audience: {', '.join(client_profile['targetAudience'])}
 
-SCENARIO TO ANALYZE:
-{scenario}
+CLIENT PROFILE:
+{client_description}
 
 DOMAIN CONTEXT: {domain_data.get('key', 'unknown')}
-PRE-SELECTED DURATION: {selected_duration} seconds
+{domain_description}
 
 YOUR TASK:
-Create a detailed timing breakdown for the {selected_duration}-second video that aligns with {client_profile['companyName']}'s brand strategy.
+Create a detailed timing breakdown for the scenario and pre-selected duration given in the request that aligns with {client_profile['companyName']}'s brand strategy.
 
 CONTENT STRATEGY ALIGNMENT:
 - {client_profile['contentStrategy']}: Adapt timing to match this strategy
@@ -242,7 +244,7 @@ CONTENT STRATEGY ALIGNMENT:
 - Visual style should reflect {client_profile.get('stylePreferences', {}).get('videoStyle', 'amateur')} approach
 
 REQUIREMENTS:
-1. Break down the scenario into {selected_duration // 8} segments of 8 seconds each
+1. Break down the scenario into segments of 8 seconds each
 2. Ensure each segment advances the story for {client_profile['companyName']}
 3. Plan natural cut points and camera angles
 4. Keep dialogue authentic in {self.language}
@@ -257,20 +259,28 @@ SEGMENT 1 (0-8s):
 - Dialogue in {self.language} (max 15 words)
 - Brand alignment with {client_profile['companyName']}
 
-[Continue for each 8-second segment...]
+[Continue for each 8-second segment...]"""
+
+        content = f"""SCENARIO TO ANALYZE:
+{scenario}
+
+PRE-SELECTED DURATION: {selected_duration} seconds
+Break down the scenario into {selected_duration // 8} segments of 8 seconds each.
 
 Create the timing breakdown now:"""
 
-        return prompt
+        return self._structured_prompt(system, content)
 
     def build_veo3_prompt_with_client(self, scenario: str, timing_breakdown: str, camera_style: str, 
-                                    client_profile: Dict[str, Any], language: str) -> str:
+                                    client_profile: Dict[str, Any], language: str,
+                                    domain_description: str = "") -> Dict[str, Any]:
         """Создает промпт для VEO3 с учетом профиля клиента"""
         
         lang_config = self.language_configs.get(self.language, self.language_configs["Portuguese"])
         style_prefs = client_profile.get('stylePreferences', {})
+        client_description = self._format_client_profile(client_profile)
         
-        prompt = f"""You are a VEO3 prompt specialist creating video generation prompts for {client_profile['companyName']}.
+        system = f"""You are a VEO3 prompt specialist creating video generation prompts for {client_profile['companyName']}.
 
 LANGUAGE: {self.language}
 - {lang_config['voice_instruction']}
@@ -285,16 +295,16 @@ CLIENT BRAND CONTEXT:
 - Lighting: {style_prefs.get('lighting', 'natural')}
 - Color Palette: {style_prefs.get('colorPalette', 'vibrant')}
 
-SCENARIO:
-{scenario}
+CLIENT PROFILE:
+{client_description}
 
-TIMING BREAKDOWN:
-{timing_breakdown}
+DOMAIN STYLE AND CONTEXT:
+{domain_description}
 
 CAMERA STYLE: {camera_style}
 
 YOUR TASK:
-Convert the scenario into precise VEO3 prompts that reflect {client_profile['companyName']}'s brand identity and visual preferences.
+Convert the scenario and timing breakdown given in the request into precise VEO3 prompts that reflect {client_profile['companyName']}'s brand identity and visual preferences.
 
 OUTPUT FORMAT:
 Return a JSON array of prompts that maintain brand consistency:
@@ -309,11 +319,17 @@ Return a JSON array of prompts that maintain brand consistency:
   }}
 ]
 
-Ensure the content aligns with {client_profile['companyName']}'s {client_profile['contentStrategy']} strategy and {client_profile['toneOfVoice']} tone.
+Ensure the content aligns with {client_profile['companyName']}'s {client_profile['contentStrategy']} strategy and {client_profile['toneOfVoice']} tone."""
+
+        content = f"""SCENARIO:
+{scenario}
+
+TIMING BREAKDOWN:
+{timing_breakdown}
 
 Create the VEO3 prompts now:"""
 
-        return prompt
+        return self._structured_prompt(system, content)
 
     def build_veo3_prompt(self, scenario: str, timing_breakdown: str, camera_style: str, language: str) -> str:
         """Создает промпт для генерации VEO3 промптов"""
@@ -368,6 +384,18 @@ Create the VEO3 prompts now:"""
 
         return prompt
 
+    def _structured_prompt(self, system: str, content: str) -> Dict[str, Any]:
+        """
+        Промпт из стабильной и переменной частей
+
+        Стабильный префикс (инструкции, профиль клиента, домен) уходит в system
+        и помечается для серверного кэширования промптов Anthropic.
+        """
+        return {
+            "system": [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}],
+            "content": [{"type": "text", "text": content}]
+        }
+
     def _format_product_description(self, product_data: Dict[str, Any]) -> str:
         """Форматирует описание продукта для промпта"""
         
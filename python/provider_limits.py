@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Provider Limits
+Ограничение числа одновременных обращений к внешним сервисам и локальных кодирований
+в пределах процесса: Claude, задачи VEO3, ffmpeg/moviepy
+
+Потоки занимают слоты через slot(), корутины — через aslot(): у каждого event loop
+свой асинхронный семафор с тем же лимитом (пайплайн asyncio ведет все генерации на одном loop).
+"""
+
+import os
+import time
+import weakref
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, Optional, Iterator, AsyncIterator
+
+# Переменные окружения с лимитами; пустое значение или 0 — без ограничения
+PROVIDER_LIMIT_ENV = {
+    "claude": "CLAUDE_MAX_CONCURRENT",
+    "veo3": "VEO3_MAX_CONCURRENT",
+    "encode": "ENCODE_MAX_CONCURRENT",
+}
+
+
+class ProviderLimits:
+    def __init__(self):
+        """Семафоры провайдеров, создаются при первом обращении с лимитом из окружения"""
+        self._lock = threading.Lock()
+        self._limits: Dict[str, Optional[int]] = {}
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        # Асинхронные семафоры по event loop: семафор asyncio привязан к своему loop
+        self._async_semaphores: "weakref.WeakKeyDictionary[Any, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def configure(self, provider: str, limit: Optional[int]):
+        """Явная установка лимита (None или 0 — без ограничения); действует для следующих слотов"""
+        with self._lock:
+            self._limits[provider] = limit if limit and limit > 0 else None
+            self._semaphores.pop(provider, None)
+            for semaphores in self._async_semaphores.values():
+                semaphores.pop(provider, None)
+
+    def limit(self, provider: str) -> Optional[int]:
+        """Текущий лимит провайдера"""
+        with self._lock:
+            return self._resolve(provider)
+
+    def _resolve(self, provider: str) -> Optional[int]:
+        if provider not in self._limits:
+            value = os.getenv(PROVIDER_LIMIT_ENV.get(provider, ""), "")
+            self._limits[provider] = int(value) if value.strip() and int(value) > 0 else None
+        return self._limits[provider]
+
+    @contextmanager
+    def slot(self, provider: str) -> Iterator[None]:
+        """Занять слот провайдера на время вызова (ожидание учитывается в статистике)"""
+        with self._lock:
+            limit = self._resolve(provider)
+            semaphore = None
+            if limit is not None:
+                semaphore = self._semaphores.get(provider)
+                if semaphore is None:
+                    semaphore = self._semaphores[provider] = threading.BoundedSemaphore(limit)
+
+        started = time.monotonic()
+        if semaphore is not None:
+            semaphore.acquire()
+        self._enter(provider, time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._exit(provider)
+            if semaphore is not None:
+                semaphore.release()
+
+    @asynccontextmanager
+    async def aslot(self, provider: str) -> AsyncIterator[None]:
+        """Слот провайдера для корутины: ожидание не блокирует event loop"""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            limit = self._resolve(provider)
+            semaphore = None
+            if limit is not None:
+                semaphores = self._async_semaphores.setdefault(loop, {})
+                semaphore = semaphores.get(provider)
+                if semaphore is None:
+                    semaphore = semaphores[provider] = asyncio.BoundedSemaphore(limit)
+
+        started = time.monotonic()
+        if semaphore is not None:
+            await semaphore.acquire()
+        self._enter(provider, time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._exit(provider)
+            if semaphore is not None:
+                semaphore.release()
+
+    def _enter(self, provider: str, waited: float):
+        with self._lock:
+            stats = self._stats.setdefault(provider, {"calls": 0, "active": 0, "peak": 0, "wait_seconds": 0.0})
+            stats["calls"] += 1
+            stats["active"] += 1
+            stats["peak"] = max(stats["peak"], stats["active"])
+            stats["wait_seconds"] += waited
+
+    def _exit(self, provider: str):
+        with self._lock:
+            self._stats[provider]["active"] -= 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Статистика по провайдерам: лимит, число вызовов, пик одновременности, суммарное ожидание"""
+        with self._lock:
+            return {
+                provider: {
+                    "limit": self._resolve(provider),
+                    "calls": int(stats["calls"]),
+                    "peak": int(stats["peak"]),
+                    "wait_seconds": round(stats["wait_seconds"], 3)
+                }
+                for provider, stats in self._stats.items()
+            }
+
+
+# Общие лимиты процесса: используются ClaudeClient, Veo3JobQueue и склейкой видео
+provider_limits = ProviderLimits()
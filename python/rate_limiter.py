@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter
+Межпроцессный лимит запросов к Anthropic, fal.ai и Resemble.ai:
+token bucket на запросы и токены в минуту для каждой пары (провайдер, API ключ),
+состояние хранится в SQLite, поэтому лимит общий для всех процессов генерации
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+DEFAULT_LIMITS_PATH = Path(__file__).parent.parent / "cache" / "rate_limits.sqlite"
+
+# Переменные окружения с лимитами провайдеров: (запросов в минуту, токенов в минуту)
+PROVIDER_RATE_ENV = {
+    "anthropic": ("ANTHROPIC_RPM", "ANTHROPIC_TPM"),
+    "fal": ("FAL_RPM", None),
+    "resemble": ("RESEMBLE_RPM", None),
+}
+
+# Максимальная пауза между проверками бакета: освободившуюся емкость забирает первый проснувшийся
+MAX_POLL_SECONDS = 1.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов по длине текста (около 4 символов на токен)"""
+    return max(1, len(text) // 4)
+
+
+class RateLimiter:
+    def __init__(self, path: Optional[str] = None, enabled: Optional[bool] = None):
+        """
+        Лимитер запросов
+
+        Args:
+            path: Файл SQLite с состоянием бакетов (по умолчанию RATE_LIMITS_PATH или cache/rate_limits.sqlite)
+            enabled: Включен ли лимитер (выключается через RATE_LIMITS_DISABLED=true)
+        """
+        if enabled is None:
+            enabled = os.getenv('RATE_LIMITS_DISABLED', 'false').lower() not in ('1', 'true', 'yes')
+        self.enabled = enabled
+        self.path = Path(path or os.getenv('RATE_LIMITS_PATH') or DEFAULT_LIMITS_PATH)
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def limits(self, provider: str) -> Tuple[Optional[float], Optional[float]]:
+        """Лимиты провайдера (запросов, токенов в минуту); None — без ограничения"""
+        rpm_env, tpm_env = PROVIDER_RATE_ENV.get(provider, (None, None))
+        return self._read_limit(rpm_env), self._read_limit(tpm_env)
+
+    @staticmethod
+    def _read_limit(env_name: Optional[str]) -> Optional[float]:
+        value = os.getenv(env_name, "") if env_name else ""
+        return float(value) if value.strip() and float(value) > 0 else None
+
+    def acquire(self, provider: str, api_key: Optional[str], tokens: int = 0) -> float:
+        """
+        Ожидание емкости для одного запроса и оценки токенов
+
+        Returns:
+            Время ожидания в секундах
+        """
+        started = time.monotonic()
+        while True:
+            wait = self._try_acquire(provider, api_key, tokens)
+            if wait <= 0:
+                return time.monotonic() - started
+            time.sleep(min(wait, MAX_POLL_SECONDS))
+
+    async def aacquire(self, provider: str, api_key: Optional[str], tokens: int = 0) -> float:
+        """Асинхронный вариант acquire: ожидание не блокирует event loop"""
+        import asyncio
+
+        started = time.monotonic()
+        while True:
+            wait = await asyncio.to_thread(self._try_acquire, provider, api_key, tokens)
+            if wait <= 0:
+                return time.monotonic() - started
+            await asyncio.sleep(min(wait, MAX_POLL_SECONDS))
+
+    def adjust(self, provider: str, api_key: Optional[str], tokens: int):
+        """
+        Коррекция токенового бакета по фактическому расходу
+
+        Args:
+            tokens: Разница между фактическим расходом и оценкой из acquire
+                (положительная — списать еще, отрицательная — вернуть)
+        """
+        _, tpm = self.limits(provider)
+        if not self.enabled or tpm is None or tokens == 0:
+            return
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            name = self._bucket_name(provider, api_key, "tokens")
+            level = self._refill(conn, name, tpm, time.time())
+            # Перерасход уводит бакет в минус — следующие запросы подождут
+            conn.execute("UPDATE buckets SET level = ? WHERE name = ?", (min(tpm, level - tokens), name))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _try_acquire(self, provider: str, api_key: Optional[str], tokens: int) -> float:
+        """Попытка списать емкость; 0 при успехе, иначе рекомендуемое ожидание в секундах"""
+        rpm, tpm = self.limits(provider)
+        if not self.enabled or (rpm is None and tpm is None):
+            return 0
+
+        requested = []
+        if rpm is not None:
+            requested.append((self._bucket_name(provider, api_key, "requests"), rpm, 1))
+        if tpm is not None and tokens > 0:
+            # Запрос больше емкости бакета все равно должен пройти, когда бакет полон
+            requested.append((self._bucket_name(provider, api_key, "tokens"), tpm, min(tokens, tpm)))
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            wait = 0.0
+            levels = {}
+            for name, capacity, amount in requested:
+                level = self._refill(conn, name, capacity, now)
+                levels[name] = level
+                if level < amount:
+                    wait = max(wait, (amount - level) / (capacity / 60))
+
+            if wait == 0:
+                for name, _, amount in requested:
+                    conn.execute("UPDATE buckets SET level = ? WHERE name = ?", (levels[name] - amount, name))
+            conn.commit()
+            return wait
+        finally:
+            conn.close()
+
+    def _refill(self, conn: sqlite3.Connection, name: str, capacity: float, now: float) -> float:
+        """Пополнение бакета за прошедшее время, возвращает текущий уровень"""
+        row = conn.execute("SELECT level, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            level = capacity
+        else:
+            level = min(capacity, row[0] + (now - row[1]) * capacity / 60)
+
+        conn.execute(
+            "INSERT INTO buckets (name, level, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET level = excluded.level, updated_at = excluded.updated_at",
+            (name, level, now)
+        )
+        return level
+
+    @staticmethod
+    def _bucket_name(provider: str, api_key: Optional[str], kind: str) -> str:
+        """Имя бакета: сам ключ не сохраняется, только его хэш"""
+        key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+        return f"{provider}:{key_hash}:{kind}"
+
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение с базой лимитов (создает схему при первом обращении)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS buckets (
+                            name TEXT PRIMARY KEY,
+                            level REAL NOT NULL,
+                            updated_at REAL NOT NULL
+                        )
+                    """)
+                    self._initialized = True
+        return conn
+
+
+# Общий лимитер процесса для всех исходящих вызовов
+rate_limiter = RateLimiter()
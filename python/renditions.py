@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Renditions
+Набор версий финального видео из одного декодирования: варианты под другие
+соотношения сторон (кадрирование или поля) и легкое превью для веб-интерфейса.
+Декодированные кадры делятся фильтром split между всеми кодировщиками,
+результат описывается manifest.json рядом с мастер-файлом.
+"""
+
+import os
+import json
+import tempfile
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from media_tools import probe_media, run_ffmpeg
+from encode_scheduler import encode_scheduler
+
+MANIFEST_NAME = "manifest.json"
+RENDITION_CRF = 20
+AUDIO_BITRATE = "192k"
+
+# Превью: длинная сторона, ограничение битрейта и звук
+PREVIEW_LONG_SIDE = 640
+PREVIEW_CRF = 30
+PREVIEW_MAXRATE = "500k"
+PREVIEW_BUFSIZE = "1000k"
+PREVIEW_AUDIO_BITRATE = "64k"
+
+FIT_MODES = ("crop", "pad")
+
+
+def _even(value: float) -> int:
+    """Четный размер кадра (требование yuv420p)"""
+    number = int(value)
+    return number - number % 2
+
+
+def _parse_aspect(value: str) -> tuple:
+    width, height = value.split(":", 1)
+    return int(width), int(height)
+
+
+def rendition_specs() -> List[Dict[str, str]]:
+    """
+    Версии из RENDITIONS: "16:9", "1:1:crop", "preview" через запятую
+
+    Способ вписывания по умолчанию — RENDITION_FIT (pad — поля, crop — кадрирование по центру).
+    """
+    default_fit = os.getenv('RENDITION_FIT', 'pad').lower()
+    specs = []
+    for item in os.getenv('RENDITIONS', '').split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        if item == "preview":
+            specs.append({"name": "preview"})
+            continue
+
+        parts = item.split(":")
+        try:
+            aspect = f"{int(parts[0])}:{int(parts[1])}"
+        except (ValueError, IndexError):
+            print(f"Неизвестная версия видео пропущена: {item}")
+            continue
+        fit = parts[2] if len(parts) > 2 and parts[2] in FIT_MODES else default_fit
+        specs.append({"name": aspect.replace(":", "x"), "aspect": aspect, "fit": fit})
+    return specs
+
+
+def plan_renditions(specs: List[Dict[str, str]], width: int, height: int) -> List[Dict[str, Any]]:
+    """
+    Размер кадра и фильтр каждой версии для мастера width × height
+
+    Без увеличения изображения: crop берет наибольшую область нужных пропорций внутри кадра,
+    pad вписывает кадр с полями в рамку с длинной стороной мастера. Версии с пропорциями
+    мастера пропускаются.
+    """
+    plans = []
+    for spec in specs:
+        if spec["name"] == "preview":
+            scale = PREVIEW_LONG_SIDE / max(width, height)
+            out_width, out_height = _even(width * scale), _even(height * scale)
+            plans.append({**spec, "width": out_width, "height": out_height,
+                          "filter": f"scale={out_width}:{out_height},setsar=1"})
+            continue
+
+        aspect_width, aspect_height = _parse_aspect(spec["aspect"])
+        if aspect_width * height == aspect_height * width:
+            continue
+
+        ratio = aspect_width / aspect_height
+        wider = width / height > ratio
+        if spec["fit"] == "crop":
+            out_width = _even(height * ratio) if wider else _even(width)
+            out_height = _even(height) if wider else _even(width / ratio)
+            video_filter = f"crop={out_width}:{out_height},setsar=1"
+        else:
+            long_side = max(width, height)
+            out_width = _even(long_side if ratio >= 1 else long_side * ratio)
+            out_height = _even(long_side / ratio if ratio >= 1 else long_side)
+            video_filter = (f"scale={out_width}:{out_height}:force_original_aspect_ratio=decrease,"
+                            f"pad={out_width}:{out_height}:(ow-iw)/2:(oh-ih)/2:color=black,setsar=1")
+        plans.append({**spec, "width": out_width, "height": out_height, "filter": video_filter})
+    return plans
+
+
+def rendition_path(master_path: Path, plan: Dict[str, Any]) -> Path:
+    return master_path.with_name(f"{master_path.stem}_{plan['name']}{master_path.suffix}")
+
+
+def rendition_graph(video_label: str, audio_label: Optional[str], plans: List[Dict[str, Any]],
+                    master_path: Path, master_labels: Optional[tuple] = None) -> tuple:
+    """
+    Ветви графа для версий: split кадров (и asplit звука) на все кодировщики
+
+    Args:
+        video_label, audio_label: Метки декодированного видео и звука (звук может отсутствовать)
+        master_labels: Метки (видео, звук) для мастера, если он кодируется тем же проходом
+
+    Returns:
+        (цепочки фильтров, аргументы выходов ffmpeg)
+    """
+    branches = len(plans) + (1 if master_labels else 0)
+    video_outputs = [f"[rv{i}]" for i in range(len(plans))]
+    audio_outputs = [f"[ra{i}]" for i in range(len(plans))]
+    if master_labels:
+        video_outputs.insert(0, f"[{master_labels[0]}]")
+        audio_outputs.insert(0, f"[{master_labels[1]}]")
+
+    chains = [f"[{video_label}]split={branches}{''.join(video_outputs)}"]
+    if audio_label:
+        chains.append(f"[{audio_label}]asplit={branches}{''.join(audio_outputs)}")
+    for i, plan in enumerate(plans):
+        chains.append(f"[rv{i}]{plan['filter']}[rvo{i}]")
+
+    outputs: List[Any] = []
+    for i, plan in enumerate(plans):
+        outputs += ["-map", f"[rvo{i}]"]
+        if audio_label:
+            outputs += ["-map", f"[ra{i}]"]
+        if plan["name"] == "preview":
+            outputs += ["-c:v", "libx264", *encode_scheduler.x264_args("preview"), "-crf", PREVIEW_CRF,
+                        "-maxrate", PREVIEW_MAXRATE, "-bufsize", PREVIEW_BUFSIZE]
+            audio_bitrate = PREVIEW_AUDIO_BITRATE
+        else:
+            outputs += ["-c:v", "libx264", *encode_scheduler.x264_args(), "-crf", RENDITION_CRF]
+            audio_bitrate = AUDIO_BITRATE
+        outputs += ["-pix_fmt", "yuv420p"]
+        if audio_label:
+            outputs += ["-c:a", "aac", "-b:a", audio_bitrate]
+        outputs += ["-movflags", "+faststart", rendition_path(master_path, plan)]
+    return chains, outputs
+
+
+def render_renditions(master_path: str, plans: List[Dict[str, Any]]) -> None:
+    """Версии готового мастера: одно декодирование, split на все кодировщики"""
+    master = Path(master_path)
+    has_audio = probe_media(str(master))["audio"] is not None
+    chains, outputs = rendition_graph("0:v", "0:a" if has_audio else None, plans, master)
+
+    with tempfile.TemporaryDirectory(dir=master.parent) as temp_dir:
+        graph_path = Path(temp_dir) / "graph.txt"
+        graph_path.write_text(";\n".join(chains), encoding="utf-8")
+        run_ffmpeg(["-i", master, "-filter_complex_script", graph_path] + outputs)
+
+
+def write_manifest(master_path: str, plans: List[Dict[str, Any]],
+                   published_dir: Optional[Path] = None) -> Dict[str, Any]:
+    """
+    Описание мастера и версий (путь, размер кадра, пропорции, байты) в manifest.json
+
+    Args:
+        published_dir: Каталог, куда файлы будут перенесены из рабочего каталога задачи,
+            — пути в описании указывают туда (по умолчанию каталог мастера)
+    """
+    master = Path(master_path)
+    info = probe_media(str(master))
+    video = info.get("video") or {}
+
+    def entry(path: Path, **fields) -> Dict[str, Any]:
+        return {"path": str((published_dir or path.parent) / path.name), "bytes": path.stat().st_size, **fields}
+
+    manifest = {
+        "master": entry(master, width=video.get("width"), height=video.get("height"),
+                        duration=info.get("duration")),
+        "renditions": [
+            entry(rendition_path(master, plan), name=plan["name"], width=plan["width"], height=plan["height"],
+                  aspect=plan.get("aspect"), fit=plan.get("fit"))
+            for plan in plans if rendition_path(master, plan).exists()
+        ]
+    }
+    with open(master.with_name(MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def read_manifest(master_path: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Manifest версий рядом с мастером, если версии создавались"""
+    if not master_path:
+        return None
+    manifest_path = Path(master_path).with_name(MANIFEST_NAME)
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
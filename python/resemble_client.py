@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Resemble Client
+Задачи улучшения звука Resemble.ai: загрузка аудио без потерь в FLAC (WAV, если
+API его не принимает) и общий опросчик статусов с экспоненциальной паузой,
+джиттером и предельным временем ожидания для каждой задачи
+"""
+
+import os
+import time
+import heapq
+import random
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+
+from rate_limiter import rate_limiter
+
+ENHANCEMENTS_URL = "https://app.resemble.ai/api/v2/audio_enhancements"
+
+POLL_INITIAL_DELAY = 2.0
+POLL_MAX_DELAY = 30.0
+POLL_BACKOFF = 1.6
+DEFAULT_JOB_TIMEOUT = 900
+
+# Ответы, которыми API отклоняет формат загруженного файла
+UNSUPPORTED_FORMAT_STATUS_CODES = {400, 415, 422}
+# Ошибки опроса, после которых задачу имеет смысл опросить еще раз
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Формат загрузки: (кодек ffmpeg для извлечения дорожки, MIME тип)
+UPLOAD_FORMATS = {
+    "flac": ("flac", "audio/flac"),
+    "wav": ("pcm_s16le", "audio/wav"),
+}
+
+
+class UnsupportedUploadFormat(Exception):
+    """API не принимает загруженный формат аудио"""
+
+
+class ResembleClient:
+    # FLAC отклонен API в этом процессе — дальше сразу загружаем WAV
+    _flac_rejected = False
+
+    def __init__(self, api_key: str, upload_format: Optional[str] = None):
+        """
+        Клиент API улучшения звука
+
+        Args:
+            api_key: Ключ Resemble.ai
+            upload_format: Формат загрузки flac или wav (RESEMBLE_UPLOAD_FORMAT, по умолчанию flac)
+        """
+        self.api_key = api_key
+        self.upload_format = (upload_format or os.getenv('RESEMBLE_UPLOAD_FORMAT', 'flac')).lower()
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    @property
+    def session(self):
+        """Общая HTTP сессия процесса (пул соединений MediaDownloader)"""
+        from media_downloader import media_downloader
+        return media_downloader.session
+
+    def upload_formats(self) -> List[str]:
+        """Форматы в порядке попыток: FLAC с откатом на WAV"""
+        if self.upload_format == "wav" or ResembleClient._flac_rejected:
+            return ["wav"]
+        return ["flac", "wav"]
+
+    def create_job(self, audio_path: Path, audio_format: str) -> str:
+        """
+        Загрузка аудио и создание задачи улучшения
+
+        Returns:
+            uuid задачи
+        """
+        import requests
+
+        with open(audio_path, 'rb') as audio_file:
+            files = {
+                "audio_file": (f"audio.{audio_format}", audio_file, UPLOAD_FORMATS[audio_format][1]),
+            }
+
+            rate_limiter.acquire("resemble", self.api_key)
+            response = self.session.post(ENHANCEMENTS_URL, headers=self.headers, files=files, timeout=120)
+
+        if audio_format == "flac" and response.status_code in UNSUPPORTED_FORMAT_STATUS_CODES:
+            ResembleClient._flac_rejected = True
+            raise UnsupportedUploadFormat(f"Resemble.ai не принял FLAC: {response.status_code} {response.text[:200]}")
+        try:
+            response.raise_for_status()
+        except requests.HTTPError as e:
+            raise Exception(f"Resemble.ai: ошибка создания задачи: {e}")
+
+        return response.json()["uuid"]
+
+    def job_status(self, job_id: str) -> Dict[str, Any]:
+        """Текущий статус задачи"""
+        rate_limiter.acquire("resemble", self.api_key)
+        response = self.session.get(f"{ENHANCEMENTS_URL}/{job_id}", headers=self.headers, timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+
+class _PolledJob:
+    """Задача в опросчике: клиент, предельное время и число опросов"""
+
+    def __init__(self, client: ResembleClient, job_id: str, deadline_at: float):
+        self.client = client
+        self.job_id = job_id
+        self.deadline_at = deadline_at
+        self.polls = 0
+        self.future: Future = Future()
+
+
+class ResemblePoller:
+    def __init__(self):
+        """Опрос статусов всех задач процесса одним фоновым потоком"""
+        self._condition = threading.Condition()
+        self._queue: List[tuple] = []
+        self._sequence = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, client: ResembleClient, job_id: str, timeout: Optional[float] = None) -> Future:
+        """
+        Постановка задачи на опрос
+
+        Args:
+            timeout: Предельное время ожидания в секундах (RESEMBLE_JOB_TIMEOUT)
+
+        Returns:
+            Future со статусом завершенной задачи (enhanced_audio_url и др.)
+        """
+        if timeout is None:
+            timeout = float(os.getenv('RESEMBLE_JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT))
+        job = _PolledJob(client, job_id, time.monotonic() + timeout)
+
+        with self._condition:
+            self._schedule(job, POLL_INITIAL_DELAY)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="resemble-poller", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return job.future
+
+    def _schedule(self, job: _PolledJob, delay: float):
+        """Следующий опрос не позже предельного времени задачи (вызывается под блокировкой)"""
+        self._sequence += 1
+        heapq.heappush(self._queue, (min(time.monotonic() + delay, job.deadline_at), self._sequence, job))
+
+    def _next_delay(self, job: _PolledJob) -> float:
+        """Экспоненциальная пауза с джиттером: половина фиксирована, половина случайна"""
+        delay = min(POLL_MAX_DELAY, POLL_INITIAL_DELAY * POLL_BACKOFF ** job.polls)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    wait = self._queue[0][0] - time.monotonic() if self._queue else None
+                    self._condition.wait(wait)
+                _, _, job = heapq.heappop(self._queue)
+
+            if not self._poll(job):
+                with self._condition:
+                    self._schedule(job, self._next_delay(job))
+
+    def _poll(self, job: _PolledJob) -> bool:
+        """Один опрос задачи; True, если задача завершена (результатом или ошибкой)"""
+        import requests
+
+        job.polls += 1
+        try:
+            status_data = job.client.job_status(job.job_id)
+        except requests.RequestException as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if status is not None and status not in RETRYABLE_STATUS_CODES:
+                job.future.set_exception(Exception(f"Resemble.ai: ошибка опроса задачи {job.job_id}: {e}"))
+                return True
+            status_data = {}
+        except Exception as e:
+            job.future.set_exception(e)
+            return True
+
+        status = status_data.get("status")
+        if status == "completed":
+            job.future.set_result(status_data)
+            return True
+        if status == "failed":
+            job.future.set_exception(
+                Exception(f"Resemble.ai обработка провалилась: {status_data.get('error_message')}")
+            )
+            return True
+        if time.monotonic() >= job.deadline_at:
+            job.future.set_exception(
+                Exception(f"Resemble.ai: задача {job.job_id} не завершилась за отведенное время "
+                          f"({job.polls} опросов, статус {status or 'неизвестен'})")
+            )
+            return True
+        return False
+
+
+# Общий опросчик процесса для всех задач улучшения звука
+resemble_poller = ResemblePoller()
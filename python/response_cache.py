@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Response Cache
+Локальный кэш ответов Claude в SQLite с адресацией по содержимому запроса
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / "cache" / "claude_responses.sqlite"
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+class ResponseCache:
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None,
+                 ttl_seconds: Optional[int] = None, enabled: Optional[bool] = None):
+        """
+        Кэш ответов Claude
+
+        Args:
+            path: Файл SQLite (по умолчанию CLAUDE_CACHE_PATH или cache/claude_responses.sqlite)
+            max_bytes: Максимальный размер ответов в кэше, старые вытесняются по LRU (CLAUDE_CACHE_MAX_MB)
+            ttl_seconds: Время жизни записи (CLAUDE_CACHE_TTL)
+            enabled: Включен ли кэш (выключается через CLAUDE_CACHE_DISABLED=true)
+        """
+        if enabled is None:
+            enabled = os.getenv('CLAUDE_CACHE_DISABLED', 'false').lower() not in ('1', 'true', 'yes')
+        if max_bytes is None:
+            max_mb = os.getenv('CLAUDE_CACHE_MAX_MB')
+            max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+        if ttl_seconds is None:
+            ttl_seconds = int(os.getenv('CLAUDE_CACHE_TTL', DEFAULT_TTL_SECONDS))
+
+        self.enabled = enabled
+        self.path = Path(path or os.getenv('CLAUDE_CACHE_PATH') or DEFAULT_CACHE_PATH)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        # Счетчики текущего процесса; суммарные хранятся в таблице cache_stats
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @staticmethod
+    def make_key(model: str, temperature: float, max_tokens: int, prompt: Any) -> str:
+        """Ключ кэша: хэш модели, параметров генерации и полного промпта"""
+        payload = json.dumps({
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "prompt": prompt
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение с базой кэша (создает схему при первом обращении)"""
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS responses (
+                            key TEXT PRIMARY KEY,
+                            model TEXT NOT NULL,
+                            response TEXT NOT NULL,
+                            size INTEGER NOT NULL,
+                            created_at REAL NOT NULL,
+                            last_access REAL NOT NULL
+                        )
+                    """)
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+                    conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+                    conn.commit()
+                    self._initialized = True
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Ответ из кэша или None, если записи нет или она устарела"""
+        if not self.enabled:
+            return None
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._count(conn, "hits")
+                conn.commit()
+                self.hits += 1
+                return row[0]
+
+            if row:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._count(conn, "misses")
+            conn.commit()
+            self.misses += 1
+            return None
+        finally:
+            conn.close()
+
+    def set(self, key: str, model: str, response: str):
+        """Сохранение ответа с вытеснением давно не использованных записей"""
+        if not self.enabled:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now)
+            )
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._evict(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _evict(self, conn: sqlite3.Connection):
+        """LRU вытеснение до укладывания в max_bytes"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _count(self, conn: sqlite3.Connection, name: str):
+        """Увеличение общего счетчика попаданий/промахов"""
+        conn.execute(
+            "INSERT INTO cache_stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий и промахов: текущего процесса и суммарные"""
+        result = {"hits": self.hits, "misses": self.misses, "total_hits": 0, "total_misses": 0, "entries": 0, "bytes": 0}
+        if not self.enabled or not self.path.exists():
+            return result
+
+        conn = self._connect()
+        try:
+            for name, value in conn.execute("SELECT name, value FROM cache_stats"):
+                result[f"total_{name}"] = value
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            result["entries"] = entries
+            result["bytes"] = size
+        finally:
+            conn.close()
+        return result
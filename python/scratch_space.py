@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Scratch Space
+Изолированные рабочие каталоги задач рендера: на tmpfs (/dev/shm), если там хватает
+места с учетом уже выданных задач, иначе на диске. Каталог удаляется при выходе из задачи,
+а оставшиеся от упавших процессов — при следующем запуске. Готовые файлы переносятся
+в постоянный каталог атомарно: читатель видит либо целый файл, либо никакого.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, List, Iterator
+
+TMPFS_ROOT = "/dev/shm"
+DIR_PREFIX = "videogen-"
+DEFAULT_TMPFS_RESERVE_MB = 512
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ScratchSpace:
+    def __init__(self):
+        """Учет места на tmpfs, выданного задачам процесса"""
+        self._lock = threading.Lock()
+        self._reserved: Dict[str, int] = {}
+        self._swept = False
+
+    def _roots(self) -> List[Path]:
+        """
+        Корни в порядке предпочтения: SCRATCH_DIR, затем /dev/shm (SCRATCH_TMPFS, по умолчанию true),
+        затем системный каталог временных файлов
+        """
+        if os.getenv('SCRATCH_DIR'):
+            return [Path(os.getenv('SCRATCH_DIR'))]
+        roots = []
+        if os.getenv('SCRATCH_TMPFS', 'true').lower() == 'true' and os.access(TMPFS_ROOT, os.W_OK):
+            roots.append(Path(TMPFS_ROOT))
+        roots.append(Path(tempfile.gettempdir()))
+        return roots
+
+    def _sweep(self, root: Path):
+        """Каталоги задач процессов, которые уже завершились (например, после kill -9)"""
+        for path in root.glob(f"{DIR_PREFIX}*"):
+            try:
+                pid = int(path.name[len(DIR_PREFIX):].split("-", 1)[0])
+            except ValueError:
+                continue
+            if pid != os.getpid() and not _pid_alive(pid):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _choose_root(self, expected_bytes: int) -> Path:
+        """Первый корень, где свободного места хватает на задачу с учетом резерва и выданного"""
+        reserve = int(os.getenv('SCRATCH_TMPFS_RESERVE_MB', DEFAULT_TMPFS_RESERVE_MB)) * 1024 * 1024
+        roots = self._roots()
+        for root in roots[:-1]:
+            reserved = sum(size for path, size in self._reserved.items() if Path(path).parent == root)
+            if shutil.disk_usage(root).free - reserved - reserve >= expected_bytes:
+                return root
+        return roots[-1]
+
+    @contextmanager
+    def job(self, name: str, expected_bytes: int = 0) -> Iterator[Path]:
+        """
+        Рабочий каталог задачи; удаляется при выходе, в том числе по исключению
+
+        Args:
+            name: Имя задачи для каталога (например, concat_<generation_id>)
+            expected_bytes: Оценка объема промежуточных файлов для выбора tmpfs
+        """
+        with self._lock:
+            if not self._swept:
+                for root in self._roots():
+                    self._sweep(root)
+                self._swept = True
+            root = self._choose_root(expected_bytes)
+            root.mkdir(parents=True, exist_ok=True)
+            work_dir = Path(tempfile.mkdtemp(prefix=f"{DIR_PREFIX}{os.getpid()}-{name}-", dir=root))
+            self._reserved[str(work_dir)] = expected_bytes
+
+        try:
+            yield work_dir
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            with self._lock:
+                self._reserved.pop(str(work_dir), None)
+
+    def publish(self, source: Path, destination: Path) -> Path:
+        """
+        Атомарный перенос файла в постоянный каталог
+
+        В пределах одной файловой системы — rename; с tmpfs на диск файл сначала
+        копируется во временное имя рядом с целью, сбрасывается на диск и переименовывается.
+        """
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(source, destination)
+            return destination
+        except OSError:
+            pass
+
+        partial = destination.with_name(f".{destination.name}.part")
+        try:
+            with open(source, "rb") as src, open(partial, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(partial, destination)
+        finally:
+            if partial.exists():
+                partial.unlink()
+        source.unlink()
+        return destination
+
+    def publish_all(self, work_dir: Path, destination_dir: Path, last: str = "") -> List[Path]:
+        """
+        Перенос всех файлов верхнего уровня рабочего каталога (результатов задачи)
+
+        Args:
+            last: Имя файла, переносимого последним (описание остальных, например manifest.json),
+                чтобы читатель не увидел описание раньше файлов
+        """
+        paths = sorted((path for path in work_dir.iterdir() if path.is_file()), key=lambda path: (path.name == last, path.name))
+        return [self.publish(path, destination_dir / path.name) for path in paths]
+
+    def location(self, work_dir: Path) -> str:
+        """tmpfs или disk — для логов"""
+        return "tmpfs" if str(work_dir).startswith(TMPFS_ROOT) else "disk"
+
+
+# Глобальный экземпляр: резервы tmpfs общие для всех задач процесса
+scratch_space = ScratchSpace()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark
+Измеряет время импорта CLI модулей через `python -X importtime` и проверяет бюджет
+
+Usage: python startup_benchmark.py [--runs N] [--budget-scale K]
+Код завершения 1, если какой-либо модуль превысил бюджет или импортировал тяжелую зависимость.
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+from typing import List, Tuple
+
+# Бюджет времени импорта (мс) для каждого CLI модуля
+IMPORT_BUDGETS_MS = {
+    "content_generator": 60,
+    "client_profile_generator": 60,
+    "audio_enhancer": 60,
+    "video_generator": 120,
+    "video_generator_v2": 120,
+    "video_generator_async": 180,
+}
+
+# Зависимости, которые не должны загружаться на этапе импорта
+HEAVY_MODULES = ["anthropic", "fal_client", "moviepy", "numpy", "scipy", "imageio", "requests", "httpx"]
+
+
+def measure_import(module: str, python_dir: Path) -> Tuple[float, List[str]]:
+    """
+    Импорт модуля в отдельном интерпретаторе
+
+    Returns:
+        Суммарное время импорта в мс и список загруженных тяжелых модулей
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=python_dir, capture_output=True, text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    if result.returncode != 0:
+        raise Exception(f"Импорт {module} завершился ошибкой: {result.stderr.strip().splitlines()[-1]}")
+
+    total_us = 0
+    heavy = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        package = name.strip()
+
+        # Модули верхнего уровня дерева импорта выводятся с минимальным отступом
+        if len(name) - len(name.lstrip()) == 1:
+            total_us += int(cumulative)
+
+        root = package.split(".")[0]
+        if root in HEAVY_MODULES:
+            heavy.add(root)
+
+    return total_us / 1000, sorted(heavy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк времени запуска Python CLI")
+    parser.add_argument("--runs", type=int, default=5, help="Количество замеров, берется медиана")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Множитель бюджета для медленных машин")
+    args = parser.parse_args()
+
+    python_dir = Path(__file__).parent
+    failed = False
+
+    print(f"{'Модуль':<28}{'Медиана, мс':>14}{'Бюджет, мс':>14}  Статус")
+    for module, budget_ms in IMPORT_BUDGETS_MS.items():
+        budget_ms *= args.budget_scale
+        timings = []
+        heavy: List[str] = []
+        for _ in range(max(1, args.runs)):
+            elapsed_ms, heavy = measure_import(module, python_dir)
+            timings.append(elapsed_ms)
+
+        median_ms = sorted(timings)[len(timings) // 2]
+        status = "OK"
+        if heavy:
+            status = f"FAIL: загружены {', '.join(heavy)}"
+            failed = True
+        elif median_ms > budget_ms:
+            status = "FAIL: превышен бюджет"
+            failed = True
+
+        print(f"{module:<28}{median_ms:>14.1f}{budget_ms:>14.0f}  {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
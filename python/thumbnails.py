@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Thumbnails
+Превью сегмента из одной выборки кадров: постер, спрайт для просмотра наведением
+и короткая анимация. Кадры берутся поиском (-ss перед каждым входом) с частотой
+THUMBNAIL_FPS — декодируется только группа кадров до каждой точки, а не весь файл.
+
+Файлы лежат рядом с видео (segment_0.mp4 → segment_0_thumbs/), описание — в thumbnails.json.
+"""
+
+import os
+import json
+import math
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from media_tools import probe_media, run_ffmpeg, has_encoder
+from encode_scheduler import encode_scheduler
+
+METADATA_NAME = "thumbnails.json"
+DEFAULT_SAMPLE_FPS = 1.0
+MAX_SAMPLES = 24
+
+# Длинная сторона кадра: постер, ячейка спрайта, анимация
+POSTER_LONG_SIDE = 480
+SPRITE_LONG_SIDE = 160
+PREVIEW_LONG_SIDE = 240
+SPRITE_COLUMNS = 8
+# Кадров в секунду при воспроизведении анимации (выборка проигрывается ускоренно)
+PREVIEW_PLAYBACK_FPS = 4
+JPEG_QUALITY = 4
+WEBP_QUALITY = 60
+
+
+def thumbnails_enabled() -> bool:
+    """Превью сегментов включены (THUMBNAILS, по умолчанию true)"""
+    return os.getenv('THUMBNAILS', 'true').lower() == 'true'
+
+
+def thumbnails_dir(video_path: str) -> Path:
+    """Каталог превью видео: рядом с файлом, <имя>_thumbs"""
+    path = Path(video_path)
+    return path.with_name(f"{path.stem}_thumbs")
+
+
+def sample_times(duration: float, fps: float) -> List[float]:
+    """Моменты выборки: середины интервалов 1/fps, не больше MAX_SAMPLES на видео"""
+    count = max(1, min(MAX_SAMPLES, int(duration * fps)))
+    step = duration / count
+    return [round(step * (i + 0.5), 3) for i in range(count)]
+
+
+def _scaled(width: int, height: int, long_side: int) -> tuple:
+    """Четный размер кадра с длинной стороной long_side без увеличения"""
+    scale = min(1.0, long_side / max(width, height))
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+def make_thumbnails(video_path: str) -> Dict[str, Any]:
+    """
+    Постер, спрайт и анимация видео одним запуском ffmpeg
+
+    Каждый момент выборки — отдельный вход с поиском; кадры склеиваются concat
+    и делятся split между тремя выходами. Запуск занимает слот планировщика
+    кодирований с его лимитом потоков. Повторный вызов для неизменившегося
+    файла возвращает сохраненное описание.
+
+    Returns:
+        Описание из thumbnails.json: пути к файлам и раскладка спрайта
+    """
+    source = Path(video_path)
+    target = thumbnails_dir(video_path)
+    metadata_path = target / METADATA_NAME
+    if metadata_path.exists() and metadata_path.stat().st_mtime >= source.stat().st_mtime:
+        with open(metadata_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    info = probe_media(str(source))
+    video = info.get("video") or {}
+    width, height = video.get("width"), video.get("height")
+    duration = info.get("duration")
+    if not width or not height or not duration:
+        raise Exception(f"Нет видео потока или длительности в {source.name}")
+
+    times = sample_times(duration, float(os.getenv('THUMBNAIL_FPS', DEFAULT_SAMPLE_FPS)))
+    count = len(times)
+    columns = min(count, SPRITE_COLUMNS)
+    rows = math.ceil(count / columns)
+    poster_size = _scaled(width, height, POSTER_LONG_SIDE)
+    sprite_size = _scaled(width, height, SPRITE_LONG_SIDE)
+    preview_size = _scaled(width, height, PREVIEW_LONG_SIDE)
+    # Анимированный WebP, если он есть в сборке ffmpeg, иначе GIF
+    animated_webp = has_encoder("libwebp_anim")
+    preview_name = "preview.webp" if animated_webp else "preview.gif"
+
+    inputs: List[Any] = []
+    chains = []
+    for i, moment in enumerate(times):
+        inputs += ["-ss", f"{moment:.3f}", "-i", source]
+        chains.append(f"[{i}:v]trim=end_frame=1,setpts=PTS-STARTPTS,"
+                      f"scale={poster_size[0]}:{poster_size[1]},setsar=1,format=yuv420p[s{i}]")
+    chains.append("".join(f"[s{i}]" for i in range(count)) + f"concat=n={count}:v=1:a=0,split=3[all][tiles][anim]")
+    chains.append(f"[all]select='eq(n,{count // 2})'[poster]")
+    chains.append(f"[tiles]scale={sprite_size[0]}:{sprite_size[1]},tile={columns}x{rows}[sprite]")
+    preview_chain = f"[anim]scale={preview_size[0]}:{preview_size[1]},setpts=N/({PREVIEW_PLAYBACK_FPS}*TB)"
+    if animated_webp:
+        chains.append(f"{preview_chain}[preview]")
+    else:
+        chains.append(f"{preview_chain},split[pa][pb];[pa]palettegen[palette];[pb][palette]paletteuse[preview]")
+
+    preview_codec = (["-c:v", "libwebp_anim", "-quality", WEBP_QUALITY, "-loop", 0] if animated_webp
+                     else ["-c:v", "gif", "-loop", 0])
+
+    temp_dir = target.with_name(f"{target.name}.tmp")
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    temp_dir.mkdir(parents=True)
+    try:
+        with tempfile.TemporaryDirectory() as graph_dir, encode_scheduler.slot("thumbnails"):
+            threads = encode_scheduler.threads()
+            graph_path = Path(graph_dir) / "graph.txt"
+            graph_path.write_text(";\n".join(chains), encoding="utf-8")
+            run_ffmpeg(inputs + [
+                "-filter_complex_script", graph_path,
+                "-map", "[poster]", "-frames:v", 1, "-q:v", JPEG_QUALITY, "-threads", threads,
+                temp_dir / "poster.jpg",
+                "-map", "[sprite]", "-frames:v", 1, "-q:v", JPEG_QUALITY, "-threads", threads,
+                temp_dir / "sprite.jpg",
+                "-map", "[preview]", "-r", PREVIEW_PLAYBACK_FPS
+            ] + preview_codec + ["-threads", threads, temp_dir / preview_name])
+
+        metadata = {
+            "poster": str(target / "poster.jpg"),
+            "sprite": str(target / "sprite.jpg"),
+            "preview": str(target / preview_name),
+            "sprite_columns": columns,
+            "sprite_rows": rows,
+            "frame_width": sprite_size[0],
+            "frame_height": sprite_size[1],
+            "times": times
+        }
+        with open(temp_dir / METADATA_NAME, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(temp_dir, target)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return metadata
+
+
+def read_thumbnails(video_path: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Описание превью видео, если они создавались"""
+    if not video_path:
+        return None
+    metadata_path = thumbnails_dir(video_path) / METADATA_NAME
+    if not metadata_path.exists():
+        return None
+    with open(metadata_path, encoding="utf-8") as f:
+        return json.load(f)
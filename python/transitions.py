@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Transitions
+Crossfade на стыках сегментов с умным рендером: перекодируются только группы кадров
+вокруг каждого стыка (xfade), видео между ними копируется без перекодирования.
+Звук дешевле перекодировать целиком — он сводится одним проходом acrossfade.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Dict, Any
+
+from media_tools import probe_media, probe_video_frames, run_ffmpeg
+from post_production import audio_chain, crossfade_chains, AUDIO_BITRATE
+from encode_scheduler import encode_scheduler
+
+DEFAULT_TRANSITION_SECONDS = 0.5
+# Качество перекодированных стыков выше обычного рендера, чтобы не было заметно на фоне исходника
+BOUNDARY_CRF = 16
+X264_PROFILES = {"baseline", "main", "high"}
+
+
+def transition_duration() -> float:
+    """Длительность crossfade: VIDEO_TRANSITION=crossfade и TRANSITION_SECONDS; 0 — склейка встык"""
+    if os.getenv('VIDEO_TRANSITION', 'cut').lower() != 'crossfade':
+        return 0.0
+    return max(0.0, float(os.getenv('TRANSITION_SECONDS', DEFAULT_TRANSITION_SECONDS)))
+
+
+def _time_base(video: Dict[str, Any]) -> str:
+    """Знаменатель time base исходного потока ("1/12288" у ffprobe, "12288" или "12k" у ffmpeg)"""
+    value = str(video.get("time_base") or "")
+    if "/" in value:
+        value = value.split("/", 1)[1]
+    if value.endswith("k"):
+        value = str(int(float(value[:-1]) * 1000))
+    return value if value.isdigit() else ""
+
+
+def _frame_rate(video: Dict[str, Any]) -> float:
+    """Частота кадров из 24, 24/1 или 30000/1001"""
+    value = str(video.get("fps") or "24")
+    if "/" in value:
+        numerator, denominator = value.split("/", 1)
+        return float(numerator) / float(denominator)
+    return float(value)
+
+
+def plan_cuts(frames: List[Dict[str, Any]], transition: float) -> List[tuple]:
+    """
+    Границы копируемой середины каждого сегмента: (head, tail) в секундах
+
+    head — первый ключевой кадр после входящего crossfade, tail — последний ключевой
+    кадр до исходящего; все до head и после tail перекодируется вместе со стыком.
+    """
+    cuts = []
+    last = len(frames) - 1
+    for i, info in enumerate(frames):
+        duration = info["duration"]
+        if duration <= transition * (2 if 0 < i < last else 1):
+            raise Exception(f"Сегмент {i + 1} короче crossfade")
+
+        head = 0.0
+        if i > 0:
+            candidates = [key for key in info["keyframes"] if key >= transition - 1e-3]
+            if not candidates:
+                raise Exception(f"Сегмент {i + 1}: нет ключевого кадра после crossfade")
+            head = candidates[0]
+
+        tail = duration
+        if i < last:
+            candidates = [key for key in info["keyframes"] if key <= duration - transition + 1e-3]
+            tail = candidates[-1] if candidates else 0.0
+
+        if tail < head:
+            raise Exception(f"Сегмент {i + 1}: группа кадров длиннее сегмента без стыков")
+        cuts.append((head, tail))
+    return cuts
+
+
+def crossfade_smart(video_paths: List[str], output_path: str, transition: float) -> Dict[str, float]:
+    """
+    Склейка с crossfade, перекодирующая только стыки
+
+    Сегменты должны быть совместимы для склейки без перекодирования (h264, общий кадр).
+    concat demuxer переводит h264 каждой части в Annex B (auto_convert), поэтому
+    SPS/PPS перекодированных частей идут внутри потока перед их ключевыми кадрами.
+
+    Returns:
+        Секунды видео, скопированные и перекодированные
+    """
+    infos = [probe_media(path) for path in video_paths]
+    video = infos[0]["video"] or {}
+    if video.get("codec") != "h264":
+        raise Exception(f"Умный рендер поддерживает только h264, получено {video.get('codec')}")
+
+    frames = [probe_video_frames(path) for path in video_paths]
+    durations = [info["duration"] for info in frames]
+    cuts = plan_cuts(frames, transition)
+
+    fps = video.get("fps") or "24"
+    frame_rate = _frame_rate(video)
+    pix_fmt = video.get("pix_fmt") or "yuv420p"
+    encoder = ["-c:v", "libx264", *encode_scheduler.x264_args(), "-crf", BOUNDARY_CRF, "-pix_fmt", pix_fmt]
+    profile = str(video.get("profile") or "").lower()
+    if profile in X264_PROFILES:
+        encoder += ["-profile:v", profile]
+
+    stats = {"copied_seconds": 0.0, "reencoded_seconds": 0.0}
+    # Промежуточные части рядом с результатом: в рабочем каталоге задачи (см. scratch_space)
+    with tempfile.TemporaryDirectory(dir=Path(output_path).parent) as temp_dir:
+        temp_path = Path(temp_dir)
+        pieces: List[Path] = []
+
+        for i, path in enumerate(video_paths):
+            head, tail = cuts[i]
+            if tail > head:
+                # Середина сегмента от ключевого кадра до ключевого кадра — без перекодирования
+                piece = temp_path / f"copy_{i}.mp4"
+                seek = ["-ss", f"{head:.6f}"] if head else []
+                # Граница по числу пакетов, а не по времени: с B-кадрами -t захватывает
+                # кадры следующей группы, которые уже есть в перекодированном стыке
+                frame_count = round((tail - head) * frame_rate)
+                limit = ["-frames:v", frame_count] if i < len(video_paths) - 1 else []
+                run_ffmpeg(seek + ["-i", path] + limit + ["-map", "0:v:0", "-c", "copy", piece])
+                pieces.append(piece)
+                stats["copied_seconds"] += tail - head
+
+            if i < len(video_paths) - 1:
+                # Стык: хвост сегмента от tail и начало следующего до его head, xfade посередине
+                next_head = cuts[i + 1][0]
+                piece = temp_path / f"boundary_{i}.mp4"
+                offset = durations[i] - transition - tail
+                graph = (
+                    f"[0:v]fps={fps},format={pix_fmt},tpad=stop_mode=clone:stop_duration={transition:.3f}[a];"
+                    f"[1:v]fps={fps},format={pix_fmt}[b];"
+                    f"[a][b]xfade=transition=fade:duration={transition:.3f}:offset={offset:.6f}[v]"
+                )
+                run_ffmpeg([
+                    "-ss", f"{tail:.6f}", "-i", path,
+                    "-t", f"{next_head:.6f}", "-i", video_paths[i + 1],
+                    "-filter_complex", graph, "-map", "[v]", "-an",
+                ] + encoder + [piece])
+                pieces.append(piece)
+                stats["reencoded_seconds"] += durations[i] - tail + next_head - transition
+
+        has_audio = any(info.get("audio") for info in infos)
+        audio_path = temp_path / "audio.m4a"
+        if has_audio:
+            inputs: List[str] = []
+            for path in video_paths:
+                inputs += ["-i", path]
+            chains = [audio_chain(i, info) for i, info in enumerate(infos)]
+            chains += crossfade_chains(durations, transition, video=False)
+            run_ffmpeg(inputs + [
+                "-filter_complex", ";".join(chains), "-map", "[acat]",
+                "-c:a", "aac", "-b:a", AUDIO_BITRATE, audio_path
+            ])
+
+        list_path = temp_path / "pieces.txt"
+        with open(list_path, "w", encoding="utf-8") as f:
+            for piece in pieces:
+                f.write(f"file '{piece.name}'\n")
+
+        args = ["-f", "concat", "-safe", "0", "-i", list_path]
+        if has_audio:
+            args += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0"]
+        else:
+            args += ["-map", "0:v:0"]
+        time_base = _time_base(video)
+        if time_base:
+            args += ["-video_track_timescale", time_base]
+        run_ffmpeg(args + ["-c", "copy", "-movflags", "+faststart", output_path])
+
+    return stats
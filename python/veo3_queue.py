@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+VEO3 Job Queue
+Параллельная отправка сегментов в очередь fal.ai с ограничением числа одновременных задач
+"""
+
+import os
+import json
+import hashlib
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, InvalidStateError, as_completed
+from typing import List, Dict, Any, Optional, Iterator, Tuple, Callable
+
+from provider_limits import provider_limits
+from rate_limiter import rate_limiter
+
+VEO3_APPLICATION = "fal-ai/veo3"
+FAL_QUEUE_URL = "https://queue.fal.run"
+DEFAULT_MAX_IN_FLIGHT = 3
+# Интервал опроса статуса задачи: между опросами проверяется остановка очереди
+STATUS_POLL_SECONDS = 2.0
+CANCEL_TIMEOUT_SECONDS = 10
+# Пропорции сегментов по умолчанию — вертикальное видео для коротких форматов
+DEFAULT_ASPECT_RATIO = "9:16"
+
+
+def build_fal_params(segment: Dict[str, Any]) -> Dict[str, Any]:
+    """Формирование параметров запроса VEO3 для сегмента"""
+    return {
+        "prompt": segment["prompt"],
+        "aspect_ratio": segment.get("aspect_ratio", DEFAULT_ASPECT_RATIO),
+        "duration": segment.get("duration", "8s"),
+        "enhance_prompt": segment.get("enhance_prompt", True),
+        "generate_audio": segment.get("generate_audio", True)
+    }
+
+
+def fal_params_hash(fal_params: Dict[str, Any]) -> str:
+    """Хэш параметров запроса VEO3: одинаковый хэш — тот же рендер сегмента"""
+    payload = json.dumps(fal_params, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def resolve_max_in_flight(max_in_flight: Optional[int] = None) -> int:
+    """Лимит одновременных задач: явное значение или VEO3_MAX_IN_FLIGHT"""
+    if max_in_flight is None:
+        max_in_flight = int(os.getenv('VEO3_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT))
+    return max(1, max_in_flight)
+
+
+def request_urls(request_id: str) -> Dict[str, str]:
+    """URL статуса, результата и отмены задачи очереди fal.ai по ее request_id"""
+    base_url = f"{FAL_QUEUE_URL}/{VEO3_APPLICATION}/requests/{request_id}"
+    return {
+        "response_url": base_url,
+        "status_url": f"{base_url}/status",
+        "cancel_url": f"{base_url}/cancel"
+    }
+
+
+def cancel_request(request_id: str):
+    """Отмена задачи в очереди fal.ai (PUT cancel_url): рендер прекращается и не оплачивается"""
+    import requests
+
+    try:
+        response = requests.put(request_urls(request_id)["cancel_url"],
+                                headers={"Authorization": f"Key {os.getenv('FAL_KEY')}"},
+                                timeout=CANCEL_TIMEOUT_SECONDS)
+        print(f"Задача {request_id} в fal.ai отменена (HTTP {response.status_code})")
+    except Exception as e:
+        print(f"Не удалось отменить задачу {request_id} в fal.ai: {e}")
+
+
+class QueueClosed(Exception):
+    """Очередь закрыта, ожидание задачи прекращено"""
+
+
+class Veo3JobQueue:
+    def __init__(self, max_in_flight: Optional[int] = None,
+                 on_submitted: Optional[Callable[[int, str], None]] = None,
+                 on_result: Optional[Callable[[int, Any], Any]] = None):
+        """
+        Очередь задач VEO3
+
+        Args:
+            max_in_flight: Максимум одновременно выполняющихся задач в fal.ai
+                (по умолчанию из VEO3_MAX_IN_FLIGHT)
+            on_submitted: Вызывается с номером сегмента и request_id задачи сразу
+                после постановки в очередь fal.ai (для checkpoint генерации)
+            on_result: Обработка результата (скачивание сегмента) в отдельном пуле скачиваний:
+                поток VEO3 сразу освобождается под следующую задачу; as_completed отдает ее результат
+        """
+        self.max_in_flight = resolve_max_in_flight(max_in_flight)
+        self.on_submitted = on_submitted
+        self.on_result = on_result
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="veo3")
+        self._downloads = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="veo3-download")
+        self._futures: Dict[int, Future] = {}
+        # Задачи fal.ai, результат которых еще не получен: их отменяет close()
+        self._lock = threading.Lock()
+        self._pending_requests: Dict[int, str] = {}
+        self._stopped = threading.Event()
+
+    def submit(self, index: int, fal_params: Dict[str, Any], request_id: Optional[str] = None) -> Future:
+        """
+        Постановка сегмента в очередь, index задает порядок в результатах
+
+        Args:
+            request_id: Задача fal.ai из прошлого запуска — к ней подключаемся
+                вместо повторной отправки
+        """
+        future: Future = Future()
+        # Потоки пула выполняются в копии контекста отправителя: вывод воркера
+        # (generation_worker) остается привязан к каналу своей задачи
+        context = contextvars.copy_context()
+        job = self._executor.submit(context.run, self._wait_result, index, fal_params, request_id)
+        job.add_done_callback(lambda done: self._handle_result(index, done, future, context))
+        self._futures[index] = future
+        return future
+
+    def _handle_result(self, index: int, job: Future, future: Future, context: contextvars.Context):
+        """Результат задачи fal.ai передается в пул скачиваний (on_result), затем в future сегмента"""
+        if job.cancelled() or job.exception() is not None or not self.on_result:
+            self._forward(job, future)
+        elif self._stopped.is_set():
+            self._settle(future, error=QueueClosed(f"Сегмент {index}: очередь закрыта, результат не обрабатывается"))
+        else:
+            try:
+                download = self._downloads.submit(context.copy().run, self.on_result, index, job.result())
+            except RuntimeError as e:  # пул уже остановлен close()
+                self._settle(future, error=e)
+                return
+            download.add_done_callback(lambda done: self._forward(done, future))
+
+    def _forward(self, source: Future, future: Future):
+        """Перенос исхода source (отмена, ошибка, результат) в future сегмента"""
+        if source.cancelled():
+            future.cancel()
+        elif source.exception() is not None:
+            self._settle(future, error=source.exception())
+        else:
+            self._settle(future, result=source.result())
+
+    @staticmethod
+    def _settle(future: Future, result: Any = None, error: Optional[BaseException] = None):
+        """Результат или ошибка future сегмента, если его еще не отменили"""
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _await_handle(self, index: int, handle: Any) -> Any:
+        """Ожидание задачи опросом статуса; close() прерывает ожидание между опросами"""
+        import fal_client
+
+        with self._lock:
+            self._pending_requests[index] = handle.request_id
+        try:
+            while not self._stopped.is_set():
+                if isinstance(handle.status(), fal_client.Completed):
+                    # Задача уже завершена: get() сразу забирает результат
+                    return handle.get()
+                self._stopped.wait(STATUS_POLL_SECONDS)
+        finally:
+            with self._lock:
+                orphan = self._pending_requests.pop(index, None)
+        # Задача поставлена уже после cancel() и не попала в его список — отменяем сами
+        if orphan:
+            cancel_request(orphan)
+        raise QueueClosed(f"Сегмент {index}: очередь закрыта, ожидание задачи {handle.request_id} прекращено")
+
+    def _wait_result(self, index: int, fal_params: Dict[str, Any], request_id: Optional[str] = None) -> Any:
+        """Отправка задачи в очередь fal.ai и ожидание результата"""
+        import fal_client
+        
+        # Общий лимит процесса на задачи VEO3 (несколько генераций в одном процессе)
+        with provider_limits.slot("veo3"):
+            if request_id:
+                try:
+                    handle = fal_client.SyncRequestHandle(request_id=request_id, client=fal_client.sync_client._client,
+                                                          **request_urls(request_id))
+                    print(f"Сегмент {index}: подключаемся к задаче {request_id} в fal.ai")
+                    return self._await_handle(index, handle)
+                except QueueClosed:
+                    raise
+                except Exception as e:
+                    print(f"Сегмент {index}: задача {request_id} недоступна ({e}), отправляем заново")
+
+            if self._stopped.is_set():
+                raise QueueClosed(f"Сегмент {index}: очередь закрыта до отправки")
+            rate_limiter.acquire("fal", os.getenv('FAL_KEY'))
+            handle = fal_client.submit(VEO3_APPLICATION, arguments=fal_params)
+            print(f"Сегмент {index}: задача {handle.request_id} поставлена в очередь fal.ai")
+            if self.on_submitted:
+                self.on_submitted(index, handle.request_id)
+            return self._await_handle(index, handle)
+
+    def as_completed(self) -> Iterator[Tuple[int, Any]]:
+        """Пары (индекс, результат) в порядке завершения задач"""
+        index_by_future = {future: index for index, future in self._futures.items()}
+        try:
+            for future in as_completed(index_by_future):
+                yield index_by_future[future], future.result()
+        except Exception:
+            self.cancel()
+            raise
+
+    def results(self) -> List[Any]:
+        """Ожидание всех задач, результаты в порядке индексов сегментов"""
+        try:
+            return [self._futures[index].result() for index in sorted(self._futures)]
+        except Exception:
+            self.cancel()
+            raise
+
+    def cancel(self):
+        """
+        Остановка очереди: неначатые задачи снимаются, ожидающие результата отменяются
+        в fal.ai, потоки выходят на следующем опросе статуса, не вызывая on_result
+        """
+        self._stopped.set()
+        for future in self._futures.values():
+            future.cancel()
+        with self._lock:
+            pending, self._pending_requests = self._pending_requests, {}
+        for index in sorted(pending):
+            print(f"Сегмент {index}: отменяем задачу {pending[index]} в fal.ai")
+            cancel_request(pending[index])
+
+    def close(self):
+        """Остановка пула; незавершенные задачи отменяются и в fal.ai"""
+        self.cancel()
+        self._executor.shutdown(wait=False)
+        self._downloads.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
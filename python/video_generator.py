@@ -7,20 +7,22 @@ CrossFi Video Generation Pipeline
 import os
 import sys
 import json
-import time
-import requests
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 import random
 import re
-from anthropic import Anthropic
-import fal_client
-from moviepy.editor import VideoFileClip, concatenate_videoclips
 from prompt_builder import PromptBuilder
+from claude_client import ClaudeClient, Prompt, stage_deadline
+from veo3_queue import Veo3JobQueue, build_fal_params, DEFAULT_ASPECT_RATIO
+from media_tools import segments_compatible, concat_stream_copy
+from scratch_space import scratch_space
+from encode_scheduler import encode_scheduler
+from media_downloader import media_downloader
 
 class VideoGenerationPipeline:
-    def __init__(self, api_keys: Dict[str, str], schema_dir: str = "../schema", domains_file: str = "../domains_v6.json"):
+    def __init__(self, api_keys: Dict[str, str], schema_dir: str = "../schema", domains_file: str = "../domains_v6.json",
+                 max_in_flight: Optional[int] = None):
         """
         Инициализация пайплайна генерации видео
         
@@ -28,14 +30,16 @@ class VideoGenerationPipeline:
             api_keys: Словарь с API ключами (ANTHROPIC_API_KEY, FAL_KEY, RESEMBLE_AI_KEY)
             schema_dir: Директория с XML схемами промптов
             domains_file: Файл с доменами
+            max_in_flight: Максимум одновременных задач VEO3 (по умолчанию VEO3_MAX_IN_FLIGHT)
         """
-        self.anthropic_client = Anthropic(api_key=api_keys['ANTHROPIC_API_KEY'])
+        # Тяжелые SDK импортируются при первом использовании
+        self.claude = ClaudeClient(api_keys['ANTHROPIC_API_KEY'])
         
         # Настройка fal_client
         os.environ['FAL_KEY'] = api_keys['FAL_KEY']
-        self.fal_client = fal_client
         
         self.resemble_key = api_keys.get('RESEMBLE_AI_KEY')
+        self.max_in_flight = max_in_flight
         
         # Определяем пути относительно текущего скрипта
         script_dir = Path(__file__).parent.parent  # Поднимаемся на уровень выше из python/
@@ -82,33 +86,11 @@ class VideoGenerationPipeline:
                 return data.get('domains', {})
         return {}
 
-    def _call_claude(self, prompt: str, max_tokens: int = 3000) -> str:
-        """Вызов Claude API с обработкой ошибок"""
-        max_retries = 3
-        base_delay = 2
-        
-        for attempt in range(max_retries):
-            try:
-                if attempt > 0:
-                    delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
-                    time.sleep(delay)
-                
-                response = self.anthropic_client.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=max_tokens,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7
-                )
-                return response.content[0].text
-                
-            except Exception as e:
-                if "529" in str(e) or "overloaded" in str(e).lower():
-                    if attempt < max_retries - 1:
-                        continue
-                    else:
-                        raise Exception(f"API overloaded after {max_retries} attempts")
-                else:
-                    raise Exception(f"Claude API error: {str(e)}")
+    def _call_claude(self, prompt: Prompt, max_tokens: int = 3000, use_cache: bool = True,
+                     stage: Optional[str] = None) -> str:
+        """Вызов Claude API с обработкой ошибок и кэшем ответов"""
+        return self.claude.complete(prompt, max_tokens=max_tokens, use_cache=use_cache,
+                                    deadline=stage_deadline(stage))
 
     def generate_scenario(self, domain_key: str, product_data: Dict[str, Any], user_input: str = "", language: str = "Portuguese") -> str:
         """Генерация сценария для видео"""
@@ -126,7 +108,7 @@ class VideoGenerationPipeline:
             user_input
         )
         
-        return self._call_claude(scenario_prompt, max_tokens=3000)
+        return self._call_claude(scenario_prompt, max_tokens=3000, stage="scenario")
 
     def _format_domain_description(self, domain: Dict[str, Any]) -> str:
         """Форматирование описания домена"""
@@ -197,7 +179,7 @@ class VideoGenerationPipeline:
         prompt_builder = PromptBuilder(language)
         timing_prompt = prompt_builder.build_timing_prompt(scenario, domain_key, selected_duration)
         
-        timing_response = self._call_claude(timing_prompt, max_tokens=2500)
+        timing_response = self._call_claude(timing_prompt, max_tokens=2500, stage="timing")
         timing_breakdown = self._extract_timing_breakdown(timing_response)
         framing_context = self._extract_framing_context(timing_response)
         
@@ -246,7 +228,7 @@ class VideoGenerationPipeline:
             language
         )
         
-        veo3_response = self._call_claude(veo3_prompt, max_tokens=4000)
+        veo3_response = self._call_claude(veo3_prompt, max_tokens=4000, stage="veo3_prompts")
         prompts_list = self._parse_json_response(veo3_response)
         enhanced_prompts = self._enhance_prompts_with_framing(
             prompts_list, framing_context, timing, domain_key
@@ -368,7 +350,7 @@ class VideoGenerationPipeline:
                 
             enhanced_prompt = {
                 "prompt": prompt_dict["prompt"],
-                "aspect_ratio": prompt_dict.get("aspect_ratio", "9:16"),
+                "aspect_ratio": prompt_dict.get("aspect_ratio", DEFAULT_ASPECT_RATIO),
                 "duration": prompt_dict.get("duration", "8s"),
                 "enhance_prompt": prompt_dict.get("enhance_prompt", True),
                 "generate_audio": prompt_dict.get("generate_audio", True)
@@ -378,11 +360,19 @@ class VideoGenerationPipeline:
             
         return validated_prompts
 
-    def generate_video_segments(self, prompts: List[Dict[str, Any]], 
-                              generation_id: str) -> List[str]:
-        """Генерация видео сегментов через VEO3"""
-        video_urls = []
-        video_paths = []
+    def generate_video_segments(self, prompts: List[Dict[str, Any]], generation_id: str,
+                                on_segment_ready: Optional[Callable[[int, str, List[str]], None]] = None) -> List[str]:
+        """
+        Генерация видео сегментов через VEO3
+
+        Каждый сегмент скачивается сразу после завершения его задачи в fal.ai,
+        пока остальные сегменты еще рендерятся.
+
+        Args:
+            on_segment_ready: Вызывается для каждого скачанного сегмента с его номером,
+                путем и списком уже готовых сегментов в порядке номеров
+        """
+        ready_paths: Dict[int, str] = {}
         
         # Создаем директории
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -390,44 +380,26 @@ class VideoGenerationPipeline:
         raw_dir = self.raw_video_dir / batch_dir
         raw_dir.mkdir(parents=True, exist_ok=True)
         
-        for i, segment in enumerate(prompts, start=1):
-            print(f"Генерация сегмента {i}/{len(prompts)}...")
-            
-            fal_params = {
-                "prompt": segment["prompt"],
-                "aspect_ratio": segment.get("aspect_ratio", "16:9"),
-                "duration": segment.get("duration", "8s"),
-                "enhance_prompt": segment.get("enhance_prompt", True),
-                "generate_audio": segment.get("generate_audio", True)
-            }
+        with Veo3JobQueue(self.max_in_flight) as queue:
+            print(f"Отправка {len(prompts)} сегментов в VEO3 (одновременно до {queue.max_in_flight})...")
+            for i, segment in enumerate(prompts, start=1):
+                queue.submit(i, build_fal_params(segment))
 
-            result = fal_client.subscribe(
-                "fal-ai/veo3",
-                arguments=fal_params,
-                with_logs=True
-            )
-            url = self._extract_video_url(result)
-            video_urls.append(url)
-
-            if i < len(prompts):
-                time.sleep(3)  # Задержка между запросами
-
-        # Скачиваем видео
-        for i, url in enumerate(video_urls, start=1):
-            fname = f"segment_{i}.mp4"
-            fpath = raw_dir / fname
-            
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            
-            with open(fpath, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            video_paths.append(str(fpath))
-            print(f"Сегмент {i} скачан: {fpath}")
+            for i, result in queue.as_completed():
+                url = self._extract_video_url(result)
+                fpath = raw_dir / f"segment_{i}.mp4"
+                self._download_segment(url, fpath)
+                ready_paths[i] = str(fpath)
+                print(f"Сегмент {i} скачан: {fpath}")
+
+                if on_segment_ready:
+                    on_segment_ready(i, str(fpath), [ready_paths[n] for n in sorted(ready_paths)])
+
+        return [ready_paths[i] for i in sorted(ready_paths)]
 
-        return video_paths
+    def _download_segment(self, url: str, fpath: Path):
+        """Скачивание сегмента по URL (докачка и атомарная запись, см. MediaDownloader)"""
+        media_downloader.download(url, fpath)
 
     def _extract_video_url(self, fal_result: Any) -> str:
         """Извлечение URL видео из результата fal.ai"""
@@ -463,21 +435,54 @@ class VideoGenerationPipeline:
         return url
 
     def concatenate_videos(self, video_paths: List[str], generation_id: str) -> str:
-        """Склейка видео сегментов"""
+        """Склейка видео сегментов в рабочем каталоге задачи с атомарной публикацией в ready_video"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         batch_dir = f"generation_{generation_id}_{timestamp}"
         ready_dir = self.ready_video_dir / batch_dir
-        ready_dir.mkdir(parents=True, exist_ok=True)
+        
+        final_path = ready_dir / f"final_video_{timestamp}.mp4"
+        
+        expected_bytes = sum(Path(path).stat().st_size for path in video_paths) * 2
+        with scratch_space.job(f"concat_{generation_id}", expected_bytes) as work_dir:
+            work_path = work_dir / final_path.name
+            
+            # Кодирования проходят через общий планировщик машины: слоты, потоки, приоритет
+            with encode_scheduler.slot(f"concat_{generation_id}"):
+                self._render_final(video_paths, work_path)
+            
+            scratch_space.publish(work_path, final_path)
+        return str(final_path)
+
+    def _render_final(self, video_paths: List[str], final_path: Path):
+        """Склейка без перекодирования, если сегменты совместимы, иначе через moviepy"""
+        # Сегменты VEO3 обычно совпадают по кодекам и разрешению — склеиваем без перекодирования
+        if segments_compatible(video_paths):
+            try:
+                print("Сегменты совместимы, склейка без перекодирования...")
+                concat_stream_copy(video_paths, str(final_path))
+                return
+            except Exception as e:
+                print(f"Склейка без перекодирования не удалась, перекодируем: {e}")
+        else:
+            print("Параметры сегментов отличаются, склейка с перекодированием...")
+        
+        self._concatenate_reencode(video_paths, final_path)
+
+    def _concatenate_reencode(self, video_paths: List[str], final_path: Path):
+        """Склейка сегментов с перекодированием через moviepy"""
+        from moviepy.editor import VideoFileClip, concatenate_videoclips
         
         clips = [VideoFileClip(path) for path in video_paths]
         final_video = concatenate_videoclips(clips, method="compose")
         
-        final_path = ready_dir / f"final_video_{timestamp}.mp4"
         final_video.write_videofile(
             str(final_path),
             codec="libx264",
             audio_codec="aac",
-            temp_audiofile="temp-audio.m4a",
+            preset=encode_scheduler.preset(),
+            threads=encode_scheduler.threads(),
+            # Временный звук рядом с результатом — в каталоге задачи, а не в общем текущем каталоге
+            temp_audiofile=str(final_path.with_name(f"{final_path.stem}_temp-audio.m4a")),
             remove_temp=True
         )
         
@@ -485,8 +490,6 @@ class VideoGenerationPipeline:
         for clip in clips:
             clip.close()
         final_video.close()
-        
-        return str(final_path)
 
     def enhance_audio(self, video_path: str) -> str:
         """Улучшение качества звука через Resemble.ai"""
@@ -561,17 +564,19 @@ def main():
         
         # Генерация видео
         print("Генерация видео сегментов...")
-        video_paths = pipeline.generate_video_segments(prompts, generation_id)
-        
-        # Выводим промежуточный результат после генерации видео
-        print("INTERMEDIATE_RESULT:", json.dumps({
-            "step": "videos",
-            "scenario": scenario,
-            "timing": duration,
-            "timing_breakdown": timing_breakdown,
-            "prompts": prompts,
-            "video_segments": video_paths
-        }, ensure_ascii=False))
+        def report_segment(index: int, path: str, ready_paths: List[str]):
+            print("INTERMEDIATE_RESULT:", json.dumps({
+                "step": "videos",
+                "scenario": scenario,
+                "timing": duration,
+                "timing_breakdown": timing_breakdown,
+                "prompts": prompts,
+                "video_segments": ready_paths,
+                "segments_total": len(prompts),
+                "completed": len(ready_paths) == len(prompts)
+            }, ensure_ascii=False), flush=True)
+
+        video_paths = pipeline.generate_video_segments(prompts, generation_id, on_segment_ready=report_segment)
         
         # Склейка видео
         print("Склейка финального видео...")
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+CrossFi Video Generation Pipeline (asyncio)
+Асинхронный вариант пайплайна v2: все ожидания Claude, fal.ai и скачиваний
+выполняются на одном event loop, поэтому один процесс ведет много генераций одновременно
+
+Usage:
+    python video_generator_async.py <generation_data_json> [--resume]
+    python video_generator_async.py --resume <generationId>
+    python video_generator_async.py --edit <edit_data_json>
+    python video_generator_async.py --worker [--max-jobs N]
+
+В режиме --worker задачи читаются из stdin в формате NDJSON, протокол совпадает
+с generation_worker.py (включая задачи редактирования с "mode": "edit").
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Callable, AsyncIterator, Awaitable, Tuple
+
+from claude_client import Prompt, stage_deadline
+from veo3_queue import VEO3_APPLICATION, build_fal_params, resolve_max_in_flight, request_urls, cancel_request
+from json_stream import JSONArrayStreamParser
+from rate_limiter import rate_limiter
+from provider_limits import provider_limits
+from generation_state import GenerationState
+from video_generator_v2 import (VideoGenerationPipelineV2, DeltaThrottle, load_api_keys, load_resume_data,
+                                generation_stages, edit_stages)
+
+DEFAULT_MAX_JOBS = 32
+
+
+class AsyncVeo3JobQueue:
+    def __init__(self, max_in_flight: Optional[int] = None,
+                 on_submitted: Optional[Callable[[int, str], None]] = None,
+                 on_result: Optional[Callable[[int, Any], Awaitable[Any]]] = None):
+        """
+        Асинхронная очередь задач VEO3
+
+        Args:
+            max_in_flight: Максимум одновременно выполняющихся задач в fal.ai
+                (по умолчанию из VEO3_MAX_IN_FLIGHT)
+            on_submitted: Вызывается с номером сегмента и request_id задачи (см. Veo3JobQueue)
+            on_result: Корутина обработки результата вне лимита задач (см. Veo3JobQueue)
+        """
+        self.max_in_flight = resolve_max_in_flight(max_in_flight)
+        self.on_submitted = on_submitted
+        self.on_result = on_result
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._tasks: Dict[int, asyncio.Task] = {}
+        # Задачи fal.ai без результата; при закрытии очереди они отменяются в fal.ai
+        self._pending_requests: Dict[int, str] = {}
+        self._cancelling: List[str] = []
+
+    def submit(self, index: int, fal_params: Dict[str, Any], request_id: Optional[str] = None) -> asyncio.Task:
+        """Постановка сегмента в очередь; с request_id — подключение к задаче прошлого запуска"""
+        task = asyncio.ensure_future(self._run_job(index, fal_params, request_id))
+        self._tasks[index] = task
+        return task
+
+    async def _run_job(self, index: int, fal_params: Dict[str, Any], request_id: Optional[str] = None) -> Any:
+        """Задача fal.ai и обработка ее результата"""
+        result = await self._wait_result(index, fal_params, request_id)
+        return await self.on_result(index, result) if self.on_result else result
+
+    async def _wait_result(self, index: int, fal_params: Dict[str, Any], request_id: Optional[str] = None) -> Any:
+        """Отправка задачи в очередь fal.ai и ожидание результата"""
+        import fal_client
+
+        # Лимит очереди и общий лимит процесса на задачи VEO3 (VEO3_MAX_CONCURRENT), как в Veo3JobQueue
+        async with self._semaphore, provider_limits.aslot("veo3"):
+            if request_id:
+                try:
+                    handle = fal_client.AsyncRequestHandle(request_id=request_id, client=fal_client.async_client._client,
+                                                           **request_urls(request_id))
+                    print(f"Сегмент {index}: подключаемся к задаче {request_id} в fal.ai")
+                    return await self._await_handle(index, handle)
+                except Exception as e:
+                    print(f"Сегмент {index}: задача {request_id} недоступна ({e}), отправляем заново")
+
+            await rate_limiter.aacquire("fal", os.getenv('FAL_KEY'))
+            submission = asyncio.ensure_future(fal_client.submit_async(VEO3_APPLICATION, arguments=fal_params))
+            try:
+                handle = await asyncio.shield(submission)
+            except asyncio.CancelledError:
+                # Очередь закрыли во время отправки: задача уже может быть в fal.ai — ее отменит aclose()
+                try:
+                    self._cancelling.append((await submission).request_id)
+                except Exception:
+                    pass
+                raise
+            print(f"Сегмент {index}: задача {handle.request_id} поставлена в очередь fal.ai")
+            if self.on_submitted:
+                self.on_submitted(index, handle.request_id)
+            return await self._await_handle(index, handle)
+
+    async def _await_handle(self, index: int, handle: Any) -> Any:
+        """Ожидание результата задачи; request_id запоминается для отмены в fal.ai"""
+        self._pending_requests[index] = handle.request_id
+        try:
+            return await handle.get()
+        finally:
+            self._pending_requests.pop(index, None)
+
+    async def as_completed(self) -> AsyncIterator[Tuple[int, Any]]:
+        """Пары (индекс, результат) в порядке завершения задач"""
+        index_by_task = {task: index for index, task in self._tasks.items()}
+        pending = set(index_by_task)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=index_by_task.get):
+                    yield index_by_task[task], task.result()
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        """Отмена незавершенных задач; их задачи в fal.ai отменяет aclose()"""
+        self._cancelling += self._pending_requests.values()
+        self._pending_requests = {}
+        for task in self._tasks.values():
+            task.cancel()
+
+    async def aclose(self):
+        """Отмена незавершенных задач, в том числе в очереди fal.ai (и отправленных во время закрытия)"""
+        self.close()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        cancelling, self._cancelling = self._cancelling, []
+        for request_id in cancelling:
+            print(f"Отменяем задачу {request_id} в fal.ai")
+        await asyncio.gather(*(asyncio.to_thread(cancel_request, request_id) for request_id in cancelling))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+        return False
+
+
+class AsyncVideoGenerationPipeline(VideoGenerationPipelineV2):
+    """
+    Пайплайн v2 с асинхронными этапами
+
+    Построение промптов, разбор ответов и выбор длительности наследуются от v2,
+    поэтому результаты этапов совпадают с синхронным пайплайном.
+    """
+
+    async def _call_claude(self, prompt: Prompt, max_tokens: int = 3000, use_cache: bool = True,
+                           stage: Optional[str] = None) -> str:
+        """Вызов Claude API с обработкой ошибок и кэшем ответов"""
+        return await self.claude.acomplete(prompt, max_tokens=max_tokens, use_cache=use_cache,
+                                           deadline=stage_deadline(stage))
+
+    async def _call_claude_streaming(self, prompt: Prompt, max_tokens: int, on_delta: Callable[[str, str], None],
+                                     stage: Optional[str] = None) -> str:
+        """Потоковый вызов Claude с прореженной отправкой прогресса (см. DeltaThrottle)"""
+        throttle = DeltaThrottle(on_delta)
+        async for text in self.claude.astream(prompt, max_tokens=max_tokens, deadline=stage_deadline(stage)):
+            throttle.add(text)
+        return throttle.finish()
+
+    async def generate_scenario(self, domain_data: Dict[str, Any], product_data: Dict[str, Any],
+                                client_profile: Dict[str, Any], user_input: str = "", language: str = "Portuguese",
+                                on_delta: Optional[Callable[[str, str], None]] = None) -> str:
+        """Генерация сценария для видео с учетом профиля клиента"""
+        scenario_prompt = self._build_scenario_prompt(domain_data, product_data, client_profile, user_input, language)
+
+        if on_delta:
+            return await self._call_claude_streaming(scenario_prompt, max_tokens=3000, on_delta=on_delta, stage="scenario")
+        return await self._call_claude(scenario_prompt, max_tokens=3000, stage="scenario")
+
+    async def determine_timing(self, scenario: str, domain_data: Dict[str, Any], client_profile: Dict[str, Any],
+                               language: str = "Portuguese",
+                               on_delta: Optional[Callable[[str, str], None]] = None) -> tuple:
+        """Определение тайминга видео с вероятностным распределением"""
+        selected_duration = self._select_duration(scenario, domain_data)
+
+        print(f"Создаем промпт для тайминга...")
+        timing_prompt = self._build_timing_prompt(scenario, domain_data, client_profile, selected_duration, language)
+        print(f"Отправляем запрос к Claude для тайминга...")
+
+        if on_delta:
+            timing_response = await self._call_claude_streaming(timing_prompt, max_tokens=2500, on_delta=on_delta, stage="timing")
+        else:
+            timing_response = await self._call_claude(timing_prompt, max_tokens=2500, stage="timing")
+        print(f"Получен ответ для тайминга, длина: {len(timing_response)}")
+
+        timing_breakdown = self._extract_timing_breakdown(timing_response)
+        framing_context = self._extract_framing_context(timing_response, client_profile)
+        print(f"Тайминг обработан успешно")
+
+        return selected_duration, timing_breakdown, framing_context
+
+    async def generate_veo3_prompts(self, scenario: str, timing: int, timing_breakdown: str,
+                                    framing_context: str, domain_data: Dict[str, Any],
+                                    client_profile: Dict[str, Any], language: str = "Portuguese") -> List[Dict[str, Any]]:
+        """Генерация промптов для VEO3 с учетом профиля клиента"""
+        veo3_prompt = self._build_veo3_prompt(scenario, timing_breakdown, domain_data, client_profile, language)
+
+        veo3_response = await self._call_claude(veo3_prompt, max_tokens=4000, stage="veo3_prompts")
+        prompts_list = self._parse_json_response(veo3_response)
+
+        return self._validate_prompts(prompts_list)
+
+    async def generate_veo3_prompts_and_segments(self, scenario: str, timing: int, timing_breakdown: str,
+                                                 framing_context: str, domain_data: Dict[str, Any],
+                                                 client_profile: Dict[str, Any], generation_id: str,
+                                                 language: str = "Portuguese",
+                                                 on_prompts_ready: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                                                 on_segment_ready: Optional[Callable[[int, str, List[str]], None]] = None,
+                                                 state: Optional[GenerationState] = None) -> tuple:
+        """Потоковая генерация промптов VEO3 с запуском рендера по мере готовности"""
+        veo3_prompt = self._build_veo3_prompt(scenario, timing_breakdown, domain_data, client_profile, language)
+        raw_dir = self._create_raw_dir(generation_id, state)
+        parser = JSONArrayStreamParser()
+        prompts: List[Dict[str, Any]] = []
+        if state is not None:
+            # Задачи прошлого запуска относятся к другому ответу Claude — номера сегментов не совпадут
+            state.update(segments={})
+
+        async with AsyncVeo3JobQueue(self.max_in_flight, on_submitted=self._segment_submitted(state),
+                                     on_result=self._segment_downloader(raw_dir)) as queue:
+            try:
+                async for text in self.claude.astream(veo3_prompt, max_tokens=4000, deadline=stage_deadline("veo3_prompts")):
+                    objects = parser.feed(text)
+                    if parser.failed:
+                        continue  # Номера следующих объектов сдвинуты — ждем полный ответ
+                    for prompt_dict in self._validate_prompts(objects):
+                        prompts.append(prompt_dict)
+                        queue.submit(len(prompts), build_fal_params(prompt_dict))
+                        print(f"Промпт сегмента {len(prompts)} получен, сегмент отправлен в VEO3")
+
+                # Остальные промпты — из разбора полного ответа, если поток разобрать не удалось
+                complete = self._complete_streamed_prompts(parser, prompts)
+                for i, prompt_dict in enumerate(complete[len(prompts):], start=len(prompts) + 1):
+                    queue.submit(i, build_fal_params(prompt_dict))
+                prompts = complete
+            except BaseException:
+                # Промпты не получены целиком: уже отправленные сегменты не нужны, отменяем их до выхода
+                if prompts:
+                    print(f"Генерация промптов прервана, отменяем {len(prompts)} отправленных сегментов")
+                await asyncio.shield(queue.aclose())
+                raise
+
+            if state is not None:
+                state.update(prompts=prompts)
+            if on_prompts_ready:
+                on_prompts_ready(prompts)
+
+            video_paths = await self._collect_segments(queue, on_segment_ready, state)
+
+        return prompts, video_paths
+
+    async def generate_video_segments(self, prompts: List[Dict[str, Any]], generation_id: str,
+                                      on_segment_ready: Optional[Callable[[int, str, List[str]], None]] = None,
+                                      state: Optional[GenerationState] = None) -> List[str]:
+        """Генерация видео сегментов через VEO3 со скачиванием по мере готовности (checkpoint как в v2)"""
+        raw_dir = self._create_raw_dir(generation_id, state)
+        downloaded = state.downloaded_segments() if state is not None else {}
+
+        async with AsyncVeo3JobQueue(self.max_in_flight, on_submitted=self._segment_submitted(state),
+                                     on_result=self._segment_downloader(raw_dir)) as queue:
+            print(f"Отправка {len(prompts) - len(downloaded)} сегментов в VEO3 (одновременно до {queue.max_in_flight})...")
+            for i, segment in enumerate(prompts, start=1):
+                if i not in downloaded:
+                    queue.submit(i, build_fal_params(segment), self._pending_request_id(state, i))
+
+            return await self._collect_segments(queue, on_segment_ready, state, downloaded)
+
+    async def regenerate_segments(self, prompts: List[Dict[str, Any]], previous_prompts: List[Dict[str, Any]],
+                                  previous_paths: List[str], generation_id: str,
+                                  on_segment_ready: Optional[Callable[[int, str, List[str]], None]] = None) -> List[str]:
+        """Повторный рендер только измененных сегментов готовой генерации (см. v2)"""
+        reused, changed = self._plan_segment_edit(prompts, previous_prompts, previous_paths)
+        if not changed:
+            return [reused[i] for i in sorted(reused)]
+
+        raw_dir = self._create_raw_dir(generation_id)
+        async with AsyncVeo3JobQueue(self.max_in_flight, on_result=self._segment_downloader(raw_dir)) as queue:
+            print(f"Отправка {len(changed)} измененных сегментов в VEO3...")
+            for i in changed:
+                queue.submit(i, build_fal_params(prompts[i - 1]))
+
+            return await self._collect_segments(queue, on_segment_ready, ready_paths=reused)
+
+    def _segment_downloader(self, raw_dir: Path) -> Callable[[int, Any], Awaitable[tuple]]:
+        """Скачивание сегмента сразу по завершении его задачи VEO3, параллельно с остальными"""
+        async def download(index: int, fal_result: Any) -> tuple:
+            url = self._extract_video_url(fal_result)
+            fpath = raw_dir / f"segment_{index}.mp4"
+            await self._download_segment(url, fpath, self._extract_video_size(fal_result))
+            await asyncio.to_thread(self._post_download, str(fpath))
+            return url, fpath
+        return download
+
+    async def _collect_segments(self, queue: AsyncVeo3JobQueue,
+                                on_segment_ready: Optional[Callable[[int, str, List[str]], None]] = None,
+                                state: Optional[GenerationState] = None,
+                                ready_paths: Optional[Dict[int, str]] = None) -> List[str]:
+        """Сегменты в порядке завершения скачивания, результат — в порядке номеров"""
+        ready_paths = dict(ready_paths or {})
+        for i in sorted(ready_paths):
+            print(f"Сегмент {i} уже готов: {ready_paths[i]}")
+            await asyncio.to_thread(self._post_download, ready_paths[i])
+            if on_segment_ready:
+                on_segment_ready(i, ready_paths[i], [ready_paths[n] for n in sorted(ready_paths) if n <= i])
+
+        async for i, (url, fpath) in queue.as_completed():
+            ready_paths[i] = str(fpath)
+            print(f"Сегмент {i} скачан: {fpath}")
+            if state is not None:
+                state.set_segment(i, url=url, path=str(fpath))
+
+            if on_segment_ready:
+                on_segment_ready(i, str(fpath), [ready_paths[n] for n in sorted(ready_paths)])
+
+        return [ready_paths[i] for i in sorted(ready_paths)]
+
+    async def _download_segment(self, url: str, fpath: Path, expected_size: Optional[int] = None):
+        """Скачивание сегмента в отдельном потоке общим загрузчиком (пул соединений, докачка)"""
+        await asyncio.to_thread(super()._download_segment, url, fpath, expected_size)
+
+    async def concatenate_videos(self, video_paths: List[str], generation_id: str,
+                                 prompts: Optional[List[Dict[str, Any]]] = None,
+                                 client_profile: Optional[Dict[str, Any]] = None) -> str:
+        """Склейка видео сегментов в отдельном потоке (ffmpeg/moviepy блокируют)"""
+        return await asyncio.to_thread(super().concatenate_videos, video_paths, generation_id, prompts, client_profile)
+
+
+async def run_generation_async(pipeline: AsyncVideoGenerationPipeline, generation_data: Dict[str, Any],
+                               resume: bool = False) -> int:
+    """Полный цикл генерации асинхронным пайплайном (сценарий этапов общий с v2, см. generation_stages)"""
+    return await generation_stages(pipeline, generation_data, resume)
+
+
+async def run_edit_async(pipeline: AsyncVideoGenerationPipeline, edit_data: Dict[str, Any]) -> int:
+    """Редактирование готовой генерации асинхронным пайплайном (см. edit_stages)"""
+    return await edit_stages(pipeline, edit_data)
+
+
+async def serve_stdio_async(max_jobs: Optional[int] = None):
+    """
+    Асинхронный воркер: задачи NDJSON из stdin, события в stdout (протокол generation_worker.py)
+
+    Все генерации выполняются на одном event loop с общим пайплайном.
+    """
+    from generation_worker import _JobOutputRouter
+
+    if max_jobs is None:
+        max_jobs = int(os.getenv('WORKER_MAX_JOBS', DEFAULT_MAX_JOBS))
+    job_slots = asyncio.Semaphore(max(1, max_jobs))
+
+    pipeline = AsyncVideoGenerationPipeline(load_api_keys())
+    real_stdout = sys.__stdout__
+    output_router = _JobOutputRouter(sys.stderr)
+    sys.stdout = output_router
+    loop = asyncio.get_running_loop()
+    jobs = set()
+
+    def send(event: Dict[str, Any]):
+        real_stdout.write(json.dumps(event, ensure_ascii=False) + "\n")
+        real_stdout.flush()
+
+    async def run_job(generation_id: str, generation_data: Dict[str, Any]):
+        async with job_slots:
+            # Задача выполняется в своей копии контекста — привязка вывода не влияет на другие задачи
+            output_router.bind(lambda data: send({"generationId": generation_id, "type": "output", "data": data}))
+            try:
+                if generation_data.get('mode') == 'edit':
+                    code = await run_edit_async(pipeline, generation_data)
+                else:
+                    code = await run_generation_async(pipeline, generation_data)
+            except Exception as e:
+                print("GENERATION_RESULT:", json.dumps({"status": "failed", "error": str(e)}, ensure_ascii=False))
+                code = 1
+            finally:
+                output_router.flush()
+                output_router.bind(None)
+
+        send({"generationId": generation_id, "type": "exit", "code": code})
+
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            break
+        if not line.strip():
+            continue
+
+        try:
+            generation_data = json.loads(line)
+            generation_id = generation_data['generationId']
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            send({"type": "error", "error": f"Invalid job: {e}"})
+            continue
+
+        job = asyncio.create_task(run_job(generation_id, generation_data))
+        jobs.add(job)
+        job.add_done_callback(jobs.discard)
+
+    # stdin закрыт — дожидаемся текущих генераций
+    if jobs:
+        await asyncio.gather(*jobs)
+
+
+async def _run_single(generation_data: Dict[str, Any], resume: bool = False, edit: bool = False) -> int:
+    """Одна генерация (или редактирование) с выводом в stdout, как у video_generator_v2.py"""
+    pipeline = AsyncVideoGenerationPipeline(load_api_keys())
+    if edit:
+        return await run_edit_async(pipeline, generation_data)
+    return await run_generation_async(pipeline, generation_data, resume)
+
+
+def main():
+    """Точка входа для CLI использования"""
+    if len(sys.argv) < 2:
+        print("Usage: python video_generator_async.py <generation_data_json> [--resume]")
+        print("       python video_generator_async.py --resume <generationId>")
+        print("       python video_generator_async.py --edit <edit_data_json>")
+        print("       python video_generator_async.py --worker [--max-jobs N]")
+        sys.exit(1)
+
+    if sys.argv[1] == "--worker":
+        parser = argparse.ArgumentParser(prog="video_generator_async.py --worker")
+        parser.add_argument("--max-jobs", type=int, default=None, help="Максимум одновременных генераций")
+        args = parser.parse_args(sys.argv[2:])
+        asyncio.run(serve_stdio_async(args.max_jobs))
+        return
+
+    if sys.argv[1] == "--edit" and len(sys.argv) > 2:
+        sys.exit(asyncio.run(_run_single(json.loads(sys.argv[2]), edit=True)))
+
+    if sys.argv[1] == "--resume" and len(sys.argv) > 2:
+        generation_data, resume = load_resume_data(sys.argv[2]), True
+    else:
+        generation_data, resume = json.loads(sys.argv[1]), "--resume" in sys.argv[2:]
+    sys.exit(asyncio.run(_run_single(generation_data, resume)))
+
+
+if __name__ == "__main__":
+    main()
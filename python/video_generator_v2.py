@@ -8,29 +8,85 @@ import os
 import sys
 import json
 import time
-import requests
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Coroutine
 import random
 import re
-from anthropic import Anthropic
-import fal_client
-from moviepy.editor import VideoFileClip, concatenate_videoclips
 from prompt_builder import PromptBuilder
+from claude_client import ClaudeClient, Prompt, stage_deadline
+from veo3_queue import Veo3JobQueue, build_fal_params, fal_params_hash, DEFAULT_ASPECT_RATIO
+from json_stream import JSONArrayStreamParser
+from media_tools import segments_compatible, concat_stream_copy, probe_media
+from post_production import needs_post_production, render
+from transitions import transition_duration, crossfade_smart
+from renditions import (rendition_specs, plan_renditions, render_renditions, write_manifest, read_manifest,
+                        MANIFEST_NAME)
+from hls_packager import hls_enabled, package_video, hls_playlist
+from thumbnails import thumbnails_enabled, make_thumbnails, read_thumbnails
+from scratch_space import scratch_space
+from encode_scheduler import encode_scheduler
+from media_downloader import media_downloader
+from generation_state import GenerationState
+
+class DeltaThrottle:
+    """
+    Прореживание потоковых фрагментов перед отправкой в интерфейс
+
+    on_delta вызывается не чаще раза в STREAM_DELTA_INTERVAL_MS
+    или после STREAM_DELTA_CHUNKS фрагментов, и обязательно в конце ответа.
+    """
+
+    def __init__(self, on_delta: Callable[[str, str], None]):
+        self.on_delta = on_delta
+        self.interval = int(os.getenv('STREAM_DELTA_INTERVAL_MS', 250)) / 1000
+        self.max_chunks = int(os.getenv('STREAM_DELTA_CHUNKS', 40))
+        self.chunks: List[str] = []
+        self.pending: List[str] = []
+        self.last_emit = time.monotonic()
+
+    def add(self, text: str):
+        """Новый фрагмент ответа"""
+        self.chunks.append(text)
+        self.pending.append(text)
+        now = time.monotonic()
+        if now - self.last_emit >= self.interval or len(self.pending) >= self.max_chunks:
+            self.on_delta("".join(self.pending), "".join(self.chunks))
+            self.pending = []
+            self.last_emit = now
+
+    def finish(self) -> str:
+        """Отправка остатка, возвращает полный ответ"""
+        response = "".join(self.chunks)
+        if self.pending:
+            self.on_delta("".join(self.pending), response)
+            self.pending = []
+        return response
+
 
 class VideoGenerationPipelineV2:
-    def __init__(self, api_keys: Dict[str, str]):
+    def __init__(self, api_keys: Dict[str, str], max_in_flight: Optional[int] = None,
+                 stream_prompts: Optional[bool] = None):
         """
         Инициализация пайплайна генерации видео v2
+
+        Args:
+            api_keys: Словарь с API ключами (ANTHROPIC_API_KEY, FAL_KEY, RESEMBLE_AI_KEY)
+            max_in_flight: Максимум одновременных задач VEO3 (по умолчанию VEO3_MAX_IN_FLIGHT)
+            stream_prompts: Запускать рендер сегментов по мере потоковой генерации промптов
+                (по умолчанию VEO3_STREAM_PROMPTS, включено)
         """
-        self.anthropic_client = Anthropic(api_key=api_keys['ANTHROPIC_API_KEY'])
+        # Тяжелые SDK импортируются при первом использовании
+        self.claude = ClaudeClient(api_keys['ANTHROPIC_API_KEY'])
         
         # Настройка fal_client
         os.environ['FAL_KEY'] = api_keys['FAL_KEY']
-        self.fal_client = fal_client
         
         self.resemble_key = api_keys.get('RESEMBLE_AI_KEY')
+        self.max_in_flight = max_in_flight
+        if stream_prompts is None:
+            stream_prompts = os.getenv('VEO3_STREAM_PROMPTS', 'true').lower() in ('1', 'true', 'yes')
+        self.stream_prompts = stream_prompts
         
         # Определяем пути относительно текущего скрипта
         script_dir = Path(__file__).parent.parent
@@ -39,51 +95,50 @@ class VideoGenerationPipelineV2:
         self.raw_video_dir.mkdir(exist_ok=True)
         self.ready_video_dir.mkdir(exist_ok=True)
 
-    def _call_claude(self, prompt: str, max_tokens: int = 3000) -> str:
-        """Вызов Claude API с обработкой ошибок"""
-        max_retries = 3
-        base_delay = 2
-        
-        for attempt in range(max_retries):
-            try:
-                if attempt > 0:
-                    delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
-                    time.sleep(delay)
-                
-                response = self.anthropic_client.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=max_tokens,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7
-                )
-                return response.content[0].text
-                
-            except Exception as e:
-                if "529" in str(e) or "overloaded" in str(e).lower():
-                    if attempt < max_retries - 1:
-                        continue
-                    else:
-                        raise Exception(f"API overloaded after {max_retries} attempts")
-                else:
-                    raise Exception(f"Claude API error: {str(e)}")
+    def _call_claude(self, prompt: Prompt, max_tokens: int = 3000, use_cache: bool = True,
+                     stage: Optional[str] = None) -> str:
+        """Вызов Claude API с обработкой ошибок и кэшем ответов"""
+        return self.claude.complete(prompt, max_tokens=max_tokens, use_cache=use_cache,
+                                    deadline=stage_deadline(stage))
+
+    def _call_claude_streaming(self, prompt: Prompt, max_tokens: int, on_delta: Callable[[str, str], None],
+                               stage: Optional[str] = None) -> str:
+        """Потоковый вызов Claude с прореженной отправкой прогресса (см. DeltaThrottle)"""
+        throttle = DeltaThrottle(on_delta)
+        for text in self.claude.stream(prompt, max_tokens=max_tokens, deadline=stage_deadline(stage)):
+            throttle.add(text)
+        return throttle.finish()
 
     def generate_scenario(self, domain_data: Dict[str, Any], product_data: Dict[str, Any], 
-                         client_profile: Dict[str, Any], user_input: str = "", language: str = "Portuguese") -> str:
-        """Генерация сценария для видео с учетом профиля клиента"""
+                         client_profile: Dict[str, Any], user_input: str = "", language: str = "Portuguese",
+                         on_delta: Optional[Callable[[str, str], None]] = None) -> str:
+        """
+        Генерация сценария для видео с учетом профиля клиента
+
+        Args:
+            on_delta: Если задан, ответ запрашивается потоком и периодически передается
+                как (новый фрагмент, накопленный текст)
+        """
+        scenario_prompt = self._build_scenario_prompt(domain_data, product_data, client_profile, user_input, language)
         
+        if on_delta:
+            return self._call_claude_streaming(scenario_prompt, max_tokens=3000, on_delta=on_delta, stage="scenario")
+        return self._call_claude(scenario_prompt, max_tokens=3000, stage="scenario")
+
+    def _build_scenario_prompt(self, domain_data: Dict[str, Any], product_data: Dict[str, Any],
+                               client_profile: Dict[str, Any], user_input: str, language: str) -> Prompt:
+        """Промпт Claude для генерации сценария"""
         # Форматируем описание домена
         domain_description = self._format_domain_description(domain_data)
         
         # Используем PromptBuilder с параметрами клиента
         prompt_builder = PromptBuilder(language)
-        scenario_prompt = prompt_builder.build_scenario_prompt_with_client(
+        return prompt_builder.build_scenario_prompt_with_client(
             domain_description, 
             product_data,
             client_profile,
             user_input
         )
-        
-        return self._call_claude(scenario_prompt, max_tokens=3000)
 
     def _format_domain_description(self, domain: Dict[str, Any]) -> str:
         """Форматирование описания домена"""
@@ -99,8 +154,30 @@ class VideoGenerationPipelineV2:
         """.strip()
         return description
 
-    def determine_timing(self, scenario: str, domain_data: Dict[str, Any], client_profile: Dict[str, Any], language: str = "Portuguese") -> tuple:
-        """Определение тайминга видео с вероятностным распределением"""
+    def determine_timing(self, scenario: str, domain_data: Dict[str, Any], client_profile: Dict[str, Any], language: str = "Portuguese",
+                         on_delta: Optional[Callable[[str, str], None]] = None) -> tuple:
+        """Определение тайминга видео с вероятностным распределением (on_delta — как в generate_scenario)"""
+        selected_duration = self._select_duration(scenario, domain_data)
+
+        # Используем PromptBuilder для тайминга
+        print(f"Создаем промпт для тайминга...")
+        timing_prompt = self._build_timing_prompt(scenario, domain_data, client_profile, selected_duration, language)
+        print(f"Отправляем запрос к Claude для тайминга...")
+        
+        if on_delta:
+            timing_response = self._call_claude_streaming(timing_prompt, max_tokens=2500, on_delta=on_delta, stage="timing")
+        else:
+            timing_response = self._call_claude(timing_prompt, max_tokens=2500, stage="timing")
+        print(f"Получен ответ для тайминга, длина: {len(timing_response)}")
+        
+        timing_breakdown = self._extract_timing_breakdown(timing_response)
+        framing_context = self._extract_framing_context(timing_response, client_profile)
+        print(f"Тайминг обработан успешно")
+        
+        return selected_duration, timing_breakdown, framing_context
+
+    def _select_duration(self, scenario: str, domain_data: Dict[str, Any]) -> int:
+        """Вероятностный выбор длительности видео с учетом сложности сценария"""
         base_probs = domain_data.get('length', [0.6, 0.3, 0.1])  # [8s, 16s, 24s]
 
         # Анализ сложности сценария
@@ -142,21 +219,17 @@ class VideoGenerationPipelineV2:
         # Выбор длительности
         duration_options = [8, 16, 24]
         selected_duration = random.choices(duration_options, weights=adjusted_probs, k=1)[0]
+        
+        return selected_duration
 
-        # Используем PromptBuilder для тайминга
+    def _build_timing_prompt(self, scenario: str, domain_data: Dict[str, Any], client_profile: Dict[str, Any],
+                             selected_duration: int, language: str) -> Prompt:
+        """Промпт Claude для определения тайминга"""
         prompt_builder = PromptBuilder(language)
-        print(f"Создаем промпт для тайминга...")
-        timing_prompt = prompt_builder.build_timing_prompt_with_client(scenario, domain_data, client_profile, selected_duration, language)
-        print(f"Отправляем запрос к Claude для тайминга...")
-        
-        timing_response = self._call_claude(timing_prompt, max_tokens=2500)
-        print(f"Получен ответ для тайминга, длина: {len(timing_response)}")
-        
-        timing_breakdown = self._extract_timing_breakdown(timing_response)
-        framing_context = self._extract_framing_context(timing_response, client_profile)
-        print(f"Тайминг обработан успешно")
-        
-        return selected_duration, timing_breakdown, framing_context
+        return prompt_builder.build_timing_prompt_with_client(
+            scenario, domain_data, client_profile, selected_duration, language,
+            domain_description=self._format_domain_description(domain_data)
+        )
 
     def _extract_timing_breakdown(self, timing_response: str) -> str:
         """Извлечение разбивки тайминга из ответа"""
@@ -191,22 +264,107 @@ class VideoGenerationPipelineV2:
                              framing_context: str, domain_data: Dict[str, Any], 
                              client_profile: Dict[str, Any], language: str = "Portuguese") -> List[Dict[str, Any]]:
         """Генерация промптов для VEO3 с учетом профиля клиента"""
+        veo3_prompt = self._build_veo3_prompt(scenario, timing_breakdown, domain_data, client_profile, language)
+        
+        veo3_response = self._call_claude(veo3_prompt, max_tokens=4000, stage="veo3_prompts")
+        prompts_list = self._parse_json_response(veo3_response)
+        
+        return self._validate_prompts(prompts_list)
+
+    def generate_veo3_prompts_and_segments(self, scenario: str, timing: int, timing_breakdown: str,
+                                           framing_context: str, domain_data: Dict[str, Any],
+                                           client_profile: Dict[str, Any], generation_id: str,
+                                           language: str = "Portuguese",
+                                           on_prompts_ready: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                                           on_segment_ready: Optional[Callable[[int, str, List[str]], None]] = None,
+                                           state: Optional[GenerationState] = None) -> tuple:
+        """
+        Потоковая генерация промптов VEO3 с запуском рендера по мере готовности
+
+        Ответ Claude разбирается инкрементально: каждый закрывшийся объект массива
+        валидируется и сразу отправляется в fal.ai, пока остальные промпты еще генерируются.
+
+        Args:
+            state: Checkpoint генерации — в него пишутся промпты и задачи fal.ai
+
+        Returns:
+            (промпты, пути скачанных сегментов)
+        """
+        veo3_prompt = self._build_veo3_prompt(scenario, timing_breakdown, domain_data, client_profile, language)
+        raw_dir = self._create_raw_dir(generation_id, state)
+        parser = JSONArrayStreamParser()
+        prompts: List[Dict[str, Any]] = []
+        if state is not None:
+            # Задачи прошлого запуска относятся к другому ответу Claude — номера сегментов не совпадут
+            state.update(segments={})
+        
+        with Veo3JobQueue(self.max_in_flight, on_submitted=self._segment_submitted(state),
+                          on_result=self._segment_downloader(raw_dir)) as queue:
+            try:
+                for text in self.claude.stream(veo3_prompt, max_tokens=4000, deadline=stage_deadline("veo3_prompts")):
+                    objects = parser.feed(text)
+                    if parser.failed:
+                        continue  # Номера следующих объектов сдвинуты — ждем полный ответ
+                    for prompt_dict in self._validate_prompts(objects):
+                        prompts.append(prompt_dict)
+                        queue.submit(len(prompts), build_fal_params(prompt_dict))
+                        print(f"Промпт сегмента {len(prompts)} получен, сегмент отправлен в VEO3")
+                
+                # Остальные промпты — из разбора полного ответа, если поток разобрать не удалось
+                complete = self._complete_streamed_prompts(parser, prompts)
+                for i, prompt_dict in enumerate(complete[len(prompts):], start=len(prompts) + 1):
+                    queue.submit(i, build_fal_params(prompt_dict))
+                prompts = complete
+            except BaseException:
+                # Промпты не получены целиком: уже отправленные сегменты не нужны, отменяем их до выхода
+                # (задачу, которую поток отправит после отмены, он отменит сам)
+                if prompts:
+                    print(f"Генерация промптов прервана, отменяем {len(prompts)} отправленных сегментов")
+                queue.cancel()
+                raise
+            
+            if state is not None:
+                state.update(prompts=prompts)
+            if on_prompts_ready:
+                on_prompts_ready(prompts)
+            
+            video_paths = self._collect_segments(queue, on_segment_ready, state)
+        
+        return prompts, video_paths
+
+    def _complete_streamed_prompts(self, parser: JSONArrayStreamParser,
+                                   submitted: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Все промпты ответа после потокового разбора
+
+        Если поток не дал промптов или в нем встретился битый объект, промпты берутся
+        из разбора полного ответа. Уже отправленные сегменты должны совпасть с его
+        началом, иначе их номера неверны: исключение отменяет очередь.
+        """
+        if submitted and not parser.failed:
+            return submitted
+        if parser.failed:
+            print(f"Объект промпта после сегмента {len(submitted)} не разобран потоком, разбираем полный ответ")
+        prompts = self._validate_prompts(self._parse_json_response(parser.buffer))
+        if prompts[:len(submitted)] != submitted:
+            raise Exception("Разбор полного ответа не совпадает с уже отправленными сегментами")
+        return prompts
+
+    def _build_veo3_prompt(self, scenario: str, timing_breakdown: str, domain_data: Dict[str, Any],
+                           client_profile: Dict[str, Any], language: str) -> Prompt:
+        """Промпт Claude для генерации VEO3 промптов"""
         camera_style = self._select_camera_style(domain_data, client_profile, scenario)
         
         # Используем PromptBuilder для VEO3 с профилем клиента
         prompt_builder = PromptBuilder(language)
-        veo3_prompt = prompt_builder.build_veo3_prompt_with_client(
+        return prompt_builder.build_veo3_prompt_with_client(
             scenario, 
             timing_breakdown, 
             camera_style,
             client_profile,
-            language
+            language,
+            domain_description=self._format_domain_description(domain_data)
         )
-        
-        veo3_response = self._call_claude(veo3_prompt, max_tokens=4000)
-        prompts_list = self._parse_json_response(veo3_response)
-        
-        return self._validate_prompts(prompts_list)
 
     def _select_camera_style(self, domain_data: Dict[str, Any], client_profile: Dict[str, Any], scenario: str) -> str:
         """Выбор стиля камеры на основе профиля клиента и домена"""
@@ -264,7 +422,7 @@ class VideoGenerationPipelineV2:
                 
             enhanced_prompt = {
                 "prompt": prompt_dict["prompt"],
-                "aspect_ratio": prompt_dict.get("aspect_ratio", "9:16"),
+                "aspect_ratio": prompt_dict.get("aspect_ratio", DEFAULT_ASPECT_RATIO),
                 "duration": prompt_dict.get("duration", "8s"),
                 "enhance_prompt": prompt_dict.get("enhance_prompt", True),
                 "generate_audio": prompt_dict.get("generate_audio", True)
@@ -274,55 +432,179 @@ class VideoGenerationPipelineV2:
             
         return validated_prompts
 
-    def generate_video_segments(self, prompts: List[Dict[str, Any]], generation_id: str) -> List[str]:
-        """Генерация видео сегментов через VEO3"""
-        video_urls = []
-        video_paths = []
+    def generate_video_segments(self, prompts: List[Dict[str, Any]], generation_id: str,
+                                on_segment_ready: Optional[Callable[[int, str, List[str]], None]] = None,
+                                state: Optional[GenerationState] = None) -> List[str]:
+        """
+        Генерация видео сегментов через VEO3
+
+        Каждый сегмент скачивается сразу после завершения его задачи в fal.ai,
+        пока остальные сегменты еще рендерятся.
+
+        Args:
+            on_segment_ready: Вызывается для каждого скачанного сегмента с его номером,
+                путем и списком уже готовых сегментов в порядке номеров
+            state: Checkpoint генерации — скачанные сегменты не запрашиваются повторно,
+                к задачам fal.ai прошлого запуска подключаемся по request_id
+        """
+        raw_dir = self._create_raw_dir(generation_id, state)
+        downloaded = state.downloaded_segments() if state is not None else {}
+        
+        with Veo3JobQueue(self.max_in_flight, on_submitted=self._segment_submitted(state),
+                          on_result=self._segment_downloader(raw_dir)) as queue:
+            print(f"Отправка {len(prompts) - len(downloaded)} сегментов в VEO3 (одновременно до {queue.max_in_flight})...")
+            for i, segment in enumerate(prompts, start=1):
+                if i not in downloaded:
+                    queue.submit(i, build_fal_params(segment), self._pending_request_id(state, i))
+
+            return self._collect_segments(queue, on_segment_ready, state, downloaded)
+
+    def regenerate_segments(self, prompts: List[Dict[str, Any]], previous_prompts: List[Dict[str, Any]],
+                            previous_paths: List[str], generation_id: str,
+                            on_segment_ready: Optional[Callable[[int, str, List[str]], None]] = None) -> List[str]:
+        """
+        Повторный рендер только измененных сегментов готовой генерации
+
+        Сегмент берется из прошлого результата как есть, если хэш его параметров fal.ai
+        не изменился и файл на месте; остальные заново отправляются в VEO3.
+
+        Returns:
+            Пути всех сегментов в порядке номеров
+        """
+        reused, changed = self._plan_segment_edit(prompts, previous_prompts, previous_paths)
+        if not changed:
+            return [reused[i] for i in sorted(reused)]
+        
+        raw_dir = self._create_raw_dir(generation_id)
+        with Veo3JobQueue(self.max_in_flight, on_result=self._segment_downloader(raw_dir)) as queue:
+            print(f"Отправка {len(changed)} измененных сегментов в VEO3...")
+            for i in changed:
+                queue.submit(i, build_fal_params(prompts[i - 1]))
+
+            return self._collect_segments(queue, on_segment_ready, ready_paths=reused)
+
+    def _plan_segment_edit(self, prompts: List[Dict[str, Any]], previous_prompts: List[Dict[str, Any]],
+                           previous_paths: List[str]) -> tuple:
+        """Разделение сегментов на переиспользуемые (номер → путь) и требующие рендера (номера)"""
+        reused: Dict[int, str] = {}
+        changed: List[int] = []
+        
+        for i, segment in enumerate(prompts, start=1):
+            unchanged = (
+                i <= len(previous_prompts) and i <= len(previous_paths)
+                and fal_params_hash(build_fal_params(segment)) == fal_params_hash(build_fal_params(previous_prompts[i - 1]))
+                and Path(previous_paths[i - 1]).exists()
+            )
+            if unchanged:
+                reused[i] = previous_paths[i - 1]
+            else:
+                changed.append(i)
+        
+        print(f"Сегментов без изменений: {len(reused)}, к повторному рендеру: {changed or 'нет'}")
+        return reused, changed
+
+    def _create_raw_dir(self, generation_id: str, state: Optional[GenerationState] = None) -> Path:
+        """Директория для сырых сегментов генерации (при возобновлении — директория прошлого запуска)"""
+        if state is not None and state.get("raw_dir") and Path(state.get("raw_dir")).is_dir():
+            return Path(state.get("raw_dir"))
         
-        # Создаем директории
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         batch_dir = f"generation_{generation_id}_{timestamp}"
         raw_dir = self.raw_video_dir / batch_dir
         raw_dir.mkdir(parents=True, exist_ok=True)
-        
-        for i, segment in enumerate(prompts, start=1):
-            print(f"Генерация сегмента {i}/{len(prompts)}...")
-            
-            fal_params = {
-                "prompt": segment["prompt"],
-                "aspect_ratio": segment.get("aspect_ratio", "16:9"),
-                "duration": segment.get("duration", "8s"),
-                "enhance_prompt": segment.get("enhance_prompt", True),
-                "generate_audio": segment.get("generate_audio", True)
-            }
+        if state is not None:
+            state.update(raw_dir=str(raw_dir))
+        return raw_dir
 
-            result = fal_client.subscribe(
-                "fal-ai/veo3",
-                arguments=fal_params,
-                with_logs=True
-            )
-            url = self._extract_video_url(result)
-            video_urls.append(url)
+    def _segment_submitted(self, state: Optional[GenerationState]) -> Optional[Callable[[int, str], None]]:
+        """Запись request_id поставленной задачи в checkpoint"""
+        if state is None:
+            return None
+        return lambda index, request_id: state.set_segment(index, request_id=request_id)
 
-            if i < len(prompts):
-                time.sleep(3)
+    def _pending_request_id(self, state: Optional[GenerationState], index: int) -> Optional[str]:
+        """request_id задачи прошлого запуска, результат которой еще не скачан"""
+        if state is None:
+            return None
+        return state.segment(index).get("request_id")
 
-        # Скачиваем видео
-        for i, url in enumerate(video_urls, start=1):
-            fname = f"segment_{i}.mp4"
-            fpath = raw_dir / fname
-            
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            
-            with open(fpath, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            video_paths.append(str(fpath))
+    def _segment_downloader(self, raw_dir: Path) -> Callable[[int, Any], tuple]:
+        """
+        Скачивание сегмента в пуле скачиваний очереди VEO3: сегменты качаются параллельно,
+        пока остальные еще рендерятся
+
+        Returns:
+            Функция (номер, результат fal.ai) -> (url, путь файла)
+        """
+        def download(index: int, fal_result: Any) -> tuple:
+            url = self._extract_video_url(fal_result)
+            fpath = raw_dir / f"segment_{index}.mp4"
+            self._download_segment(url, fpath, self._extract_video_size(fal_result))
+            self._post_download(str(fpath))
+            return url, fpath
+        return download
+
+    def _post_download(self, video_path: str):
+        """
+        Обработка скачанного сегмента в пуле скачиваний очереди: HLS и превью (постер, спрайт, анимация)
+
+        Ошибки не прерывают генерацию — сегмент остается доступен как обычный MP4.
+        """
+        self._package_hls(video_path)
+        if thumbnails_enabled():
+            try:
+                make_thumbnails(video_path)
+            except Exception as e:
+                print(f"Превью для {video_path} не созданы: {e}")
+
+    def _package_hls(self, video_path: str):
+        """HLS с фрагментами fMP4 рядом с видео (HLS_PACKAGING); ошибка упаковки не прерывает генерацию"""
+        if not hls_enabled():
+            return
+        try:
+            package_video(video_path)
+        except Exception as e:
+            print(f"HLS для {video_path} не создан: {e}")
+
+    def _collect_segments(self, queue: Veo3JobQueue,
+                          on_segment_ready: Optional[Callable[[int, str, List[str]], None]] = None,
+                          state: Optional[GenerationState] = None,
+                          ready_paths: Optional[Dict[int, str]] = None) -> List[str]:
+        """
+        Сегменты в порядке завершения скачивания, результат — в порядке номеров
+
+        Args:
+            ready_paths: Уже готовые сегменты (номер → путь), которые не отправлялись в очередь
+        """
+        ready_paths = dict(ready_paths or {})
+        for i in sorted(ready_paths):
+            print(f"Сегмент {i} уже готов: {ready_paths[i]}")
+            self._post_download(ready_paths[i])
+            if on_segment_ready:
+                on_segment_ready(i, ready_paths[i], [ready_paths[n] for n in sorted(ready_paths) if n <= i])
+        
+        for i, (url, fpath) in queue.as_completed():
+            ready_paths[i] = str(fpath)
             print(f"Сегмент {i} скачан: {fpath}")
+            if state is not None:
+                state.set_segment(i, url=url, path=str(fpath))
+
+            if on_segment_ready:
+                on_segment_ready(i, str(fpath), [ready_paths[n] for n in sorted(ready_paths)])
 
-        return video_paths
+        return [ready_paths[i] for i in sorted(ready_paths)]
+
+    def _download_segment(self, url: str, fpath: Path, expected_size: Optional[int] = None):
+        """Скачивание сегмента по URL (докачка и атомарная запись, см. MediaDownloader)"""
+        media_downloader.download(url, fpath, expected_size=expected_size)
+
+    def _extract_video_size(self, fal_result: Any) -> Optional[int]:
+        """Размер файла видео из результата fal.ai (video.file_size), если он указан"""
+        if isinstance(fal_result, dict) and isinstance(fal_result.get('video'), dict):
+            file_size = fal_result['video'].get('file_size')
+            if isinstance(file_size, int) and file_size > 0:
+                return file_size
+        return None
 
     def _extract_video_url(self, fal_result: Any) -> str:
         """Извлечение URL видео из результата fal.ai"""
@@ -357,22 +639,120 @@ class VideoGenerationPipelineV2:
             raise Exception(f"Video URL not found in fal.ai response: {fal_result}")
         return url
 
-    def concatenate_videos(self, video_paths: List[str], generation_id: str) -> str:
-        """Склейка видео сегментов"""
+    def concatenate_videos(self, video_paths: List[str], generation_id: str,
+                           prompts: Optional[List[Dict[str, Any]]] = None,
+                           client_profile: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Склейка видео сегментов
+
+        Если запрошены субтитры или логотип (или POST_PRODUCTION=always), склейка,
+        нормализация громкости, субтитры из диалогов prompts и логотип клиента
+        выполняются одним кодированием; иначе сегменты склеиваются без перекодирования.
+        С VIDEO_TRANSITION=crossfade стыки сглаживаются: без постобработки перекодируются
+        только группы кадров вокруг стыков. Версии из RENDITIONS (другие пропорции, превью)
+        создаются из одного декодирования и описываются manifest.json рядом с видео.
+        Готовое видео упаковывается в HLS с фрагментами fMP4 для воспроизведения без загрузки целиком.
+        """
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         batch_dir = f"generation_{generation_id}_{timestamp}"
         ready_dir = self.ready_video_dir / batch_dir
-        ready_dir.mkdir(parents=True, exist_ok=True)
+        
+        final_path = ready_dir / f"final_video_{timestamp}.mp4"
+        specs = rendition_specs()
+        
+        # Рендер в изолированном каталоге задачи (tmpfs, если хватает места), результаты —
+        # атомарно в ready_video; промежуточные файлы удаляются при любом исходе
+        expected_bytes = sum(Path(path).stat().st_size for path in video_paths) * (2 + len(specs))
+        with scratch_space.job(f"concat_{generation_id}", expected_bytes) as work_dir:
+            work_path = work_dir / final_path.name
+            print(f"Рабочий каталог склейки ({scratch_space.location(work_dir)}): {work_dir}")
+            
+            # Кодирования проходят через общий планировщик машины: слоты, потоки, приоритет
+            with encode_scheduler.slot(f"concat_{generation_id}"):
+                plans = self._render_master(video_paths, work_path, prompts, client_profile, specs)
+                
+                if specs and plans is None:
+                    video = probe_media(str(work_path))["video"] or {}
+                    plans = plan_renditions(specs, video.get("width") or 0, video.get("height") or 0)
+                    if plans:
+                        print(f"Создаем версии видео: {', '.join(plan['name'] for plan in plans)}...")
+                        try:
+                            render_renditions(str(work_path), plans)
+                        except Exception as e:
+                            print(f"Версии видео не созданы: {e}")
+            
+            # Manifest пишется в рабочем каталоге и переносится последним — после файлов, которые описывает
+            if specs:
+                write_manifest(str(work_path), plans, published_dir=ready_dir)
+            scratch_space.publish_all(work_dir, ready_dir, last=MANIFEST_NAME)
+        
+        # Remux без перекодирования — вне лимита кодирований
+        self._package_hls(str(final_path))
+        return str(final_path)
+
+    def _render_master(self, video_paths: List[str], final_path: Path,
+                       prompts: Optional[List[Dict[str, Any]]], client_profile: Optional[Dict[str, Any]],
+                       specs: List[Dict[str, str]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Мастер-файл финального видео
+
+        Returns:
+            Планы версий, если они закодированы тем же проходом (постобработка), иначе None
+        """
+        transition = transition_duration() if len(video_paths) > 1 else 0.0
+        post_production = needs_post_production(prompts, client_profile)
+        
+        if transition and not post_production and segments_compatible(video_paths):
+            try:
+                print(f"Склейка с crossfade {transition} с, перекодируем только стыки...")
+                stats = crossfade_smart(video_paths, str(final_path), transition)
+                print(f"Скопировано {stats['copied_seconds']:.1f} с видео, "
+                      f"перекодировано {stats['reencoded_seconds']:.1f} с")
+                return None
+            except Exception as e:
+                print(f"Умный рендер стыков не удался, рендерим целиком: {e}")
+        
+        if post_production or transition:
+            try:
+                print("Склейка с постобработкой в один проход...")
+                steps = render(video_paths, str(final_path), prompts, client_profile, transition, specs)
+                print(f"Постобработка: громкость {steps['loudnorm']['target_lufs']} LUFS, "
+                      f"субтитры {'вшиты' if steps['burned_subtitles'] else 'нет'}, "
+                      f"логотип {'есть' if steps['logo'] else 'нет'}, "
+                      f"crossfade {steps['transition']} с")
+                return steps["renditions"]
+            except Exception as e:
+                print(f"Постобработка не удалась, склеиваем без нее: {e}")
+        
+        # Сегменты VEO3 обычно совпадают по кодекам и разрешению — склеиваем без перекодирования
+        if segments_compatible(video_paths):
+            try:
+                print("Сегменты совместимы, склейка без перекодирования...")
+                concat_stream_copy(video_paths, str(final_path))
+                return None
+            except Exception as e:
+                print(f"Склейка без перекодирования не удалась, перекодируем: {e}")
+        else:
+            print("Параметры сегментов отличаются, склейка с перекодированием...")
+        
+        self._concatenate_reencode(video_paths, final_path)
+        return None
+
+    def _concatenate_reencode(self, video_paths: List[str], final_path: Path):
+        """Склейка сегментов с перекодированием через moviepy"""
+        from moviepy.editor import VideoFileClip, concatenate_videoclips
         
         clips = [VideoFileClip(path) for path in video_paths]
         final_video = concatenate_videoclips(clips, method="compose")
         
-        final_path = ready_dir / f"final_video_{timestamp}.mp4"
         final_video.write_videofile(
             str(final_path),
             codec="libx264",
             audio_codec="aac",
-            temp_audiofile="temp-audio.m4a",
+            preset=encode_scheduler.preset(),
+            threads=encode_scheduler.threads(),
+            # Временный звук рядом с результатом — в каталоге задачи, а не в общем текущем каталоге
+            temp_audiofile=str(final_path.with_name(f"{final_path.stem}_temp-audio.m4a")),
             remove_temp=True
         )
         
@@ -380,43 +760,33 @@ class VideoGenerationPipelineV2:
         for clip in clips:
             clip.close()
         final_video.close()
-        
-        return str(final_path)
 
-def main():
-    """Точка входа для CLI использования"""
-    if len(sys.argv) < 2:
-        print("Usage: python video_generator_v2.py <generation_data_json>")
-        sys.exit(1)
-    
-    generation_data = json.loads(sys.argv[1])
-    
-    # Получаем API ключи из переменных окружения
-    api_keys = {
+def load_api_keys() -> Dict[str, str]:
+    """API ключи из переменных окружения"""
+    return {
         'ANTHROPIC_API_KEY': os.getenv('ANTHROPIC_API_KEY'),
         'FAL_KEY': os.getenv('FAL_KEY'),
         'RESEMBLE_AI_KEY': os.getenv('RESEMBLE_AI_KEY')
     }
-    
-    # Создаем пайплайн
-    pipeline = VideoGenerationPipelineV2(api_keys)
-    
-    try:
-        # Извлекаем данные
-        domain_data = generation_data['domainData']
-        product_data = generation_data['productData']
-        client_profile = generation_data['clientProfile']
-        generation_id = generation_data['generationId']
-        user_input = generation_data['userInput']
-        language = generation_data['language']
-        
-        print(f"Генерация для клиента: {client_profile['companyName']}")
-        print(f"Домен: {domain_data.get('title', 'Unknown')}")
-        print(f"Продукт: {product_data.get('name', 'Unknown')}")
-        
-        # Генерация сценария
-        print("Генерация сценария...")
-        scenario = pipeline.generate_scenario(domain_data, product_data, client_profile, user_input, language)
+
+class GenerationReporter:
+    """Вывод промежуточных и итогового результатов генерации в stdout для Node.js API"""
+
+    def __init__(self):
+        self.scenario = ""
+        self.duration: Optional[int] = None
+        self.timing_breakdown = ""
+        self.prompts: List[Dict[str, Any]] = []
+
+    def scenario_delta(self, delta: str, text: str):
+        print("INTERMEDIATE_RESULT:", json.dumps({
+            "step": "scenario_stream",
+            "delta": delta,
+            "scenario": text
+        }, ensure_ascii=False), flush=True)
+
+    def scenario_ready(self, scenario: str):
+        self.scenario = scenario
         print(f"Сценарий создан: {len(scenario)} символов")
         
         # Выводим промежуточный результат для интерфейса
@@ -424,77 +794,324 @@ def main():
             "step": "scenario",
             "scenario": scenario
         }, ensure_ascii=False))
-        
-        # Определение тайминга
-        print("Определение тайминга...")
-        try:
-            duration, timing_breakdown, framing_context = pipeline.determine_timing(scenario, domain_data, client_profile, language)
-            print(f"Выбрана длительность: {duration}s")
-        except Exception as e:
-            print(f"Ошибка на этапе определения тайминга: {e}")
-            raise
+
+    def timing_delta(self, delta: str, text: str):
+        print("INTERMEDIATE_RESULT:", json.dumps({
+            "step": "timing_stream",
+            "delta": delta,
+            "timing_response": text
+        }, ensure_ascii=False), flush=True)
+
+    def timing_ready(self, duration: int, timing_breakdown: str):
+        self.duration = duration
+        self.timing_breakdown = timing_breakdown
+        print(f"Выбрана длительность: {duration}s")
         
         # Выводим промежуточный результат
         print("INTERMEDIATE_RESULT:", json.dumps({
             "step": "timing",
-            "scenario": scenario,
+            "scenario": self.scenario,
             "timing": duration,
             "timing_breakdown": timing_breakdown
         }, ensure_ascii=False))
-        
-        # Генерация промптов
-        print("Генерация промптов для VEO3...")
-        prompts = pipeline.generate_veo3_prompts(scenario, duration, timing_breakdown, framing_context, domain_data, client_profile, language)
+
+    def prompts_ready(self, prompts: List[Dict[str, Any]]):
+        self.prompts = prompts
         print(f"Создано {len(prompts)} промптов")
         
         # Выводим промежуточный результат
         print("INTERMEDIATE_RESULT:", json.dumps({
             "step": "prompts",
-            "scenario": scenario,
-            "timing": duration,
-            "timing_breakdown": timing_breakdown,
+            "scenario": self.scenario,
+            "timing": self.duration,
+            "timing_breakdown": self.timing_breakdown,
             "prompts": prompts
-        }, ensure_ascii=False))
-        
-        # Генерация видео
-        print("Генерация видео сегментов...")
-        video_paths = pipeline.generate_video_segments(prompts, generation_id)
-        
-        # Выводим промежуточный результат после генерации видео
+        }, ensure_ascii=False), flush=True)
+
+    def segment_ready(self, index: int, path: str, ready_paths: List[str]):
         print("INTERMEDIATE_RESULT:", json.dumps({
             "step": "videos",
-            "scenario": scenario,
-            "timing": duration,
-            "timing_breakdown": timing_breakdown,
-            "prompts": prompts,
-            "video_segments": video_paths
-        }, ensure_ascii=False))
-        
-        # Склейка видео
-        print("Склейка финального видео...")
-        final_video = pipeline.concatenate_videos(video_paths, generation_id)
-        
-        # Результат
+            "scenario": self.scenario,
+            "timing": self.duration,
+            "timing_breakdown": self.timing_breakdown,
+            "prompts": self.prompts,
+            "video_segments": ready_paths,
+            "hls_segments": [hls_playlist(path) for path in ready_paths],
+            "thumbnails": [read_thumbnails(path) for path in ready_paths],
+            "segments_total": len(self.prompts),
+            "completed": len(ready_paths) == len(self.prompts)
+        }, ensure_ascii=False), flush=True)
+
+    def completed(self, video_paths: List[str], final_video: str):
         result = {
             "status": "completed",
-            "scenario": scenario,
-            "timing": duration,
-            "timing_breakdown": timing_breakdown,
-            "prompts": prompts,
+            "scenario": self.scenario,
+            "timing": self.duration,
+            "timing_breakdown": self.timing_breakdown,
+            "prompts": self.prompts,
             "video_segments": video_paths,
-            "final_video": final_video
+            "final_video": final_video,
+            "hls_segments": [hls_playlist(path) for path in video_paths],
+            "thumbnails": [read_thumbnails(path) for path in video_paths],
+            "hls_final": hls_playlist(final_video)
         }
         
+        # Версии финального видео (пропорции, превью), если они создавались
+        manifest = read_manifest(final_video)
+        if manifest:
+            result["renditions"] = manifest
+        
         # Выводим результат для Node.js API
         print("GENERATION_RESULT:", json.dumps(result, ensure_ascii=False))
-        
-    except Exception as e:
+
+    def failed(self, error: Exception):
         error_result = {
             "status": "failed",
-            "error": str(e)
+            "error": str(error)
         }
         print("GENERATION_RESULT:", json.dumps(error_result, ensure_ascii=False))
+
+
+def open_generation_state(generation_data: Dict[str, Any], resume: bool = False) -> GenerationState:
+    """
+    Checkpoint генерации: при возобновлении — сохраненный, иначе новый
+
+    Возобновление включается флагом --resume или полем resume в данных генерации.
+    """
+    state = GenerationState(generation_data['generationId'])
+    if (resume or generation_data.get('resume')) and state.exists:
+        print(f"Возобновление генерации по checkpoint {state.path}")
+        state.update(status="running", error=None)
+    else:
+        state.reset(generation_data={k: v for k, v in generation_data.items() if k != 'resume'}, status="running")
+    return state
+
+
+async def _stage(result: Any) -> Any:
+    """Результат этапа: корутину асинхронного пайплайна дожидаемся, значение синхронного возвращаем как есть"""
+    if hasattr(result, "__await__"):
+        return await result
+    return result
+
+
+def drive(stages: Coroutine[Any, Any, Any]) -> Any:
+    """
+    Выполнение сценария этапов с синхронным пайплайном без event loop
+
+    Методы синхронного пайплайна возвращают готовые значения, поэтому корутина
+    сценария не приостанавливается и завершается за один шаг.
+    """
+    try:
+        stages.send(None)
+    except StopIteration as done:
+        return done.value
+    stages.close()
+    raise Exception("Сценарий этапов ожидает корутину — используйте асинхронный пайплайн")
+
+
+async def generation_stages(pipeline: VideoGenerationPipelineV2, generation_data: Dict[str, Any],
+                            resume: bool = False) -> int:
+    """
+    Полный цикл генерации с выводом промежуточных результатов в stdout
+
+    Сценарий общий для синхронного пайплайна (run_generation) и асинхронного
+    (run_generation_async): методы этапов вызываются через _stage.
+    Результат каждого этапа сохраняется в checkpoint (GenerationState);
+    с resume=True завершенные этапы не выполняются повторно.
+
+    Returns:
+        Код завершения: 0 при успехе, 1 при ошибке
+    """
+    report = GenerationReporter()
+    state = None
+    try:
+        # Извлекаем данные
+        domain_data = generation_data['domainData']
+        product_data = generation_data['productData']
+        client_profile = generation_data['clientProfile']
+        generation_id = generation_data['generationId']
+        user_input = generation_data['userInput']
+        language = generation_data['language']
+        state = open_generation_state(generation_data, resume)
+        
+        print(f"Генерация для клиента: {client_profile['companyName']}")
+        print(f"Домен: {domain_data.get('title', 'Unknown')}")
+        print(f"Продукт: {product_data.get('name', 'Unknown')}")
+        
+        # Генерация сценария
+        scenario = state.get('scenario')
+        if scenario:
+            print("Сценарий взят из checkpoint")
+        else:
+            print("Генерация сценария...")
+            scenario = await _stage(pipeline.generate_scenario(domain_data, product_data, client_profile, user_input,
+                                                                language, on_delta=report.scenario_delta))
+            state.update(scenario=scenario)
+        report.scenario_ready(scenario)
+        
+        # Определение тайминга
+        if state.get('duration') is not None:
+            print("Тайминг взят из checkpoint")
+            duration, timing_breakdown, framing_context = (
+                state.get('duration'), state.get('timing_breakdown'), state.get('framing_context')
+            )
+        else:
+            print("Определение тайминга...")
+            try:
+                duration, timing_breakdown, framing_context = await _stage(pipeline.determine_timing(
+                    scenario, domain_data, client_profile, language, on_delta=report.timing_delta
+                ))
+            except Exception as e:
+                print(f"Ошибка на этапе определения тайминга: {e}")
+                raise
+            state.update(duration=duration, timing_breakdown=timing_breakdown, framing_context=framing_context)
+        report.timing_ready(duration, timing_breakdown)
+        
+        # Генерация промптов и видео
+        if state.get('prompts'):
+            print("Промпты VEO3 взяты из checkpoint")
+            report.prompts_ready(state.get('prompts'))
+            
+            print("Генерация видео сегментов...")
+            video_paths = await _stage(pipeline.generate_video_segments(
+                report.prompts, generation_id, on_segment_ready=report.segment_ready, state=state
+            ))
+        elif pipeline.stream_prompts:
+            print("Потоковая генерация промптов VEO3 с запуском рендера сегментов...")
+            _, video_paths = await _stage(pipeline.generate_veo3_prompts_and_segments(
+                scenario, duration, timing_breakdown, framing_context, domain_data, client_profile,
+                generation_id, language, on_prompts_ready=report.prompts_ready, on_segment_ready=report.segment_ready,
+                state=state
+            ))
+        else:
+            print("Генерация промптов для VEO3...")
+            prompts = await _stage(pipeline.generate_veo3_prompts(
+                scenario, duration, timing_breakdown, framing_context, domain_data, client_profile, language
+            ))
+            state.update(prompts=prompts)
+            report.prompts_ready(prompts)
+            
+            print("Генерация видео сегментов...")
+            video_paths = await _stage(pipeline.generate_video_segments(
+                report.prompts, generation_id, on_segment_ready=report.segment_ready, state=state
+            ))
+        
+        # Склейка видео
+        final_video = state.get('final_video')
+        if final_video and Path(final_video).exists():
+            print("Финальное видео взято из checkpoint")
+        else:
+            print("Склейка финального видео...")
+            final_video = await _stage(pipeline.concatenate_videos(video_paths, generation_id, report.prompts,
+                                                                client_profile))
+            state.update(final_video=final_video)
+        
+        state.update(status="completed")
+        report.completed(video_paths, final_video)
+        
+    except Exception as e:
+        if state is not None:
+            state.update(status="failed", error=str(e))
+        report.failed(e)
+        return 1
+
+    return 0
+
+
+def run_generation(pipeline: VideoGenerationPipelineV2, generation_data: Dict[str, Any], resume: bool = False) -> int:
+    """Полный цикл генерации синхронным пайплайном (см. generation_stages)"""
+    return drive(generation_stages(pipeline, generation_data, resume))
+
+
+async def edit_stages(pipeline: VideoGenerationPipelineV2, edit_data: Dict[str, Any]) -> int:
+    """
+    Редактирование готовой генерации: рендер только измененных промптов и повторная склейка
+
+    Сценарий общий для run_edit и run_edit_async (см. generation_stages).
+
+    edit_data: generationId и prompts (отредактированный список), а также прошлые
+    previousPrompts и videoSegments; если их нет — берутся из checkpoint генерации.
+    scenario, timing и timing_breakdown нужны только для вывода результата.
+
+    Returns:
+        Код завершения: 0 при успехе, 1 при ошибке
+    """
+    report = GenerationReporter()
+    try:
+        generation_id = edit_data['generationId']
+        state = GenerationState(generation_id)
+        previous_prompts = edit_data.get('previousPrompts') or state.get('prompts') or []
+        previous_paths = edit_data.get('videoSegments') or [
+            path for _, path in sorted(state.downloaded_segments().items())
+        ]
+        if not previous_prompts or not previous_paths:
+            raise Exception(f"Нет прошлых промптов или сегментов генерации {generation_id}")
+        
+        report.scenario = edit_data.get('scenario', state.get('scenario', ""))
+        report.duration = edit_data.get('timing', state.get('duration'))
+        report.timing_breakdown = edit_data.get('timing_breakdown', state.get('timing_breakdown', ""))
+        report.prompts_ready(pipeline._validate_prompts(edit_data['prompts']))
+        
+        print("Рендер измененных сегментов...")
+        video_paths = await _stage(pipeline.regenerate_segments(report.prompts, previous_prompts, previous_paths,
+                                                                generation_id, on_segment_ready=report.segment_ready))
+        
+        print("Склейка финального видео...")
+        client_profile = edit_data.get('clientProfile') or (state.get('generation_data') or {}).get('clientProfile')
+        final_video = await _stage(pipeline.concatenate_videos(video_paths, generation_id, report.prompts,
+                                                               client_profile))
+        
+        if state.exists:
+            state.update(prompts=report.prompts, final_video=final_video,
+                         segments={str(i): {"path": path} for i, path in enumerate(video_paths, start=1)})
+        report.completed(video_paths, final_video)
+        
+    except Exception as e:
+        report.failed(e)
+        return 1
+
+    return 0
+
+
+def run_edit(pipeline: VideoGenerationPipelineV2, edit_data: Dict[str, Any]) -> int:
+    """Редактирование готовой генерации синхронным пайплайном (см. edit_stages)"""
+    return drive(edit_stages(pipeline, edit_data))
+
+
+def load_resume_data(generation_id: str) -> Dict[str, Any]:
+    """Данные генерации из checkpoint для запуска с --resume <generationId>"""
+    generation_data = GenerationState(generation_id).get('generation_data')
+    if not generation_data:
+        print(f"Checkpoint генерации {generation_id} не найден")
         sys.exit(1)
+    return generation_data
+
+def main():
+    """Точка входа для CLI использования"""
+    if len(sys.argv) < 2:
+        print("Usage: python video_generator_v2.py <generation_data_json> [--resume]")
+        print("       python video_generator_v2.py --resume <generationId>")
+        print("       python video_generator_v2.py --edit <edit_data_json>")
+        print("       python video_generator_v2.py --worker [--socket PATH] [--max-jobs N]")
+        sys.exit(1)
+    
+    if sys.argv[1] == "--worker":
+        from generation_worker import run_worker
+        run_worker(sys.argv[2:])
+        return
+    
+    if sys.argv[1] == "--edit" and len(sys.argv) > 2:
+        sys.exit(run_edit(VideoGenerationPipelineV2(load_api_keys()), json.loads(sys.argv[2])))
+    
+    if sys.argv[1] == "--resume" and len(sys.argv) > 2:
+        generation_data, resume = load_resume_data(sys.argv[2]), True
+    else:
+        generation_data, resume = json.loads(sys.argv[1]), "--resume" in sys.argv[2:]
+    
+    # Создаем пайплайн
+    pipeline = VideoGenerationPipelineV2(load_api_keys())
+    
+    sys.exit(run_generation(pipeline, generation_data, resume))
 
 if __name__ == "__main__":
     main()
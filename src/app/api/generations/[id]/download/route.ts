@@ -1,7 +1,7 @@
 import { NextRequest, NextResponse } from 'next/server'
 import { db } from '@/lib/db'
 import fs from 'fs'
-import path from 'path'
+import { streamFile } from '@/lib/media-stream'
 
 export async function GET(
   request: NextRequest,
@@ -41,25 +41,9 @@ export async function GET(
       )
     }
 
-    // Читаем файл как поток
-    const fileStats = fs.statSync(videoPath)
-    const fileStream = fs.createReadStream(videoPath)
-    
-    // Конвертируем поток в буфер
-    const chunks: Buffer[] = []
-    for await (const chunk of fileStream) {
-      chunks.push(chunk)
-    }
-    const fileBuffer = Buffer.concat(chunks)
-    
-    // Возвращаем файл с правильными заголовками
-    return new Response(fileBuffer, {
-      headers: {
-        'Content-Type': 'video/mp4',
-        'Content-Disposition': `attachment; filename="${fileName}"`,
-        'Content-Length': fileStats.size.toString(),
-        'Accept-Ranges': 'bytes',
-      },
+    // Отдаем файл потоком с поддержкой Range (плеер страницы генерации тоже использует этот путь)
+    return streamFile(request, videoPath, {
+      'Content-Disposition': `attachment; filename="${fileName}"`,
     })
 
   } catch (error) {
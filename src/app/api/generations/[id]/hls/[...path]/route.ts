@@ -0,0 +1,77 @@
+import { NextRequest, NextResponse } from 'next/server'
+import { db } from '@/lib/db'
+import fs from 'fs'
+import path from 'path'
+import { streamFile, hlsDirFor, isSafeHlsFile, buildStreamPlaylist } from '@/lib/media-stream'
+
+// HLS генерации:
+//   stream.m3u8               — плейлист готовых сегментов, дополняется по мере скачивания
+//   segment/<index>/<file>    — плейлист и фрагменты fMP4 сегмента
+//   final/<file>              — плейлист и фрагменты финального видео
+export async function GET(
+  request: NextRequest,
+  { params }: { params: Promise<{ id: string; path: string[] }> }
+) {
+  try {
+    const { id, path: parts } = await params
+
+    const generation = await db.generation.findUnique({
+      where: { id }
+    })
+
+    if (!generation) {
+      return NextResponse.json(
+        { error: 'Генерация не найдена' },
+        { status: 404 }
+      )
+    }
+
+    const videoFiles: string[] = generation.videoFiles ? JSON.parse(generation.videoFiles) : []
+    const baseUrl = `/api/generations/${generation.id}/hls`
+
+    if (parts.length === 1 && parts[0] === 'stream.m3u8') {
+      const complete = generation.status !== 'GENERATING_VIDEOS' && videoFiles.length > 0
+      return new Response(buildStreamPlaylist(videoFiles, baseUrl, complete), {
+        headers: {
+          'Content-Type': 'application/vnd.apple.mpegurl',
+          'Cache-Control': complete ? 'public, max-age=60' : 'no-cache',
+        },
+      })
+    }
+
+    let videoPath: string | null = null
+    let fileName = ''
+    if (parts.length === 3 && parts[0] === 'segment') {
+      const index = parseInt(parts[1])
+      videoPath = Number.isInteger(index) && index >= 0 && index < videoFiles.length ? videoFiles[index] : null
+      fileName = parts[2]
+    } else if (parts.length === 2 && parts[0] === 'final') {
+      videoPath = generation.finalVideo
+      fileName = parts[1]
+    }
+
+    if (!videoPath || !isSafeHlsFile(fileName)) {
+      return NextResponse.json(
+        { error: 'Неверный путь HLS' },
+        { status: 400 }
+      )
+    }
+
+    const filePath = path.join(hlsDirFor(videoPath), fileName)
+    if (!fs.existsSync(filePath)) {
+      return NextResponse.json(
+        { error: 'Файл HLS не найден' },
+        { status: 404 }
+      )
+    }
+
+    return streamFile(request, filePath)
+
+  } catch (error) {
+    console.error('Error serving HLS:', error)
+    return NextResponse.json(
+      { error: 'Ошибка получения HLS' },
+      { status: 500 }
+    )
+  }
+}
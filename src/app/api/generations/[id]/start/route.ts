@@ -1,5 +1,6 @@
 import { NextRequest, NextResponse } from 'next/server'
 import { db } from '@/lib/db'
+import { isWorkerModeEnabled, runInWorker, WorkerJob } from '@/lib/python-worker'
 import { spawn } from 'child_process'
 import path from 'path'
 
@@ -95,19 +96,22 @@ export async function POST(
       language: generation.language || 'Portuguese'
     }
     
-    const pythonProcess = spawn('/Users/andreykhalov/anaconda3/bin/python3', [
-      pythonScript,
-      JSON.stringify(generationData)
-    ], {
-      env: {
-        ...process.env,
-        PYTHONPATH: path.join(process.cwd(), 'python')
-      },
-      cwd: process.cwd()
-    })
+    // В режиме воркера генерация выполняется в общем долгоживущем Python процессе
+    const pythonProcess: WorkerJob = isWorkerModeEnabled()
+      ? runInWorker(generationData)
+      : spawn('/Users/andreykhalov/anaconda3/bin/python3', [
+          pythonScript,
+          JSON.stringify(generationData)
+        ], {
+          env: {
+            ...process.env,
+            PYTHONPATH: path.join(process.cwd(), 'python')
+          },
+          cwd: process.cwd()
+        })
 
     // Обработка вывода Python скрипта
-    pythonProcess.stdout.on('data', async (data) => {
+    pythonProcess.stdout.on('data', async (data: Buffer) => {
       const output = data.toString()
       console.log('Python output:', output)
       
@@ -115,13 +119,27 @@ export async function POST(
       if (output.includes('INTERMEDIATE_RESULT:')) {
         try {
           const lines = output.split('\n')
-          const resultLine = lines.find(line => line.includes('INTERMEDIATE_RESULT:'))
+          // Промежуточные результаты накопительные — берем самый свежий в пачке
+          const resultLine = [...lines].reverse().find(line => line.includes('INTERMEDIATE_RESULT:'))
           if (!resultLine) return
           
           const resultJson = resultLine.split('INTERMEDIATE_RESULT:')[1].trim()
           console.log('Raw intermediate result JSON:', resultJson)
           const result = JSON.parse(resultJson)
           
+          // Потоковые фрагменты: сохраняем растущий сценарий, пока этап не завершен,
+          // чтобы запоздавшее обновление не перезаписало итоговый текст
+          if (result.step === 'scenario_stream') {
+            await db.generation.updateMany({
+              where: { id, status: 'GENERATING_SCENARIO' },
+              data: { scenario: result.scenario }
+            })
+            return
+          }
+          if (result.step === 'timing_stream') {
+            return
+          }
+          
           // Обновляем генерацию с промежуточными результатами
           const updateData: any = {}
           
@@ -147,7 +165,10 @@ export async function POST(
             updateData.timing = result.timing ? result.timing.toString() : null
             updateData.prompts = result.prompts ? JSON.stringify(result.prompts) : null
             updateData.videoFiles = result.video_segments ? JSON.stringify(result.video_segments) : null
-            updateData.status = 'CONCATENATING'
+            // Сегменты приходят по мере скачивания, склейка начинается после последнего
+            if (result.completed !== false) {
+              updateData.status = 'CONCATENATING'
+            }
             console.log('Video segments saved, count:', result.video_segments ? result.video_segments.length : 0)
           }
           
@@ -213,7 +234,7 @@ export async function POST(
       }
     })
 
-    pythonProcess.stderr.on('data', async (data) => {
+    pythonProcess.stderr.on('data', async (data: Buffer) => {
       const error = data.toString()
       console.error('Python error:', error)
       
@@ -230,7 +251,7 @@ export async function POST(
       }
     })
 
-    pythonProcess.on('close', async (code) => {
+    pythonProcess.on('close', async (code: number | null) => {
       console.log(`Python process finished with code: ${code}`)
       
       // Получаем текущее состояние генерации
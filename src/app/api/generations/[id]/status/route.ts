@@ -42,6 +42,7 @@ export async function GET(
       hasEnhancedVideo: !!generation.enhancedVideo,
       updatedAt: generation.updatedAt,
       // Подсчеты для UI
+      scenarioLength: generation.scenario ? generation.scenario.length : 0,
       promptsCount: generation.prompts ? JSON.parse(generation.prompts).length : 0,
       videoSegmentsCount: generation.videoFiles ? JSON.parse(generation.videoFiles).length : 0
     })
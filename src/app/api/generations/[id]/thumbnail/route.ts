@@ -0,0 +1,91 @@
+import { NextRequest, NextResponse } from 'next/server'
+import { db } from '@/lib/db'
+import fs from 'fs'
+import path from 'path'
+
+const KINDS = ['poster', 'sprite', 'preview'] as const
+type ThumbnailKind = typeof KINDS[number]
+
+const CONTENT_TYPES: Record<string, string> = {
+  '.jpg': 'image/jpeg',
+  '.webp': 'image/webp',
+  '.gif': 'image/gif',
+}
+
+// Превью сегмента (см. python/thumbnails.py): segment_0.mp4 → segment_0_thumbs/thumbnails.json
+export async function GET(
+  request: NextRequest,
+  { params }: { params: Promise<{ id: string }> }
+) {
+  try {
+    const { id } = await params
+    const { searchParams } = new URL(request.url)
+    const index = parseInt(searchParams.get('index') || '0')
+    const kind = (searchParams.get('kind') || 'poster') as ThumbnailKind
+
+    if (!KINDS.includes(kind)) {
+      return NextResponse.json(
+        { error: 'Неверный тип превью' },
+        { status: 400 }
+      )
+    }
+
+    const generation = await db.generation.findUnique({
+      where: { id }
+    })
+
+    if (!generation || !generation.videoFiles) {
+      return NextResponse.json(
+        { error: 'Видео сегменты не найдены' },
+        { status: 404 }
+      )
+    }
+
+    const videoFiles: string[] = JSON.parse(generation.videoFiles)
+    if (index < 0 || index >= videoFiles.length) {
+      return NextResponse.json(
+        { error: 'Неверный индекс сегмента' },
+        { status: 400 }
+      )
+    }
+
+    const parsed = path.parse(videoFiles[index])
+    const metadataPath = path.join(parsed.dir, `${parsed.name}_thumbs`, 'thumbnails.json')
+    if (!fs.existsSync(metadataPath)) {
+      return NextResponse.json(
+        { error: 'Превью не найдены' },
+        { status: 404 }
+      )
+    }
+
+    const metadata = JSON.parse(fs.readFileSync(metadataPath, 'utf-8'))
+    const filePath: string | undefined = metadata[kind]
+    if (!filePath || !fs.existsSync(filePath)) {
+      return NextResponse.json(
+        { error: 'Файл превью не найден' },
+        { status: 404 }
+      )
+    }
+
+    const headers: Record<string, string> = {
+      'Content-Type': CONTENT_TYPES[path.extname(filePath).toLowerCase()] || 'application/octet-stream',
+      'Cache-Control': 'public, max-age=3600',
+    }
+    // Раскладка спрайта для просмотра наведением
+    if (kind === 'sprite') {
+      headers['X-Sprite-Columns'] = String(metadata.sprite_columns)
+      headers['X-Sprite-Rows'] = String(metadata.sprite_rows)
+      headers['X-Sprite-Frame-Size'] = `${metadata.frame_width}x${metadata.frame_height}`
+    }
+
+    // Превью весят килобайты — отдаем целиком
+    return new Response(fs.readFileSync(filePath), { headers })
+
+  } catch (error) {
+    console.error('Error serving thumbnail:', error)
+    return NextResponse.json(
+      { error: 'Ошибка получения превью' },
+      { status: 500 }
+    )
+  }
+}
@@ -1,6 +1,7 @@
 import { NextRequest, NextResponse } from 'next/server'
 import { db } from '@/lib/db'
 import fs from 'fs'
+import { streamFile } from '@/lib/media-stream'
 
 export async function GET(
   request: NextRequest,
@@ -41,31 +42,16 @@ export async function GET(
       )
     }
 
-    // Читаем файл как поток
-    const fileStats = fs.statSync(videoPath)
-    const fileStream = fs.createReadStream(videoPath)
-    
-    // Конвертируем поток в буфер
-    const chunks: Buffer[] = []
-    for await (const chunk of fileStream) {
-      chunks.push(chunk)
-    }
-    const fileBuffer = Buffer.concat(chunks)
-    
     const fileName = `generation_${generation.id}_segment_${index + 1}.mp4`
-    
-    // Возвращаем файл
-    const headers: Record<string, string> = {
-      'Content-Type': 'video/mp4',
-      'Content-Length': fileStats.size.toString(),
-      'Accept-Ranges': 'bytes',
-    }
+    const headers: Record<string, string> = {}
 
     if (download) {
       headers['Content-Disposition'] = `attachment; filename="${fileName}"`
     }
 
-    return new Response(fileBuffer, { headers })
+    // Отдаем файл потоком с поддержкой Range: плеер начинает воспроизведение
+    // и перематывает, не дожидаясь всего файла
+    return streamFile(request, videoPath, headers)
 
   } catch (error) {
     console.error('Error serving video segment:', error)
@@ -179,6 +179,7 @@ export default function GenerationDetailsPage() {
           if (!generation || 
               statusData.status !== generation.status ||
               statusData.hasScenario !== !!generation.scenario ||
+              statusData.scenarioLength !== (generation.scenario?.length || 0) ||
               statusData.hasPrompts !== !!generation.prompts ||
               statusData.hasVideoFiles !== !!generation.videoFiles ||
               statusData.hasFinalVideo !== !!generation.finalVideo) {
@@ -387,18 +388,18 @@ export default function GenerationDetailsPage() {
                   {/* Этап 1: Сценарий */}
                   <div className="flex items-center space-x-3">
                     <div className={`w-8 h-8 rounded-full flex items-center justify-center ${
-                      generation.scenario ? 'bg-green-100 text-green-600' : 
                       ['GENERATING_SCENARIO'].includes(generation.status) ? 'bg-yellow-100 text-yellow-600' :
+                      generation.scenario ? 'bg-green-100 text-green-600' : 
                       'bg-gray-100 text-gray-400'
                     }`}>
-                      {generation.scenario ? '✓' : 
-                       ['GENERATING_SCENARIO'].includes(generation.status) ? '⏳' : '1'}
+                      {['GENERATING_SCENARIO'].includes(generation.status) ? '⏳' :
+                       generation.scenario ? '✓' : '1'}
                     </div>
                     <div className="flex-1">
                       <h4 className="font-medium">Генерация сценария</h4>
                       <p className="text-sm text-gray-600">
-                        {generation.scenario ? 'Сценарий готов' :
-                         ['GENERATING_SCENARIO'].includes(generation.status) ? 'Создаем сценарий...' :
+                        {['GENERATING_SCENARIO'].includes(generation.status) ? 'Создаем сценарий...' :
+                         generation.scenario ? 'Сценарий готов' :
                          'Ожидание'}
                       </p>
                     </div>
@@ -545,9 +546,12 @@ export default function GenerationDetailsPage() {
                             </div>
                             <video 
                               controls 
+                              preload="none"
+                              poster={`/api/generations/${generation.id}/thumbnail?index=${index}&kind=poster`}
                               className="w-full rounded border"
                               style={{ maxHeight: '200px' }}
                             >
+                              <source src={`/api/generations/${generation.id}/hls/segment/${index}/index.m3u8`} type="application/vnd.apple.mpegurl" />
                               <source src={`/api/generations/${generation.id}/video-segment?index=${index}`} type="video/mp4" />
                               Ваш браузер не поддерживает видео.
                             </video>
@@ -584,6 +588,7 @@ export default function GenerationDetailsPage() {
                           className="w-full rounded border"
                           style={{ maxHeight: '400px' }}
                         >
+                          <source src={`/api/generations/${generation.id}/hls/final/index.m3u8`} type="application/vnd.apple.mpegurl" />
                           <source src={`/api/generations/${generation.id}/download?type=final`} type="video/mp4" />
                           Ваш браузер не поддерживает видео.
                         </video>
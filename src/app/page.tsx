@@ -25,6 +25,7 @@ interface Generation {
     }
   }>
   finalVideo?: string
+  videoFiles?: string
   prompts?: string
 }
 
@@ -173,6 +174,18 @@ export default function HomePage() {
                     </CardDescription>
                   </CardHeader>
                   <CardContent>
+                    {generation.videoFiles && (
+                      // Постер первого сегмента: килобайты вместо загрузки видео; при наведении — анимация
+                      <img
+                        src={`/api/generations/${generation.id}/thumbnail?index=0&kind=poster`}
+                        alt={generation.name}
+                        loading="lazy"
+                        className="w-full h-40 object-contain bg-gray-100 rounded mb-3"
+                        onMouseEnter={(e) => { e.currentTarget.src = `/api/generations/${generation.id}/thumbnail?index=0&kind=preview` }}
+                        onMouseLeave={(e) => { e.currentTarget.src = `/api/generations/${generation.id}/thumbnail?index=0&kind=poster` }}
+                        onError={(e) => { e.currentTarget.style.display = 'none' }}
+                      />
+                    )}
                     <div className="space-y-2 text-sm">
                       <div className="flex justify-between">
                         <span className="text-gray-600">Создано:</span>
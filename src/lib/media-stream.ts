@@ -0,0 +1,108 @@
+import fs from 'fs'
+import path from 'path'
+import { Readable } from 'stream'
+
+const CONTENT_TYPES: Record<string, string> = {
+  '.mp4': 'video/mp4',
+  '.m4s': 'video/iso.segment',
+  '.m3u8': 'application/vnd.apple.mpegurl',
+}
+
+export function contentTypeFor(filePath: string) {
+  return CONTENT_TYPES[path.extname(filePath).toLowerCase()] || 'application/octet-stream'
+}
+
+// Отдаем файл потоком с поддержкой Range (206), не загружая его в память целиком
+export function streamFile(
+  request: Request,
+  filePath: string,
+  extraHeaders: Record<string, string> = {}
+): Response {
+  const size = fs.statSync(filePath).size
+  const headers: Record<string, string> = {
+    'Content-Type': contentTypeFor(filePath),
+    'Accept-Ranges': 'bytes',
+    ...extraHeaders,
+  }
+
+  const range = request.headers.get('range')
+  const match = range ? /^bytes=(\d*)-(\d*)$/.exec(range.trim()) : null
+  if (range && (!match || (!match[1] && !match[2]))) {
+    return new Response(null, { status: 416, headers: { 'Content-Range': `bytes */${size}` } })
+  }
+
+  let start = 0
+  let end = size - 1
+  if (match) {
+    if (match[1]) {
+      start = parseInt(match[1])
+      end = match[2] ? Math.min(parseInt(match[2]), size - 1) : size - 1
+    } else {
+      // bytes=-N — последние N байт
+      start = Math.max(0, size - parseInt(match[2]))
+    }
+    if (start > end || start >= size) {
+      return new Response(null, { status: 416, headers: { 'Content-Range': `bytes */${size}` } })
+    }
+    headers['Content-Range'] = `bytes ${start}-${end}/${size}`
+  }
+
+  headers['Content-Length'] = (size === 0 ? 0 : end - start + 1).toString()
+  const body = size === 0
+    ? null
+    : Readable.toWeb(fs.createReadStream(filePath, { start, end })) as ReadableStream
+  return new Response(body, { status: match ? 206 : 200, headers })
+}
+
+// Каталог HLS рядом с видео: segment_0.mp4 → segment_0_hls (см. python/hls_packager.py)
+export function hlsDirFor(videoPath: string) {
+  const parsed = path.parse(videoPath)
+  return path.join(parsed.dir, `${parsed.name}_hls`)
+}
+
+// Имя файла внутри каталога HLS без переходов по каталогам
+export function isSafeHlsFile(name: string) {
+  return /^[\w.-]+$/.test(name) && !name.startsWith('.')
+}
+
+// Плейлист EVENT из готовых подряд сегментов: растет по мере скачивания,
+// #EXT-X-ENDLIST — когда все сегменты на месте
+export function buildStreamPlaylist(videoFiles: string[], baseUrl: string, complete: boolean) {
+  const entries: string[] = []
+  let targetDuration = 1
+  let packaged = 0
+
+  for (let index = 0; index < videoFiles.length; index++) {
+    const playlistPath = path.join(hlsDirFor(videoFiles[index]), 'index.m3u8')
+    if (!fs.existsSync(playlistPath)) break
+
+    if (packaged > 0) entries.push('#EXT-X-DISCONTINUITY')
+    for (const line of fs.readFileSync(playlistPath, 'utf-8').split('\n')) {
+      const trimmed = line.trim()
+      if (trimmed.startsWith('#EXT-X-TARGETDURATION:')) {
+        targetDuration = Math.max(targetDuration, parseInt(trimmed.split(':')[1]) || 1)
+      } else if (trimmed.startsWith('#EXT-X-MAP:')) {
+        entries.push(trimmed.replace(/URI="([^"]+)"/, (_, uri) => `URI="${baseUrl}/segment/${index}/${uri}"`))
+      } else if (trimmed.startsWith('#EXTINF:')) {
+        entries.push(trimmed)
+      } else if (trimmed && !trimmed.startsWith('#')) {
+        entries.push(`${baseUrl}/segment/${index}/${trimmed}`)
+      }
+    }
+    packaged++
+  }
+
+  const lines = [
+    '#EXTM3U',
+    '#EXT-X-VERSION:7',
+    `#EXT-X-TARGETDURATION:${targetDuration}`,
+    '#EXT-X-MEDIA-SEQUENCE:0',
+    '#EXT-X-PLAYLIST-TYPE:EVENT',
+    '#EXT-X-INDEPENDENT-SEGMENTS',
+    ...entries,
+  ]
+  if (complete && packaged === videoFiles.length && packaged > 0) {
+    lines.push('#EXT-X-ENDLIST')
+  }
+  return lines.join('\n') + '\n'
+}
@@ -0,0 +1,104 @@
+import { spawn, ChildProcess } from 'child_process'
+import { EventEmitter } from 'events'
+import path from 'path'
+import readline from 'readline'
+
+// Задача в долгоживущем Python воркере (python/generation_worker.py).
+// Повторяет интерфейс ChildProcess, который используют обработчики маршрутов:
+// stdout/stderr с событием 'data' и событие 'close' с кодом завершения.
+export interface WorkerJob extends EventEmitter {
+  stdout: EventEmitter
+  stderr: EventEmitter
+}
+
+interface WorkerEvent {
+  generationId?: string
+  type: 'output' | 'exit' | 'error'
+  data?: string
+  code?: number
+  error?: string
+}
+
+const globalForWorker = globalThis as unknown as {
+  pythonWorker: ChildProcess | undefined
+  pythonWorkerJobs: Map<string, WorkerJob> | undefined
+}
+
+const jobs = globalForWorker.pythonWorkerJobs ?? new Map<string, WorkerJob>()
+globalForWorker.pythonWorkerJobs = jobs
+
+export function isWorkerModeEnabled() {
+  return process.env.PYTHON_WORKER_MODE === 'true'
+}
+
+// Асинхронный воркер ведет все генерации на одном event loop вместо пула потоков
+function getWorkerScript() {
+  return process.env.PYTHON_WORKER_ASYNC === 'true' ? 'video_generator_async.py' : 'video_generator_v2.py'
+}
+
+function getWorker(): ChildProcess {
+  if (globalForWorker.pythonWorker && globalForWorker.pythonWorker.exitCode === null) {
+    return globalForWorker.pythonWorker
+  }
+
+  const pythonScript = path.join(process.cwd(), 'python', getWorkerScript())
+  const worker = spawn(process.env.PYTHON_ENV_PATH || 'python3', [pythonScript, '--worker'], {
+    env: {
+      ...process.env,
+      PYTHONPATH: path.join(process.cwd(), 'python')
+    },
+    cwd: process.cwd()
+  })
+
+  readline.createInterface({ input: worker.stdout! }).on('line', (line) => {
+    let event: WorkerEvent
+    try {
+      event = JSON.parse(line)
+    } catch {
+      console.log('Python worker output:', line)
+      return
+    }
+
+    if (event.type === 'error' || !event.generationId) {
+      console.error('Python worker error:', event.error)
+      return
+    }
+
+    const job = jobs.get(event.generationId)
+    if (!job) return
+
+    if (event.type === 'output') {
+      job.stdout.emit('data', Buffer.from(`${event.data}\n`))
+    } else if (event.type === 'exit') {
+      jobs.delete(event.generationId)
+      job.emit('close', event.code)
+    }
+  })
+
+  // Логи воркера вне задач (например, потоков VEO3) не привязаны к генерации
+  worker.stderr!.on('data', (data) => {
+    console.error('Python worker:', data.toString())
+  })
+
+  worker.on('close', (code) => {
+    console.error(`Python worker finished with code: ${code}`)
+    globalForWorker.pythonWorker = undefined
+    for (const [generationId, job] of jobs) {
+      jobs.delete(generationId)
+      job.emit('close', code ?? 1)
+    }
+  })
+
+  globalForWorker.pythonWorker = worker
+  return worker
+}
+
+export function runInWorker(generationData: { generationId: string }): WorkerJob {
+  const job = new EventEmitter() as WorkerJob
+  job.stdout = new EventEmitter()
+  job.stderr = new EventEmitter()
+  jobs.set(generationData.generationId, job)
+
+  getWorker().stdin!.write(JSON.stringify(generationData) + '\n')
+  return job
+}
@@ -34,7 +34,8 @@ export function middleware(request: NextRequest) {
     return NextResponse.next()
   }
 
-  if (request.nextUrl.pathname.includes('/video-segment') || request.nextUrl.pathname.includes('/download')) {
+  if (request.nextUrl.pathname.includes('/video-segment') || request.nextUrl.pathname.includes('/download') ||
+      request.nextUrl.pathname.includes('/hls/') || request.nextUrl.pathname.endsWith('/thumbnail')) {
     console.log('Video file access, allowing')
     return NextResponse.next()
   }